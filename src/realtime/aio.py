@@ -0,0 +1,461 @@
+"""
+ * Copyright (C) Caleb Marshall - All Rights Reserved
+ * Written by Caleb Marshall <anythingtechpro@gmail.com>, August 17th, 2017
+ * Licensing information can found in 'LICENSE', which is part of this source code package.
+"""
+
+import asyncio
+import collections
+import socket
+import struct
+
+from otp_server.realtime import types
+from otp_server.realtime.notifier import notify
+
+# frames are sent with the same two byte length prefix panda uses...
+FRAME_LENGTH = struct.Struct('<H')
+FRAME_MAX_LENGTH = 0xffff
+
+INT8 = struct.Struct('<b')
+INT16 = struct.Struct('<h')
+INT32 = struct.Struct('<i')
+INT64 = struct.Struct('<q')
+UINT8 = struct.Struct('<B')
+UINT16 = struct.Struct('<H')
+UINT32 = struct.Struct('<I')
+UINT64 = struct.Struct('<Q')
+FLOAT32 = struct.Struct('<f')
+FLOAT64 = struct.Struct('<d')
+
+# headers are packed in one call rather than a call per
+# field, each layout is compiled once up front...
+MESSAGE_HEADER = struct.Struct('<BQQH')
+CONTROL_HEADER = struct.Struct('<BQHQ')
+
+_multi_headers = {}
+
+
+def get_multi_header(channel_count):
+    header = _multi_headers.get(channel_count)
+    if header is None:
+        header = _multi_headers[channel_count] = struct.Struct('<B%dQQH' % channel_count)
+
+    return header
+
+
+class Datagram(object):
+    """
+    A pure python datagram buffer, with the same methods as
+    panda's C++ Datagram that the realtime components use...
+    """
+
+    def __init__(self, data=None):
+        if data is None:
+            self._data = bytearray()
+        elif hasattr(data, 'get_message'):
+            self._data = bytearray(data.get_message())
+        else:
+            self._data = bytearray(data)
+
+    def add_bool(self, value):
+        self._data += UINT8.pack(1 if value else 0)
+
+    def add_int8(self, value):
+        self._data += INT8.pack(value)
+
+    def add_int16(self, value):
+        self._data += INT16.pack(value)
+
+    def add_int32(self, value):
+        self._data += INT32.pack(value)
+
+    def add_int64(self, value):
+        self._data += INT64.pack(value)
+
+    def add_uint8(self, value):
+        self._data += UINT8.pack(value)
+
+    def add_uint16(self, value):
+        self._data += UINT16.pack(value)
+
+    def add_uint32(self, value):
+        self._data += UINT32.pack(value)
+
+    def add_uint64(self, value):
+        self._data += UINT64.pack(value)
+
+    def add_float32(self, value):
+        self._data += FLOAT32.pack(value)
+
+    def add_float64(self, value):
+        self._data += FLOAT64.pack(value)
+
+    def add_string(self, value):
+        if isinstance(value, str):
+            value = value.encode('utf-8')
+
+        self._data += UINT16.pack(len(value))
+        self._data += value
+
+    def add_blob(self, value):
+        self._data += UINT16.pack(len(value))
+        self._data += value
+
+    def pad_bytes(self, size):
+        self._data += bytes(size)
+
+    def append_data(self, data):
+        self._data += data
+
+    def get_message(self):
+        return bytes(self._data)
+
+    def get_length(self):
+        return len(self._data)
+
+    def clear(self):
+        self._data = bytearray()
+
+    def get_data(self):
+        """
+        Returns our buffer itself, without copying it
+        """
+
+        return self._data
+
+    addBool = add_bool
+    addInt8 = add_int8
+    addInt16 = add_int16
+    addInt32 = add_int32
+    addInt64 = add_int64
+    addUint8 = add_uint8
+    addUint16 = add_uint16
+    addUint32 = add_uint32
+    addUint64 = add_uint64
+    addString = add_string
+    addBlob = add_blob
+    appendData = append_data
+    getMessage = get_message
+    getLength = get_length
+
+
+class DatagramIterator(object):
+    """
+    A pure python iterator over a datagram, with the same methods as
+    panda's C++ DatagramIterator that the realtime components use...
+    """
+
+    def __init__(self, datagram=None, offset=0):
+        self._datagram = datagram
+        self._data = datagram.get_data() if datagram is not None else b''
+        self._offset = offset
+
+    def __unpack(self, layout):
+        offset = self._offset
+        if offset + layout.size > len(self._data):
+            raise AssertionError('Failed to read %d bytes at offset %d, past the end of the datagram!' % (
+                layout.size, offset))
+
+        self._offset = offset + layout.size
+        return layout.unpack_from(self._data, offset)[0]
+
+    def get_bool(self):
+        return self.__unpack(UINT8) != 0
+
+    def get_int8(self):
+        return self.__unpack(INT8)
+
+    def get_int16(self):
+        return self.__unpack(INT16)
+
+    def get_int32(self):
+        return self.__unpack(INT32)
+
+    def get_int64(self):
+        return self.__unpack(INT64)
+
+    def get_uint8(self):
+        return self.__unpack(UINT8)
+
+    def get_uint16(self):
+        return self.__unpack(UINT16)
+
+    def get_uint32(self):
+        return self.__unpack(UINT32)
+
+    def get_uint64(self):
+        return self.__unpack(UINT64)
+
+    def get_float32(self):
+        return self.__unpack(FLOAT32)
+
+    def get_float64(self):
+        return self.__unpack(FLOAT64)
+
+    def get_fixed_bytes(self, size):
+        offset = self._offset
+        if offset + size > len(self._data):
+            raise AssertionError('Failed to read %d bytes at offset %d, past the end of the datagram!' % (
+                size, offset))
+
+        self._offset = offset + size
+        return bytes(self._data[offset:offset + size])
+
+    def get_blob(self):
+        return self.get_fixed_bytes(self.get_uint16())
+
+    def get_string(self):
+        return self.get_blob().decode('utf-8')
+
+    def skip_bytes(self, size):
+        self.get_fixed_bytes(size)
+
+    def get_remaining_bytes(self):
+        return self.get_fixed_bytes(self.get_remaining_size())
+
+    def get_remaining_size(self):
+        return len(self._data) - self._offset
+
+    def get_current_index(self):
+        return self._offset
+
+    def get_datagram(self):
+        return self._datagram
+
+    getBool = get_bool
+    getInt8 = get_int8
+    getInt16 = get_int16
+    getInt32 = get_int32
+    getInt64 = get_int64
+    getUint8 = get_uint8
+    getUint16 = get_uint16
+    getUint32 = get_uint32
+    getUint64 = get_uint64
+    getString = get_string
+    getBlob = get_blob
+    skipBytes = skip_bytes
+    getRemainingBytes = get_remaining_bytes
+    getRemainingSize = get_remaining_size
+    getCurrentIndex = get_current_index
+    getDatagram = get_datagram
+
+
+class NetworkDatagram(Datagram):
+    """
+    The pure python counterpart of io's NetworkDatagram, with the
+    same methods for talking to the OTP's internal cluster participants...
+    """
+
+    def add_header(self, channel, sender, message_type):
+        self._data += MESSAGE_HEADER.pack(1, channel, sender, message_type)
+
+    def add_multi_header(self, channels, sender, message_type):
+        self._data += get_multi_header(len(channels)).pack(len(channels), *channels, sender, message_type)
+
+    def add_control_header(self, channel, message_type):
+        self._data += CONTROL_HEADER.pack(1, types.CONTROL_MESSAGE, message_type, channel)
+
+
+class NetworkDatagramIterator(DatagramIterator):
+    """
+    The pure python counterpart of io's NetworkDatagramIterator...
+    """
+
+    def get_network_datagram(self):
+        return self._datagram
+
+
+class EventLoopWakeup(object):
+    """
+    Lets the event loop sleep while idle until a connection has
+    something for us, rather than for the whole idle timeout...
+    """
+
+    def __init__(self, loop):
+        self._loop = loop
+        self._future = None
+
+    def wake(self):
+        if self._future is not None and not self._future.done():
+            self._future.set_result(None)
+
+    async def wait(self, timeout):
+        self._future = self._loop.create_future()
+        handle = self._loop.call_later(timeout, self.wake)
+        try:
+            await self._future
+        finally:
+            handle.cancel()
+            self._future = None
+
+
+event_loop = None
+event_loop_wakeup = None
+
+
+def install_event_loop():
+    """
+    Installs the asyncio event loop every connection is run on
+    """
+
+    global event_loop, event_loop_wakeup
+    if event_loop is None:
+        event_loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(event_loop)
+        event_loop_wakeup = EventLoopWakeup(event_loop)
+
+    return event_loop
+
+
+def wake_event_loop():
+    if event_loop_wakeup is not None:
+        event_loop_wakeup.wake()
+
+
+async def step_task_manager(components, get_idle_timeout):
+    # run a frame, then unless any component still has work waiting, let the event
+    # loop wait for the connections until one of them has something for us or
+    # the idle timeout, which is up to the next deadline, has passed...
+    while task_mgr.running:
+        task_mgr.step()
+        if any(component.has_pending_work() for component in components):
+            await asyncio.sleep(0)
+            continue
+
+        timeout = get_idle_timeout()
+        if timeout > 0:
+            await event_loop_wakeup.wait(timeout)
+
+
+def run_event_loop(components, get_idle_timeout):
+    loop = install_event_loop()
+    task_mgr.running = True
+    try:
+        loop.run_until_complete(step_task_manager(components, get_idle_timeout))
+    except KeyboardInterrupt:
+        task_mgr.stop()
+
+
+class NetworkProtocol(asyncio.Protocol):
+    """
+    A TCP connection carrying length prefixed datagrams, as read and written by asyncio.
+    Stands in for panda's Connection, so it is what handlers are keyed by...
+    """
+
+    notify = notify.new_category('NetworkProtocol')
+
+    def __init__(self, connected_callback, datagram_callback, lost_callback):
+        self._connected_callback = connected_callback
+        self._datagram_callback = datagram_callback
+        self._lost_callback = lost_callback
+
+        self._transport = None
+        self._address = ''
+        self._buffer = bytearray()
+
+        # anything sent before the connection is made is
+        # written out as soon as it has been...
+        self._pending = []
+        self._paused = False
+        self._closed = False
+
+    @property
+    def address(self):
+        return self._address
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def connection_made(self, transport):
+        self._transport = transport
+
+        peer_name = transport.get_extra_info('peername')
+        if peer_name:
+            self._address = '%s:%d' % (peer_name[0], peer_name[1])
+
+        connection_socket = transport.get_extra_info('socket')
+        if connection_socket is not None and connection_socket.family in (socket.AF_INET, socket.AF_INET6):
+            connection_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        if self._closed:
+            transport.close()
+            return
+
+        if self._pending:
+            transport.writelines(self._pending)
+            self._pending = []
+
+        if self._connected_callback is not None:
+            self._connected_callback(self)
+
+        wake_event_loop()
+
+    def data_received(self, data):
+        buffer = self._buffer
+        buffer += data
+
+        offset = 0
+        size = len(buffer)
+        while size - offset >= FRAME_LENGTH.size:
+            length, = FRAME_LENGTH.unpack_from(buffer, offset)
+            end = offset + FRAME_LENGTH.size + length
+            if end > size:
+                break
+
+            self._datagram_callback(self, NetworkDatagram(buffer[offset + FRAME_LENGTH.size:end]))
+            offset = end
+
+        if offset:
+            del buffer[:offset]
+
+        wake_event_loop()
+
+    def connection_lost(self, exception):
+        self._closed = True
+        self._lost_callback(self)
+        wake_event_loop()
+
+    def pause_writing(self):
+        self._paused = True
+
+    def resume_writing(self):
+        self._paused = False
+
+    def send(self, datagram, deferrable=False):
+        """
+        Writes a datagram to the connection, returns True if it was accepted for writing. A deferrable
+        datagram isn't accepted while the connection is backed up, the sender holds onto it instead...
+        """
+
+        if self._closed or (deferrable and self._paused):
+            return False
+
+        data = datagram.get_message()
+        if len(data) > FRAME_MAX_LENGTH:
+            self.notify.warning('Cannot send datagram of %d bytes to: %s, it is too large!' % (
+                len(data), self._address))
+
+            return False
+
+        frame = FRAME_LENGTH.pack(len(data)) + data
+        if self._transport is None:
+            self._pending.append(frame)
+        else:
+            self._transport.write(frame)
+
+        return True
+
+    def set_collect_tcp(self, collect_tcp):
+        pass
+
+    def set_collect_tcp_interval(self, interval):
+        pass
+
+    def flush(self):
+        return not self._paused
+
+    def close(self):
+        self._closed = True
+        if self._transport is not None:
+            self._transport.close()
@@ -0,0 +1,217 @@
+"""
+ * Copyright (C) Caleb Marshall - All Rights Reserved
+ * Written by Caleb Marshall <anythingtechpro@gmail.com>, August 17th, 2017
+ * Licensing information can found in 'LICENSE', which is part of this source code package.
+"""
+
+import argparse
+import os
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+# frames are sent with panda's default two byte length prefix...
+FRAME_LENGTH = struct.Struct('<H')
+CONTROL_HEADER = struct.Struct('<BQHQ')
+MESSAGE_HEADER = struct.Struct('<BQQH')
+
+CONTROL_MESSAGE = 4001
+CONTROL_SET_CHANNEL = 2001
+
+BENCHMARK_MESSAGE_TYPE = 2004
+
+# the modes a message director can be spawned in, each
+# given as the config it's started with...
+MODES = {
+    'polled': ['net-want-threads #f', 'net-event-loop task-manager'],
+    'selector': ['net-want-threads #f', 'net-event-loop selector'],
+    'threaded': ['net-want-threads #t', 'net-event-loop selector'],
+    'asyncio': ['net-want-threads #f', 'net-backend asyncio'],
+}
+
+
+class Receiver(threading.Thread):
+    """
+    Subscribes to a channel and counts the messages routed to it
+    """
+
+    def __init__(self, address, port, channel):
+        threading.Thread.__init__(self)
+
+        self.daemon = True
+        self.received = 0
+        self.finished = None
+
+        self._expected = 0
+        self._socket = socket.create_connection((address, port))
+        self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        data = CONTROL_HEADER.pack(1, CONTROL_MESSAGE, CONTROL_SET_CHANNEL, channel)
+        self._socket.sendall(FRAME_LENGTH.pack(len(data)) + data)
+
+    def expect(self, count):
+        self._expected = count
+
+    def run(self):
+        buffer = b''
+        while self.received < self._expected:
+            data = self._socket.recv(65536)
+            if not data:
+                break
+
+            buffer += data
+            offset = 0
+            while len(buffer) - offset >= FRAME_LENGTH.size:
+                length, = FRAME_LENGTH.unpack_from(buffer, offset)
+                if len(buffer) - offset - FRAME_LENGTH.size < length:
+                    break
+
+                offset += FRAME_LENGTH.size + length
+                self.received += 1
+
+            buffer = buffer[offset:]
+
+        self.finished = time.monotonic()
+
+    def close(self):
+        self._socket.close()
+
+
+def send_messages(address, port, channels, rounds, payload):
+    connection = socket.create_connection((address, port))
+
+    # each round sends one message to every channel, the rounds are sent in
+    # batches so that the benchmark measures routing rather than our send calls...
+    round_data = b''
+    for channel in channels:
+        data = MESSAGE_HEADER.pack(1, channel, 1, BENCHMARK_MESSAGE_TYPE) + payload
+        round_data += FRAME_LENGTH.pack(len(data)) + data
+
+    sent = 0
+    while sent < rounds:
+        batch_rounds = min(64, rounds - sent)
+        connection.sendall(round_data * batch_rounds)
+        sent += batch_rounds
+
+    return connection
+
+
+def run_benchmark(address, port, senders, receivers, messages, payload_size, timeout):
+    channels = [5000000 + index for index in range(receivers)]
+    receiver_threads = [Receiver(address, port, channel) for channel in channels]
+
+    # give the message director a moment to register the channels
+    # before any messages are sent to them...
+    time.sleep(0.5)
+
+    rounds = max(1, messages // receivers)
+    for receiver in receiver_threads:
+        receiver.expect(senders * rounds)
+        receiver.start()
+
+    payload = b'\x00' * payload_size
+    start = time.monotonic()
+    results = []
+
+    def sender(index):
+        results.append(send_messages(address, port, channels, rounds, payload))
+
+    sender_threads = [threading.Thread(target=sender, args=(index,)) for index in range(senders)]
+    for thread in sender_threads:
+        thread.start()
+
+    for thread in sender_threads:
+        thread.join()
+
+    for receiver in receiver_threads:
+        receiver.join(timeout)
+
+    received = sum(receiver.received for receiver in receiver_threads)
+    finished = max(receiver.finished or time.monotonic() for receiver in receiver_threads)
+    elapsed = finished - start
+
+    for connection in results:
+        connection.close()
+
+    for receiver in receiver_threads:
+        receiver.close()
+
+    return received, senders * rounds * receivers, elapsed
+
+
+def wait_for_port(address, port, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection((address, port), 1.0).close()
+            return True
+        except socket.error:
+            time.sleep(0.1)
+
+    return False
+
+
+def spawn_message_director(mode, port, prc_filenames):
+    prc_file = tempfile.NamedTemporaryFile('w', suffix='.prc', delete=False)
+    prc_file.write('\n'.join([
+        'want-client-agent #f',
+        'want-state-server #f',
+        'want-database-server #f',
+        'messagedirector-port %d' % port,
+    ] + MODES[mode]) + '\n')
+
+    prc_file.close()
+
+    package = 'otp_server.realtime'
+    if __spec__ is not None and __spec__.parent:
+        package = __spec__.parent
+
+    command = [sys.executable, '-m', '%s.main' % package] + prc_filenames + [prc_file.name]
+    return subprocess.Popen(command), prc_file.name
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measures message director routing throughput.')
+    parser.add_argument('--address', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=6666)
+    parser.add_argument('--senders', type=int, default=4)
+    parser.add_argument('--receivers', type=int, default=4)
+    parser.add_argument('--messages', type=int, default=100000, help='messages sent by each sender')
+    parser.add_argument('--payload', type=int, default=32, help='payload size of each message in bytes')
+    parser.add_argument('--timeout', type=float, default=60.0)
+    parser.add_argument('--spawn', nargs='*', choices=sorted(MODES),
+                        help='spawn a message director in each of these modes in turn, '
+                             'rather than benchmarking one already running')
+    parser.add_argument('--prc', nargs='*', default=[], help='additional config files for spawned message directors')
+    arguments = parser.parse_args()
+
+    modes = arguments.spawn or [None]
+    for mode in modes:
+        process = prc_filename = None
+        if mode is not None:
+            process, prc_filename = spawn_message_director(mode, arguments.port, arguments.prc)
+            if not wait_for_port(arguments.address, arguments.port, 30.0):
+                print('%s: message director did not start listening' % mode)
+                process.terminate()
+                continue
+
+        try:
+            received, sent, elapsed = run_benchmark(arguments.address, arguments.port, arguments.senders,
+                                                    arguments.receivers, arguments.messages, arguments.payload,
+                                                    arguments.timeout)
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait()
+                os.remove(prc_filename)
+
+        print('%s: routed %d of %d messages in %.3f seconds, %.0f messages per second' % (
+            mode or 'running', received, sent, elapsed, received / elapsed if elapsed else 0.0))
+
+
+if __name__ == '__main__':
+    main()
@@ -587,6 +587,7 @@ class LoadFriendsListFSM(ClientOperation):
 
     def enterLoadFriends(self):
         our_channel = self.client.get_puppet_connection_channel(self._avatar_id)
+        online_friend_channels = []
         for friend_id in self._friends_list:
             friend_channel = self.client.get_puppet_connection_channel(friend_id)
             friend_online = self.manager.network.get_handler_from_channel(friend_channel) is not None
@@ -602,14 +603,8 @@ class LoadFriendsListFSM(ClientOperation):
             datagram.add_uint32(friend_id)
             self.client.handle_send_datagram(datagram)
 
-            # tell them that we are online if they are online...
             if friend_online:
-                datagram = io.NetworkDatagram()
-                datagram.add_header(friend_channel, our_channel,
-                                    types.CLIENTAGENT_FRIEND_ONLINE)
-
-                datagram.add_uint32(self._avatar_id)
-                self.manager.network.handle_send_connection_datagram(datagram)
+                online_friend_channels.append(friend_channel)
 
             # setup a post remove that will tell all of our friends
             # that we are offline when we disconnect...
@@ -626,6 +621,16 @@ class LoadFriendsListFSM(ClientOperation):
             datagram.append_data(post_remove.get_message())
             self.manager.network.handle_send_connection_datagram(datagram)
 
+        # tell all of our friends that are online that we are online,
+        # with a single message addressed to each of their channels...
+        for index in range(0, len(online_friend_channels), types.MAX_MESSAGE_CHANNELS):
+            datagram = io.NetworkDatagram()
+            datagram.add_multi_header(online_friend_channels[index:index + types.MAX_MESSAGE_CHANNELS],
+                                      our_channel, types.CLIENTAGENT_FRIEND_ONLINE)
+
+            datagram.add_uint32(self._avatar_id)
+            self.manager.network.handle_send_connection_datagram(datagram)
+
         datagram = io.NetworkDatagram()
         datagram.add_uint16(types.CLIENT_GET_FRIEND_LIST_RESP)
         datagram.add_uint8(0)
@@ -2318,7 +2323,8 @@ class Client(io.NetworkHandler):
 
             return
 
-        datagram = io.NetworkDatagram()
+        datagram_pool = io.get_datagram_pool()
+        datagram = datagram_pool.acquire()
         datagram.add_header(do_id, self.channel,
                             types.STATESERVER_OBJECT_UPDATE_FIELD)
 
@@ -2327,6 +2333,7 @@ class Client(io.NetworkHandler):
 
         datagram.append_data(di.get_remaining_bytes())
         self.network.handle_send_connection_datagram(datagram)
+        datagram_pool.release(datagram)
 
     def handle_object_update_field_resp(self, sender, di):
         do_id = di.get_uint32()
@@ -2365,7 +2372,10 @@ class ClientAgent(io.NetworkListener, io.NetworkConnector):
         min_channels = config.GetInt('clientagent-min-channels', 1000000000)
         max_channels = config.GetInt('clientagent-max-channels', 1009999999)
 
-        self._channel_allocator = UniqueIdAllocator(min_channels, max_channels - 1)
+        self._min_channels = min_channels
+        self._max_channels = max_channels - 1
+
+        self._channel_allocator = UniqueIdAllocator(self._min_channels, self._max_channels)
         self._server_version = config.GetString('clientagent-version', 'dev')
         self._server_hash_val = int(config.GetString('clientagent-hash-val', '0'))
 
@@ -2392,10 +2402,17 @@ class ClientAgent(io.NetworkListener, io.NetworkConnector):
     def account_manager(self):
         return self._account_manager
 
+    def has_pending_work(self):
+        return io.NetworkListener.has_pending_work(self) or io.NetworkConnector.has_pending_work(self)
+
     def setup(self):
         io.NetworkListener.setup(self)
         io.NetworkConnector.setup(self)
 
+        # subscribe to our whole client channel block at once, rather than
+        # registering each client's channel as it is allocated...
+        self.register_for_range(self._min_channels, self._max_channels)
+
     def handle_datagram(self, channel, sender, message_type, di):
         handler = self.get_handler_from_channel(channel)
         if not handler:
@@ -437,6 +437,8 @@ class DatabaseCreateFSM(DatabaseOperationFSM):
             self.notify.error('Failed to create object: %d context: %d, unknown dclass!' % (self._dc_id, self._context))
             return
 
+        class_info = self.network.dc_loader.class_info_by_number[self._dc_id]
+
         self._do_id = self.network.backend.allocator.allocate()
         file_object = self.network.backend.add_file('%d' % self._do_id)
         file_object.save()
@@ -450,7 +452,7 @@ class DatabaseCreateFSM(DatabaseOperationFSM):
 
         for _ in range(self._field_count):
             field_id = field_packer.raw_unpack_uint32()
-            field = dc_class.get_field_by_index(field_id)
+            field = class_info.get_field(field_id)
             if not field:
                 self.notify.error(
                     'Failed to unpack field: %d dclass: %s, invalid field!' % (field_id, dc_class.get_name()))
@@ -464,17 +466,15 @@ class DatabaseCreateFSM(DatabaseOperationFSM):
 
             fields[field.get_name()] = field_args
 
-        for field_index in range(dc_class.get_num_inherited_fields()):
-            field_packer = DCPacker()
-            field = dc_class.get_inherited_field(field_index)
-
-            if not field or field.get_name() in fields:
+        # the db fields with a default value are known
+        # ahead of time, along with those defaults...
+        for field_id, field_name, default_value in class_info.db_defaults:
+            if field_name in fields:
                 continue
 
-            if not field.is_db() or not field.has_default_value():
-                continue
-
-            field_packer.set_unpack_data(field.get_default_value())
+            field_packer = DCPacker()
+            field = class_info.get_field(field_id)
+            field_packer.set_unpack_data(default_value)
             field_packer.begin_unpack(field)
             field_args = field.unpack_args(field_packer)
             field_packer.end_unpack()
@@ -807,7 +807,7 @@ class DatabaseSetFieldDepercatedFSM(DatabaseOperationFSM):
         field_packer = DCPacker()
         field_packer.set_unpack_data(self._field_data)
         field_id = field_packer.raw_unpack_uint16()
-        field = dc_class.get_field_by_index(field_id)
+        field = self.network.dc_loader.class_info_by_name[dc_name].get_field(field_id)
         if not field:
             self.notify.error('Failed to unpack field: %d dclass: %s, invalid field!' % (field_id, dc_class.get_name()))
 
@@ -852,6 +852,9 @@ class DatabaseServer(io.NetworkConnector):
     def operation_manager(self):
         return self._operation_manager
 
+    def has_pending_work(self):
+        return io.NetworkConnector.has_pending_work(self) or len(self._operation_manager.operations) > 0
+
     def setup(self):
         self._backend.setup()
         self._operation_manager.setup()
@@ -6,7 +6,11 @@
 import inspect
 import os
 import collections
-import threading
+import select
+import selectors
+import socket
+import struct
+import time
 
 from direct.showbase.VFSImporter import vfs
 from panda3d.core import *
@@ -14,7 +18,8 @@ from panda3d.direct import *
 
 from direct.distributed.PyDatagramIterator import PyDatagramIterator
 
-from otp_server.realtime import types
+from otp_server.realtime import aio, types
+from otp_server.realtime.aio import CONTROL_HEADER, MESSAGE_HEADER, get_multi_header
 from otp_server.realtime.notifier import notify
 
 
@@ -32,16 +37,13 @@ class NetworkDatagram(NetDatagram):
     """
 
     def add_header(self, channel, sender, message_type):
-        self.add_uint8(1)
-        self.add_uint64(channel)
-        self.add_uint64(sender)
-        self.add_uint16(message_type)
+        self.append_data(MESSAGE_HEADER.pack(1, channel, sender, message_type))
+
+    def add_multi_header(self, channels, sender, message_type):
+        self.append_data(get_multi_header(len(channels)).pack(len(channels), *channels, sender, message_type))
 
     def add_control_header(self, channel, message_type):
-        self.add_uint8(1)
-        self.add_uint64(types.CONTROL_MESSAGE)
-        self.add_uint16(message_type)
-        self.add_uint64(channel)
+        self.append_data(CONTROL_HEADER.pack(1, types.CONTROL_MESSAGE, message_type, channel))
 
 
 class NetworkDatagramIterator(PyDatagramIterator):
@@ -51,6 +53,207 @@ class NetworkDatagramIterator(PyDatagramIterator):
     to the OTP's internal cluster participants...
     """
 
+    def __init__(self, datagram=None, offset=0):
+        if datagram is None:
+            PyDatagramIterator.__init__(self)
+        else:
+            PyDatagramIterator.__init__(self, datagram, offset)
+
+        # hold onto the datagram we are iterating, so that it can be
+        # passed along as-is without being copied...
+        self._network_datagram = datagram
+
+    def get_network_datagram(self):
+        return self._network_datagram
+
+
+class NetworkDatagramPool(object):
+    """
+    Keeps datagrams which were sent around to be built again, rather than
+    allocating a new one for every message that is sent...
+    """
+
+    def __init__(self, size):
+        self._size = size
+        self._datagrams = []
+
+    @property
+    def size(self):
+        return self._size
+
+    def acquire(self):
+        """
+        Returns an empty datagram, reusing a released one if we have any
+        """
+
+        if self._datagrams:
+            return self._datagrams.pop()
+
+        return NetworkDatagram()
+
+    def release(self, datagram):
+        """
+        Gives a datagram back to the pool, it must not be used again afterwards.
+        Only release a datagram once it's been handed to a connection writer,
+        which copies it, and never one that may still be queued for routing...
+        """
+
+        if len(self._datagrams) >= self._size:
+            return
+
+        datagram.clear()
+        self._datagrams.append(datagram)
+
+    def clear(self):
+        del self._datagrams[:]
+
+
+datagram_pool = None
+
+
+def get_datagram_pool():
+    """
+    Returns the datagram pool shared by every send path
+    """
+
+    global datagram_pool
+    if datagram_pool is None:
+        datagram_pool = NetworkDatagramPool(max(0, config.GetInt('net-datagram-pool-size', 256)))
+
+    return datagram_pool
+
+
+def get_network_datagram(data):
+    """
+    Returns a datagram of whichever network backend is in use, holding a copy of the data.
+    The data may be any bytes-like object, such as a memoryview into a larger buffer
+    """
+
+    datagram = NetworkDatagram()
+    datagram.append_data(data)
+    return datagram
+
+
+# the keywords of a dc field, as flags...
+DC_FIELD_REQUIRED = 1 << 0
+DC_FIELD_BROADCAST = 1 << 1
+DC_FIELD_RAM = 1 << 2
+DC_FIELD_DB = 1 << 3
+DC_FIELD_CLSEND = 1 << 4
+DC_FIELD_CLRECV = 1 << 5
+DC_FIELD_OWNSEND = 1 << 6
+DC_FIELD_OWNRECV = 1 << 7
+DC_FIELD_AIRECV = 1 << 8
+
+DC_FIELD_KEYWORDS = (
+    (DC_FIELD_REQUIRED, 'is_required'),
+    (DC_FIELD_BROADCAST, 'is_broadcast'),
+    (DC_FIELD_RAM, 'is_ram'),
+    (DC_FIELD_DB, 'is_db'),
+    (DC_FIELD_CLSEND, 'is_clsend'),
+    (DC_FIELD_CLRECV, 'is_clrecv'),
+    (DC_FIELD_OWNSEND, 'is_ownsend'),
+    (DC_FIELD_OWNRECV, 'is_ownrecv'),
+    (DC_FIELD_AIRECV, 'is_airecv'),
+)
+
+class NetworkDCFieldInfo(object):
+    """
+    The metadata of a dc field which is worked out once as the dc
+    files are read, rather than asked of the field each time it's needed...
+    """
+
+    def __init__(self, number, name, flags, default_value):
+        self.number = number
+        self.name = name
+        self.flags = flags
+        self.default_value = default_value
+
+    def has_flag(self, flag):
+        return (self.flags & flag) != 0
+
+
+class NetworkDCClassInfo(object):
+    """
+    The metadata of a dc class and it's inherited fields...
+    """
+
+    def __init__(self, number, name, fields):
+        self.number = number
+        self.name = name
+
+        # the inherited fields in the order they are packed in...
+        self.fields = fields
+        self.fields_by_number = dict((field.number, field) for field in fields)
+
+        self.required_fields = tuple(field.number for field in fields if field.has_flag(DC_FIELD_REQUIRED))
+        self.ram_fields = frozenset(field.number for field in fields if field.has_flag(DC_FIELD_RAM))
+        self.db_fields = frozenset(field.number for field in fields if field.has_flag(DC_FIELD_DB))
+        self.broadcast_fields = frozenset(field.number for field in fields if field.has_flag(DC_FIELD_BROADCAST))
+
+        self.db_defaults = tuple((field.number, field.name, field.default_value) for field in fields
+                                 if field.has_flag(DC_FIELD_DB) and field.default_value is not None)
+
+        self.dclass = None
+        self.field_table = []
+        self.flag_table = []
+
+    def bind_dclass(self, dclass):
+        """
+        Builds the tables of our fields and their flags, indexed by field number, so that
+        looking a field up never has to go through the dc class itself...
+        """
+
+        size = max(self.fields_by_number) + 1 if self.fields_by_number else 0
+
+        self.dclass = dclass
+        self.field_table = [None] * size
+        self.flag_table = [0] * size
+        for field in self.fields:
+            self.field_table[field.number] = dclass.get_field_by_index(field.number)
+            self.flag_table[field.number] = field.flags
+
+    def get_field(self, number):
+        """
+        Returns the dc field with that number, or None if it isn't one of ours
+        """
+
+        if 0 <= number < len(self.field_table):
+            return self.field_table[number]
+
+        return None
+
+    def get_flags(self, number):
+        """
+        Returns the keyword flags of the field with that number, or 0 if it isn't one of ours
+        """
+
+        if 0 <= number < len(self.flag_table):
+            return self.flag_table[number]
+
+        return 0
+
+    @classmethod
+    def from_dclass(cls, dclass):
+        fields = []
+        for field_index in range(dclass.get_num_inherited_fields()):
+            field = dclass.get_inherited_field(field_index)
+            if not field:
+                continue
+
+            flags = 0
+            for flag, keyword in DC_FIELD_KEYWORDS:
+                if getattr(field, keyword)():
+                    flags |= flag
+
+            default_value = None
+            if field.has_default_value():
+                default_value = bytes(field.get_default_value())
+
+            fields.append(NetworkDCFieldInfo(field.get_number(), field.get_name(), flags, default_value))
+
+        return cls(dclass.get_number(), dclass.get_name(), fields)
+
 
 class NetworkDCLoader(object):
     notify = notify.new_category('NetworkDCLoader')
@@ -62,6 +265,9 @@ class NetworkDCLoader(object):
         self._dclasses_by_name = {}
         self._dclasses_by_number = {}
 
+        self._class_info_by_name = {}
+        self._class_info_by_number = {}
+
         self._hash_value = 0
 
     @property
@@ -80,6 +286,14 @@ class NetworkDCLoader(object):
     def dclasses_by_number(self):
         return self._dclasses_by_number
 
+    @property
+    def class_info_by_name(self):
+        return self._class_info_by_name
+
+    @property
+    def class_info_by_number(self):
+        return self._class_info_by_number
+
     @property
     def hash_value(self):
         return self._hash_value
@@ -147,257 +361,741 @@ class NetworkDCLoader(object):
             if number >= 0:
                 self._dclasses_by_number[number] = dclass
 
+        self.load_class_info()
 
-class NetworkManager(object):
-    notify = notify.new_category('NetworkManager')
+    def load_class_info(self):
+        """
+        Works out the metadata of every dc class, along with it's inherited fields...
+        """
 
-    def get_unique_name(self, name):
-        return '%s-%s-%s' % (self.__class__.__name__, name, id(self))
+        self._class_info_by_name = {}
+        self._class_info_by_number = {}
+        for i in range(self._dc_file.get_num_classes()):
+            dclass = self._dc_file.get_class(i)
+            class_info = NetworkDCClassInfo.from_dclass(dclass)
+            class_info.bind_dclass(dclass)
+            self._class_info_by_name[class_info.name] = class_info
+            if class_info.number >= 0:
+                self._class_info_by_number[class_info.number] = class_info
 
-    def get_puppet_connection_channel(self, doId):
-        return doId + (1001 << 32)
 
-    def get_account_connection_channel(self, doId):
-        return doId + (1003 << 32)
+class NetworkSelector(object):
+    """
+    Watches the sockets of every connection, so that the main loop can sleep
+    until one of them is readable rather than polling them every frame...
+    """
 
-    def get_account_id_from_channel_code(self, channel):
-        return channel >> 32
+    def __init__(self):
+        self._selector = selectors.DefaultSelector()
 
-    def get_avatar_id_from_connection_channel(self, channel):
-        return channel & 0xffffffff
+        # anything which has work for the main loop while it is asleep, such as
+        # a signal handler, wakes it by writing to our end of this pair...
+        self._wakeup_reader, self._wakeup_writer = socket.socketpair()
+        self._wakeup_reader.setblocking(False)
+        self._wakeup_writer.setblocking(False)
+        self._selector.register(self._wakeup_reader, selectors.EVENT_READ)
 
+    def get_file_descriptor(self, connection):
+        return connection.get_socket().GetSocket()
 
-class NetworkConnector(NetworkManager):
-    notify = notify.new_category('NetworkConnector')
+    def register_connection(self, connection):
+        file_descriptor = self.get_file_descriptor(connection)
 
-    def __init__(self, dc_loader, address, port, channel, timeout=5000):
-        NetworkManager.__init__(self)
+        # the descriptor of a connection which was closed
+        # may already have been reused for this one...
+        if file_descriptor in self._selector.get_map():
+            self._selector.unregister(file_descriptor)
 
-        self._dc_loader = dc_loader
-        self.__address = address
-        self.__port = port
-        self._channel = channel
-        self.__timeout = timeout
+        self._selector.register(file_descriptor, selectors.EVENT_READ)
 
-        num_threads = 0
-        if config.GetBool('net-want-threads', False):
-            num_threads = 1
+    def unregister_connection(self, connection):
+        try:
+            self._selector.unregister(self.get_file_descriptor(connection))
+        except (KeyError, ValueError):
+            pass
 
-        self.__manager = QueuedConnectionManager()
-        self.__reader = QueuedConnectionReader(self.__manager, num_threads)
-        self.__writer = ConnectionWriter(self.__manager, num_threads)
+    def wake(self):
+        try:
+            self._wakeup_writer.send(b'\0')
+        except (BlockingIOError, InterruptedError):
+            # there are wakeups waiting to be read already...
+            pass
 
-        self.__socket = None
-        self._readable = collections.deque()
-        self._read_mutex = threading.RLock()
+    def drain_wakeups(self):
+        try:
+            while self._wakeup_reader.recv(4096):
+                pass
+        except (BlockingIOError, InterruptedError):
+            pass
 
-        self.__read_task = None
-        self.__update_task = None
-        self.__disconnect_task = None
+    def select(self, timeout):
+        """
+        Waits up to the timeout for any connection to become readable or for us
+        to be woken up, returns True if either happened else False
+        """
 
-    @property
-    def dc_loader(self):
-        return self._dc_loader
+        events = self._selector.select(timeout)
+        for key, _ in events:
+            if key.fileobj is self._wakeup_reader:
+                self.drain_wakeups()
 
-    @property
-    def channel(self):
-        return self._channel
+        return len(events) > 0
 
-    @channel.setter
-    def channel(self, channel):
-        self._channel = channel
+    def close(self):
+        self._selector.close()
+        self._wakeup_reader.close()
+        self._wakeup_writer.close()
 
-    def setup(self):
-        self.__socket = self.__manager.open_TCP_client_connection(self.__address,
-                                                                  self.__port, self.__timeout)
 
-        if not self.__socket:
-            raise NetworkError('Failed to connect TCP socket on address: <%s:%d>!' % (
-                self.__address, self.__port))
+class ThreadedNetworkSelector(NetworkSelector):
+    """
+    When panda reads the sockets on it's own threads, we still watch them so that
+    the main loop wakes up as soon as data arrives. One of panda's threads may read
+    it between the main loop checking for queued datagrams and going to sleep, so
+    it never sleeps for longer than the wakeup interval either...
+    """
 
-        self.__reader.add_connection(self.__socket)
-        self.register_for_channel(self._channel)
+    def __init__(self, wakeup_interval):
+        NetworkSelector.__init__(self)
 
-        self.__read_task = task_mgr.add(self.__read_incoming,
-                                        self.get_unique_name('read-incoming'))
+        self._wakeup_interval = wakeup_interval
 
-        self.__update_task = task_mgr.add(self.__update,
-                                          self.get_unique_name('update-handler'))
+    def select(self, timeout):
+        return NetworkSelector.select(self, min(self._wakeup_interval, timeout))
 
-        self.__disconnect_task = task_mgr.add(self.__listen_disconnect,
-                                              self.get_unique_name('listen-disconnect'))
 
-    def register_for_channel(self, channel):
-        """
-        Registers our connections channel with the MessageDirector
-        """
+network_selector = None
 
-        datagram = NetworkDatagram()
-        datagram.add_control_header(channel, types.CONTROL_SET_CHANNEL)
-        self.handle_send_connection_datagram(datagram)
 
-    def unregister_for_channel(self, channel):
-        """
-        Unregisters our connections channel from the MessageDirector
-        """
+def install_network_selector(threaded=False):
+    """
+    Installs the selector every connection set up from now on is watched by
+    """
 
-        datagram = NetworkDatagram()
-        datagram.add_control_header(channel, types.CONTROL_REMOVE_CHANNEL)
-        self.handle_send_connection_datagram(datagram)
+    global network_selector
+    if network_selector is None:
+        if threaded:
+            network_selector = ThreadedNetworkSelector(config.GetFloat('net-thread-wakeup-interval', 0.05))
+        else:
+            network_selector = NetworkSelector()
 
-    def __read_incoming(self, task):
-        """
-        Polls for incoming data
-        """
+    return network_selector
 
-        if self.__reader.data_available():
-            datagram = NetworkDatagram()
 
-            if self.__reader.get_data(datagram):
-                self.__handle_incoming_data(datagram)
+def wake_network_selector():
+    """
+    Wakes the main loop up if it is asleep waiting on the selector
+    """
 
-        return task.cont
+    if network_selector is not None:
+        network_selector.wake()
 
-    def __update(self, task):
-        """
-        Gets a datagram from the queue and handles it
-        """
 
-        if not len(self._readable):
-            return task.cont
+class LocalConnection(object):
+    """
+    Stands in for the TCP connection between a connector and a listener in the same
+    process, datagrams are handed between the two directly rather than over a socket...
+    """
 
-        datagram = self._readable.popleft()
-        di = NetworkDatagramIterator(datagram)
-        if not di.get_remaining_size():
-            return task.cont
+    def __init__(self, listener, connector):
+        self._listener = listener
+        self._connector = connector
+        self._handler = None
+        self._closed = False
 
-        with self._read_mutex:
-            self.handle_internal_datagram(di)
+    @property
+    def listener(self):
+        return self._listener
 
-        return task.cont
+    @property
+    def connector(self):
+        return self._connector
 
-    def __listen_disconnect(self, task):
-        """
-        Watches our connected socket object and determines if the stream has ended..
-        """
+    @property
+    def handler(self):
+        return self._handler
 
-        if not self.__reader.is_connection_ok(self.__socket):
-            self.handle_disconnected()
-            return task.done
+    @handler.setter
+    def handler(self, handler):
+        self._handler = handler
 
-        return task.cont
+    @property
+    def closed(self):
+        return self._closed
 
-    def __handle_incoming_data(self, datagram):
-        """
-        Handles incoming data from the connector
-        """
+    def set_collect_tcp(self, collect_tcp):
+        pass
 
-        self._readable.append(datagram)
+    def set_collect_tcp_interval(self, interval):
+        pass
 
-    def handle_send_connection_datagram(self, datagram):
-        """
-        Sends a datagram to our connection
-        """
-        self.__writer.send(datagram, self.__socket)
+    def flush(self):
+        return True
 
-    def handle_internal_datagram(self, di):
+    def send_to_handler(self, datagram):
         """
-        Handles a datagram that was sent by the message director
+        Hands a datagram sent by the connector to the listener's handler, returns True if it was accepted
         """
 
-        code = di.get_uint8()
-        self.handle_datagram(di.get_uint64(), di.get_uint64(), di.get_uint16(), di)
+        if self._closed or self._handler is None:
+            return False
 
-    def handle_datagram(self, channel, sender, message_type, di):
-        """
-        Handles a datagram that was pulled from the queue
-        """
+        # the sender may reuse it's datagram as soon as it's been sent,
+        # so the handler is given a copy of it to queue...
+        self._handler.handle_incoming_data(NetworkDatagram(datagram))
+        return True
 
-    def handle_disconnect(self):
+    def send_to_connector(self, datagram):
         """
-        Disconnects our client socket instance
+        Hands a datagram sent by the listener to the connector, returns True if it was accepted
         """
 
-        self.__manager.close_connection(self.__socket)
+        if self._closed:
+            return False
 
-    def handle_disconnected(self):
+        self._connector.handle_local_datagram(datagram)
+        return True
+
+    def disconnect(self):
         """
-        Handles disconnection when the socket connection closes
+        Closes the connection from the connector's side
         """
 
-        self.unregister_for_channel(self._channel)
-        self.__reader.remove_connection(self.__socket)
+        if not self._closed and self._handler is not None:
+            self._listener.handle_disconnect(self._handler)
 
-    def shutdown(self):
-        if self.__read_task:
-            task_mgr.remove(self.__read_task)
+        self._closed = True
 
-        if self.__update_task:
-            task_mgr.remove(self.__update_task)
+    def close(self):
+        self._closed = True
 
-        if self.__disconnect_task:
-            task_mgr.remove(self.__disconnect_task)
 
-        self.__read_task = None
-        self.__update_task = None
-        self.__disconnect_task = None
+# the listeners set up in this process, by the port they listen on, so
+# that a connector can hand it's datagrams to them directly...
+local_listeners = {}
 
+LOCAL_ADDRESSES = ('127.0.0.1', 'localhost', '::1')
 
-class NetworkHandler(NetworkManager):
-    notify = notify.new_category('NetworkHandler')
 
-    def __init__(self, network, rendezvous, address, connection, channel=0):
-        self._network = network
-        self._rendezvous = rendezvous
-        self._address = address
-        self._connection = connection
-        self._channel = channel
-        self._allocated_channel = channel
+def register_local_listener(address, port, listener):
+    local_listeners[port] = (address, listener)
 
-        self._readable = collections.deque()
-        self._read_mutex = threading.RLock()
 
-        self.__update_task = None
+def unregister_local_listener(port, listener):
+    if port in local_listeners and local_listeners[port][1] is listener:
+        del local_listeners[port]
 
-    @property
-    def network(self):
-        return self._network
 
-    @property
-    def rendezvous(self):
-        return self._rendezvous
+def get_local_listener(address, port):
+    """
+    Returns the listener in this process listening on the address and port, if there is one
+    """
 
-    @property
-    def address(self):
-        return self._address
+    if port not in local_listeners:
+        return None
 
-    @property
-    def connection(self):
-        return self._connection
+    listener_address, listener = local_listeners[port]
+    if address not in LOCAL_ADDRESSES and address != listener_address:
+        return None
 
-    @property
-    def channel(self):
-        return self._channel
+    return listener
 
-    @channel.setter
-    def channel(self, channel):
-        if not self._channel:
-            self._allocated_channel = channel
 
-        self._channel = channel
+class NetworkManager(object):
+    notify = notify.new_category('NetworkManager')
 
-    @property
-    def allocated_channel(self):
-        return self._allocated_channel
+    def __init__(self):
+        # each read or update pass handles as many datagrams as are available,
+        # up to a count and a time budget per frame, a budget of zero is unlimited...
+        self._read_budget = max(0, config.GetInt('net-read-budget', 1024))
+        self._read_time_budget = max(0.0, config.GetFloat('net-read-time-budget', 0.005))
 
-    @allocated_channel.setter
-    def allocated_channel(self, allocated_channel):
-        self._allocated_channel = allocated_channel
+        # connections are found to be lost when the reader sees them reset, every so
+        # often all of them are checked as well in case any were missed...
+        self._disconnect_sweep_interval = max(0.1, config.GetFloat('net-disconnect-sweep-interval', 5.0))
+
+        # with net-want-threads, panda reads and writes the sockets on threads of
+        # it's own and queues the datagrams read for us to pick up each frame...
+        self._threaded = config.GetBool('net-want-threads', False)
+        self._reader_threads = max(1, config.GetInt('net-reader-threads', 1)) if self._threaded else 0
+        self._writer_threads = max(1, config.GetInt('net-writer-threads', 1)) if self._threaded else 0
+
+        # connectors to a listener in this same process hand their datagrams to it
+        # directly, the wire format is unchanged so either end may be moved elsewhere...
+        self._want_local_transport = config.GetBool('net-want-local-transport', True)
+
+        # without writer threads a write blocks until it's done, a socket found to be
+        # writable is only handed up to this many bytes before it's checked again...
+        self._write_allowance = max(1, config.GetInt('net-write-allowance', 65536))
+
+    def watch_connection(self, connection):
+        if network_selector is not None:
+            network_selector.register_connection(connection)
+
+    def unwatch_connection(self, connection):
+        if network_selector is not None:
+            network_selector.unregister_connection(connection)
+
+    def has_pending_work(self):
+        """
+        Returns True if there is work waiting to be done on the next frame else False
+        """
+
+        return False
+
+    def get_next_deadline(self):
+        """
+        Returns the time.monotonic() time by which we next need a frame, or None if we have no deadline
+        """
+
+        return None
+
+    def has_queued_writes(self):
+        """
+        Returns True if our writer threads have datagrams they are yet to write else False
+        """
+
+        return False
+
+    def get_write_allowance(self, connection):
+        """
+        Returns how many bytes can be sent to the connection before writing them may block,
+        a negative allowance is unlimited
+        """
+
+        return -1
+
+    def get_read_budget(self):
+        """
+        Returns the count and deadline a read or update pass started now is limited to
+        """
+
+        deadline = None
+        if self._read_time_budget:
+            deadline = time.monotonic() + self._read_time_budget
+
+        return self._read_budget or -1, deadline
+
+    def get_unique_name(self, name):
+        return '%s-%s-%s' % (self.__class__.__name__, name, id(self))
+
+    def get_puppet_connection_channel(self, doId):
+        return doId + (1001 << 32)
+
+    def get_account_connection_channel(self, doId):
+        return doId + (1003 << 32)
+
+    def get_account_id_from_channel_code(self, channel):
+        return channel >> 32
+
+    def get_avatar_id_from_connection_channel(self, channel):
+        return channel & 0xffffffff
+
+
+class NetworkConnectorBase(NetworkManager):
+    """
+    The parts of a connector shared by every network backend, the backend
+    itself connects, reads the datagrams into our queue and writes them...
+    """
+
+    def __init__(self, dc_loader, channel):
+        NetworkManager.__init__(self)
+
+        self._dc_loader = dc_loader
+        self._channel = channel
+
+        # datagrams are only ever queued and handled from the main thread,
+        # a backend's own threads hand them over through it's own queue...
+        self._readable = collections.deque()
+        self._channel_ranges = []
+
+    @property
+    def dc_loader(self):
+        return self._dc_loader
+
+    @property
+    def channel(self):
+        return self._channel
+
+    @channel.setter
+    def channel(self, channel):
+        self._channel = channel
+
+    def register_for_channel(self, channel):
+        """
+        Registers our connections channel with the MessageDirector
+        """
+
+        datagram = NetworkDatagram()
+        datagram.add_control_header(channel, types.CONTROL_SET_CHANNEL)
+        self.handle_send_connection_datagram(datagram)
+
+    def unregister_for_channel(self, channel):
+        """
+        Unregisters our connections channel from the MessageDirector
+        """
+
+        datagram = NetworkDatagram()
+        datagram.add_control_header(channel, types.CONTROL_REMOVE_CHANNEL)
+        self.handle_send_connection_datagram(datagram)
+
+    def register_for_range(self, low, high):
+        """
+        Registers an inclusive range of channels with the MessageDirector
+        """
+
+        datagram = NetworkDatagram()
+        datagram.add_control_header(low, types.CONTROL_ADD_RANGE)
+        datagram.add_uint64(high)
+        self.handle_send_connection_datagram(datagram)
+        self._channel_ranges.append((low, high))
+
+    def unregister_for_range(self, low, high):
+        """
+        Unregisters an inclusive range of channels from the MessageDirector
+        """
+
+        datagram = NetworkDatagram()
+        datagram.add_control_header(low, types.CONTROL_REMOVE_RANGE)
+        datagram.add_uint64(high)
+        self.handle_send_connection_datagram(datagram)
+
+        if (low, high) in self._channel_ranges:
+            self._channel_ranges.remove((low, high))
+
+    def has_channel_range(self, channel):
+        """
+        Returns True if the channel is within one of our registered ranges else False
+        """
+
+        for low, high in self._channel_ranges:
+            if low <= channel <= high:
+                return True
+
+        return False
+
+    def update_readable(self):
+        """
+        Handles the datagrams in our queue, up to the read budget
+        """
+
+        count, deadline = self.get_read_budget()
+        while count and self._readable:
+            datagram = self._readable.popleft()
+            count -= 1
+
+            di = NetworkDatagramIterator(datagram)
+            if di.get_remaining_size():
+                self.handle_internal_datagram(di)
+
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+
+    def has_pending_work(self):
+        return len(self._readable) > 0
+
+    def handle_local_datagram(self, datagram):
+        """
+        Handles a datagram handed to us by a listener in this process
+        """
+
+        self._readable.append(datagram)
+
+    def handle_send_connection_datagram(self, datagram):
+        """
+        Sends a datagram to our connection
+        """
+
+    def handle_internal_datagram(self, di):
+        """
+        Handles a datagram that was sent by the message director
+        """
+
+        channel_count = di.get_uint8()
+        if channel_count == 1:
+            self.handle_datagram(di.get_uint64(), di.get_uint64(), di.get_uint16(), di)
+            return
+
+        channels = [di.get_uint64() for _ in range(channel_count)]
+        sender = di.get_uint64()
+        message_type = di.get_uint16()
+
+        # a message addressed to multiple channels is handled as if it
+        # were sent to each one of them, every channel gets it's own iterator...
+        datagram = di.get_datagram()
+        offset = di.get_current_index()
+        for channel in channels:
+            self.handle_datagram(channel, sender, message_type,
+                                 NetworkDatagramIterator(datagram, offset))
+
+    def handle_datagram(self, channel, sender, message_type, di):
+        """
+        Handles a datagram that was pulled from the queue
+        """
+
+
+class NetworkConnector(NetworkConnectorBase):
+    notify = notify.new_category('NetworkConnector')
+
+    def __init__(self, dc_loader, address, port, channel, timeout=5000):
+        NetworkConnectorBase.__init__(self, dc_loader, channel)
+
+        self.__address = address
+        self.__port = port
+        self.__timeout = timeout
+
+        self.__manager = QueuedConnectionManager()
+        self.__reader = QueuedConnectionReader(self.__manager, self._reader_threads)
+        self.__writer = ConnectionWriter(self.__manager, self._writer_threads)
+
+        self.__socket = None
+        self.__local = False
+        self.__closed = False
+        self.__read_pending = False
+
+        self.__read_task = None
+        self.__update_task = None
+        self.__disconnect_task = None
+        self.__sweep_task = None
+
+    @property
+    def local(self):
+        return self.__local
 
     def setup(self):
+        listener = None
+        if self._want_local_transport:
+            listener = get_local_listener(self.__address, self.__port)
+
+        if listener is not None:
+            self.__socket = listener.open_local_connection(self)
+            self.__local = True
+        else:
+            self.__socket = self.__manager.open_TCP_client_connection(self.__address,
+                                                                      self.__port, self.__timeout)
+
+            if not self.__socket:
+                raise NetworkError('Failed to connect TCP socket on address: <%s:%d>!' % (
+                    self.__address, self.__port))
+
+            self.__local = False
+            self.__reader.add_connection(self.__socket)
+            self.watch_connection(self.__socket)
+
+        self.__closed = False
+        if self._channel:
+            self.register_for_channel(self._channel)
+
         self.__update_task = task_mgr.add(self.__update,
                                           self.get_unique_name('update-handler'))
 
+        self.__disconnect_task = task_mgr.add(self.__listen_disconnect,
+                                              self.get_unique_name('listen-disconnect'))
+
+        # a local connection has no socket to read or to check on,
+        # it's datagrams are queued as soon as they're sent...
+        if self.__local:
+            return
+
+        self.__read_task = task_mgr.add(self.__read_incoming,
+                                        self.get_unique_name('read-incoming'))
+
+        self.__sweep_task = task_mgr.doMethodLater(self._disconnect_sweep_interval, self.__sweep_disconnect,
+                                                   self.get_unique_name('sweep-disconnect'))
+
+    def __read_incoming(self, task):
+        """
+        Polls for incoming data
+        """
+
+        count, deadline = self.get_read_budget()
+        while count and self.__reader.data_available():
+            datagram = NetworkDatagram()
+
+            if self.__reader.get_data(datagram):
+                self.__handle_incoming_data(datagram)
+
+            count -= 1
+            if deadline is not None and time.monotonic() >= deadline:
+                count = 0
+
+        # when the budget ran out there may be more data available,
+        # which is read on the next frame without waiting for the socket...
+        self.__read_pending = not count
+        return task.cont
+
+    def __update(self, task):
+        """
+        Gets the datagrams from the queue and handles them
+        """
+
+        self.update_readable()
+        return task.cont
+
+    def has_pending_work(self):
+        if self.__read_pending or NetworkConnectorBase.has_pending_work(self):
+            return True
+
+        # panda's threads may have queued more datagrams or found
+        # the connection reset since our last frame...
+        return self._threaded and (self.__reader.data_available() or self.__manager.reset_connection_available())
+
+    def __listen_disconnect(self, task):
+        """
+        Handles our connection being reset, as found by the reader, or closed by us...
+        """
+
+        reset = False
+        while self.__manager.reset_connection_available():
+            connection = PointerToConnection()
+            if self.__manager.get_reset_connection(connection):
+                self.unwatch_connection(connection.p())
+                self.__manager.close_connection(connection.p())
+                reset = True
+
+        if self.__local and self.__socket.closed:
+            self.__closed = True
+
+        if not reset and not self.__closed:
+            return task.cont
+
+        self.__handle_lost_connection()
+        return task.done
+
+    def __sweep_disconnect(self, task):
+        """
+        Checks our connection every so often, in case it was lost without being reset...
+        """
+
+        if self.__reader.is_connection_ok(self.__socket):
+            return task.again
+
+        self.__handle_lost_connection()
+        return task.done
+
+    def __handle_lost_connection(self):
+        for task in (self.__disconnect_task, self.__sweep_task):
+            if task:
+                task_mgr.remove(task)
+
+        self.__disconnect_task = None
+        self.__sweep_task = None
+        self.handle_disconnected()
+
+    def __handle_incoming_data(self, datagram):
+        """
+        Handles incoming data from the connector
+        """
+
+        self._readable.append(datagram)
+
+    def handle_send_connection_datagram(self, datagram):
+        """
+        Sends a datagram to our connection
+        """
+
+        if self.__local:
+            self.__socket.send_to_handler(datagram)
+            return
+
+        self.__writer.send(datagram, self.__socket)
+
+    def handle_disconnect(self):
+        """
+        Disconnects our client socket instance
+        """
+
+        # a connection we close ourselves is never reported as reset,
+        # it is handled as lost on the next frame instead...
+        if self.__local:
+            self.__socket.disconnect()
+        else:
+            self.unwatch_connection(self.__socket)
+            self.__manager.close_connection(self.__socket)
+
+        self.__closed = True
+
+    def handle_disconnected(self):
+        """
+        Handles disconnection when the socket connection closes
+        """
+
+        self.unregister_for_channel(self._channel)
+        if self.__local:
+            self.__socket.close()
+            return
+
+        self.unwatch_connection(self.__socket)
+        self.__reader.remove_connection(self.__socket)
+
+    def shutdown(self):
+        if self.__read_task:
+            task_mgr.remove(self.__read_task)
+
+        if self.__update_task:
+            task_mgr.remove(self.__update_task)
+
+        if self.__disconnect_task:
+            task_mgr.remove(self.__disconnect_task)
+
+        if self.__sweep_task:
+            task_mgr.remove(self.__sweep_task)
+
+        self.__read_task = None
+        self.__update_task = None
+        self.__disconnect_task = None
+        self.__sweep_task = None
+
+
+class NetworkHandler(NetworkManager):
+    notify = notify.new_category('NetworkHandler')
+
+    def __init__(self, network, rendezvous, address, connection, channel=0):
+        self._network = network
+        self._rendezvous = rendezvous
+        self._address = address
+        self._connection = connection
+        self._channel = channel
+        self._allocated_channel = channel
+
+        self._readable = collections.deque()
+
+    @property
+    def network(self):
+        return self._network
+
+    @property
+    def rendezvous(self):
+        return self._rendezvous
+
+    @property
+    def address(self):
+        return self._address
+
+    @property
+    def connection(self):
+        return self._connection
+
+    @property
+    def channel(self):
+        return self._channel
+
+    @channel.setter
+    def channel(self, channel):
+        if not self._channel:
+            self._allocated_channel = channel
+
+        self._channel = channel
+
+    @property
+    def allocated_channel(self):
+        return self._allocated_channel
+
+    @allocated_channel.setter
+    def allocated_channel(self, allocated_channel):
+        self._allocated_channel = allocated_channel
+
+    def setup(self):
         if self._channel:
             self.register_for_channel(self._channel)
 
@@ -406,9 +1104,13 @@ class NetworkHandler(NetworkManager):
         Registers our connections channel with the MessageDirector
         """
 
-        datagram = NetworkDatagram()
-        datagram.add_control_header(channel, types.CONTROL_SET_CHANNEL)
-        self._network.handle_send_connection_datagram(datagram)
+        # channels within a range our network has already registered
+        # are routed to it anyway, only the local association is needed...
+        if not self._network.has_channel_range(channel):
+            datagram = NetworkDatagram()
+            datagram.add_control_header(channel, types.CONTROL_SET_CHANNEL)
+            self._network.handle_send_connection_datagram(datagram)
+
         self._network.add_channel_to_handler(channel, self)
 
     def unregister_for_channel(self, channel):
@@ -431,100 +1133,306 @@ class NetworkHandler(NetworkManager):
         self._channel = channel
         self.register_for_channel(channel)
 
-    def __update(self, task):
+    def handle_pending_data(self):
         """
-        Gets a datagram from the queue and handles it
+        Gets a datagram from the queue and handles it, returns True if there are more waiting else False
         """
 
         if not len(self._readable):
-            return task.cont
+            return False
 
         datagram = self._readable.popleft()
         di = NetworkDatagramIterator(datagram)
-        if not di.get_remaining_size():
-            return task.cont
-
-        with self._read_mutex:
+        if di.get_remaining_size():
             self.handle_datagram(di)
 
-        return task.cont
+        return len(self._readable) > 0
 
     def handle_send_datagram(self, datagram):
         """
-        Sends a datagram to our connection
+        Sends a datagram to our connection, returns True if it was accepted for writing
+        """
+
+        return self._network.handle_send_datagram(datagram, self._connection)
+
+    def get_write_allowance(self):
+        """
+        Returns how many bytes can be sent to our connection before writing them may block,
+        a negative allowance is unlimited
         """
 
-        self._network.handle_send_datagram(datagram, self._connection)
+        return self._network.get_write_allowance(self._connection)
 
     def handle_incoming_data(self, datagram):
         """
         Puts an incoming datagram in the data queue
         """
 
-        self._readable.append(datagram)
+        self._readable.append(datagram)
+        self._network.add_ready_handler(self)
+
+    def has_pending_data(self):
+        """
+        Returns True if there are datagrams in the data queue waiting to be handled else False
+        """
+
+        return len(self._readable) > 0
+
+    def handle_datagram(self, di):
+        """
+        Handles a datagram that was pulled from the queue
+        """
+
+    def handle_disconnect(self):
+        """
+        Disconnects our client socket instance
+        """
+        self._network.handle_disconnect(self)
+
+    def handle_disconnected(self):
+        """
+        Handles disconnection when the socket connection closes
+        """
+        self.unregister_for_channel(
+            self.get_puppet_connection_channel(self.get_avatar_id_from_connection_channel(self._channel)))
+        self.unregister_for_channel(self._channel)
+        self._network.handle_disconnected(self)
+
+    def shutdown(self):
+        if self._allocated_channel and self._channel != self._allocated_channel:
+            self.unregister_for_channel(self._allocated_channel)
+
+        if self._channel:
+            self.unregister_for_channel(self._channel)
+
+
+class NetworkListenerBase(NetworkManager):
+    """
+    The parts of a listener shared by every network backend, the backend itself
+    accepts the connections, reads the datagrams for their handlers and writes them...
+    """
+
+    def __init__(self, handler):
+        NetworkManager.__init__(self)
+
+        self._handler_class = handler
+        self._handlers = {}
+        self._channel2handlers = {}
+
+        # handlers with datagrams waiting in their data queue, so that each
+        # frame only the handlers which have something to do are updated...
+        self._ready_handlers = collections.OrderedDict()
+        self._closed_handlers = []
+
+    def add_ready_handler(self, handler):
+        """
+        Marks a handler as having datagrams waiting to be handled
+        """
+
+        self._ready_handlers[handler] = None
+
+    def dispatch_handlers(self):
+        """
+        Handles the datagrams of the ready handlers in turn up to the read budget,
+        handlers with datagrams still waiting remain ready for the next frame
+        """
+
+        ready_handlers = self._ready_handlers
+        if not ready_handlers:
+            return
+
+        # each handler gets an even share of the budget, one that uses all of it
+        # goes to the back of the line and the next frame starts with those after it...
+        count, deadline = self.get_read_budget()
+        quantum = max(1, count // len(ready_handlers)) if count > 0 else -1
+        served_handlers = []
+        while ready_handlers and count:
+            handler, _ = ready_handlers.popitem(last=False)
+
+            # the handler may have been removed by a datagram
+            # handled earlier on during this dispatch...
+            if self._handlers.get(handler.connection) is not handler:
+                continue
+
+            pending = True
+            handled = quantum
+            while pending and handled and count:
+                pending = handler.handle_pending_data()
+                handled -= 1
+                count -= 1
+
+                if deadline is not None and time.monotonic() >= deadline:
+                    count = 0
+
+            if pending:
+                served_handlers.append(handler)
+
+        for handler in served_handlers:
+            ready_handlers[handler] = None
+
+    def handle_closed_handlers(self):
+        """
+        Disconnects the handlers whose connections we closed ourselves since the last frame
+        """
+
+        if not self._closed_handlers:
+            return
+
+        closed_handlers = self._closed_handlers
+        self._closed_handlers = []
+        for handler in closed_handlers:
+            if self._handlers.get(handler.connection) is handler:
+                handler.handle_disconnected()
+
+    def has_pending_work(self):
+        return len(self._ready_handlers) > 0 or len(self._closed_handlers) > 0
+
+    def has_handler(self, connection):
+        """
+        Returns True if the handler is queued else False
+        """
+
+        return connection in self._handlers
+
+    def add_handler(self, handler):
+        """
+        Adds a handler to the handlers dictionary
+        """
+
+        if self.has_handler(handler.connection):
+            return
+
+        self._handlers[handler.connection] = handler
+        handler.setup()
+
+    def get_handlers(self):
+        """
+        Returns a list of all the handlers currently connected
+        """
+
+        return list(self._handlers.values())
+
+    def remove_handler(self, handler):
+        """
+        Removes a handler from the handlers dictionary
+        """
+
+        if not self.has_handler(handler.connection):
+            return
+
+        handler.shutdown()
+        if isinstance(handler.connection, LocalConnection):
+            handler.connection.close()
+
+        del self._handlers[handler.connection]
+        self._ready_handlers.pop(handler, None)
+
+    def handle_incoming_connection(self, rendezvous, address, connection):
+        """
+        Handles an incoming connection from the connection listener
+        """
+
+        handler = self._handler_class(self, rendezvous, address, connection)
+        self.add_handler(handler)
+
+    def open_local_connection(self, connector):
+        """
+        Connects a connector in this process to us, returns the local connection it sends over
+        """
+
+        connection = LocalConnection(self, connector)
+        connection.handler = self._handler_class(self, None, 'local:%s' % connector.__class__.__name__, connection)
+        self.add_handler(connection.handler)
+        return connection
+
+    def has_channel_to_handler(self, channel):
+        """
+        Returns True if a handler instance if one is associated with that channel else False
+        """
+
+        return channel in self._channel2handlers
+
+    def add_channel_to_handler(self, channel, handler):
+        """
+        Associates a handler with a channel
+        """
+
+        if self.has_channel_to_handler(channel):
+            return
+
+        self._channel2handlers[channel] = handler
+
+    def remove_channel_to_handler(self, channel):
+        """
+        Removes association of a channel to a handler
+        """
+
+        if not self.has_channel_to_handler(channel):
+            return
+
+        del self._channel2handlers[channel]
+
+    def get_handler_from_channel(self, channel):
+        """
+        Returns a handler instance if one is associated with that channel
+        """
+
+        return self._channel2handlers.get(channel)
 
-    def handle_datagram(self, di):
+    def handle_send_datagram(self, datagram, connection):
         """
-        Handles a datagram that was pulled from the queue
+        Sends a datagram to a specific connection, returns True if it was accepted for writing
         """
 
-    def handle_disconnect(self):
+        return False
+
+    def handle_disconnect(self, handler):
         """
-        Disconnects our client socket instance
+        Disconnects the handlers client socket instance
         """
-        self._network.handle_disconnect(self)
 
-    def handle_disconnected(self):
+    def handle_disconnected(self, handler):
         """
-        Handles disconnection when the socket connection closes
+        Handles disconnection of a client socket instance
         """
-        self.unregister_for_channel(
-            self.get_puppet_connection_channel(self.get_avatar_id_from_connection_channel(self._channel)))
-        self.unregister_for_channel(self._channel)
-        self._network.handle_disconnected(self)
-
-    def shutdown(self):
-        if self._allocated_channel and self._channel != self._allocated_channel:
-            self.unregister_for_channel(self._allocated_channel)
-
-        if self._channel:
-            self.unregister_for_channel(self._channel)
-
-        if self.__update_task:
-            task_mgr.remove(self.__update_task)
 
-        self.__update_task = None
+        self.remove_handler(handler)
 
 
-class NetworkListener(NetworkManager):
+class NetworkListener(NetworkListenerBase):
     notify = notify.new_category('NetworkListener')
 
-    def __init__(self, address, port, handler, backlog=10000):
-        NetworkManager.__init__(self)
+    # panda opens the listening socket itself, it cannot
+    # be shared with the listeners of other processes...
+    can_reuse_port = False
+
+    def __init__(self, address, port, handler, backlog=10000, reuse_port=False):
+        NetworkListenerBase.__init__(self, handler)
 
         self.__address = address
         self.__port = port
-        self.__handler = handler
         self.__backlog = backlog
-
-        num_threads = 0
-        if config.GetBool('net-want-threads', False):
-            num_threads = 1
+        self.__reuse_port = reuse_port
 
         self.__manager = QueuedConnectionManager()
-        self.__listener = QueuedConnectionListener(self.__manager, num_threads)
-        self.__reader = QueuedConnectionReader(self.__manager, num_threads)
-        self.__writer = ConnectionWriter(self.__manager, num_threads)
+        self.__listener = QueuedConnectionListener(self.__manager, self._reader_threads)
+        self.__reader = QueuedConnectionReader(self.__manager, self._reader_threads)
+        self.__writer = ConnectionWriter(self.__manager, self._writer_threads)
 
         self.__socket = None
-        self._handlers = {}
-        self._channel2handlers = {}
+        self.__read_pending = False
 
         self.__listen_task = None
         self.__read_task = None
+        self.__dispatch_task = None
         self.__disconnect_task = None
+        self.__sweep_task = None
 
     def setup(self):
+        if self.__reuse_port:
+            raise NetworkError('Failed to share TCP socket on address: <%s:%d>, not supported!' % (
+                self.__address, self.__port))
+
         self.__socket = self.__manager.open_TCP_server_rendezvous(self.__address,
                                                                   self.__port, self.__backlog)
 
@@ -533,6 +1441,8 @@ class NetworkListener(NetworkManager):
                 self.__address, self.__port))
 
         self.__listener.add_connection(self.__socket)
+        self.watch_connection(self.__socket)
+        register_local_listener(self.__address, self.__port, self)
 
         self.__listen_task = task_mgr.add(self.__listen_incoming,
                                           self.get_unique_name('listen-incoming'))
@@ -540,9 +1450,15 @@ class NetworkListener(NetworkManager):
         self.__read_task = task_mgr.add(self.__read_incoming,
                                         self.get_unique_name('read-incoming'))
 
+        self.__dispatch_task = task_mgr.add(self.__dispatch,
+                                            self.get_unique_name('dispatch-handlers'))
+
         self.__disconnect_task = task_mgr.add(self.__listen_disconnect,
                                               self.get_unique_name('listen-disconnect'))
 
+        self.__sweep_task = task_mgr.doMethodLater(self._disconnect_sweep_interval, self.__sweep_disconnect,
+                                                   self.get_unique_name('sweep-disconnect'))
+
     def __listen_incoming(self, task):
         """
         Polls for incoming connections
@@ -563,35 +1479,73 @@ class NetworkListener(NetworkManager):
         Polls for incoming data
         """
 
-        if self.__reader.data_available():
+        count, deadline = self.get_read_budget()
+        while count and self.__reader.data_available():
             datagram = NetworkDatagram()
 
             if self.__reader.get_data(datagram):
                 self.__handle_incoming_data(datagram, datagram.get_connection())
 
+            count -= 1
+            if deadline is not None and time.monotonic() >= deadline:
+                count = 0
+
+        # when the budget ran out there may be more data available,
+        # which is read on the next frame without waiting for the socket...
+        self.__read_pending = not count
+        return task.cont
+
+    def __dispatch(self, task):
+        """
+        Updates each of the handlers with datagrams waiting to be handled
+        """
+
+        self.dispatch_handlers()
         return task.cont
 
     def __listen_disconnect(self, task):
         """
-        Watches all connected socket objects and determines if the stream has ended...
+        Handles the connections the reader has found to be reset and those we closed ourselves...
         """
 
-        # ?
-        try:
-            for handler in self._handlers.values():
-                if not self.__reader.is_connection_ok(handler.connection):
-                    handler.handle_disconnected()
-        except:
-            pass
+        while self.__manager.reset_connection_available():
+            connection = PointerToConnection()
+            if not self.__manager.get_reset_connection(connection):
+                break
+
+            connection = connection.p()
+            handler = self._handlers.get(connection)
+            if handler is not None:
+                handler.handle_disconnected()
 
+            self.unwatch_connection(connection)
+            self.__manager.close_connection(connection)
+
+        self.handle_closed_handlers()
         return task.cont
 
-    def has_handler(self, connection):
+    def has_pending_work(self):
+        if self.__read_pending or NetworkListenerBase.has_pending_work(self):
+            return True
+
+        return self._threaded and (self.__reader.data_available() or self.__listener.new_connection_available() or
+                                   self.__manager.reset_connection_available())
+
+    def __sweep_disconnect(self, task):
         """
-        Returns True if the handler is queued else False
+        Checks every connection every so often, in case any were lost without being reset...
         """
 
-        return connection in self._handlers
+        for handler in list(self._handlers.values()):
+            if isinstance(handler.connection, LocalConnection):
+                continue
+
+            if not self.__reader.is_connection_ok(handler.connection):
+                handler.handle_disconnected()
+                self.unwatch_connection(handler.connection)
+                self.__manager.close_connection(handler.connection)
+
+        return task.again
 
     def add_handler(self, handler):
         """
@@ -601,9 +1555,11 @@ class NetworkListener(NetworkManager):
         if self.has_handler(handler.connection):
             return
 
-        self.__reader.add_connection(handler.connection)
-        self._handlers[handler.connection] = handler
-        handler.setup()
+        if not isinstance(handler.connection, LocalConnection):
+            self.__reader.add_connection(handler.connection)
+            self.watch_connection(handler.connection)
+
+        NetworkListenerBase.add_handler(self, handler)
 
     def remove_handler(self, handler):
         """
@@ -613,17 +1569,10 @@ class NetworkListener(NetworkManager):
         if not self.has_handler(handler.connection):
             return
 
-        handler.shutdown()
-        self.__reader.remove_connection(handler.connection)
-        del self._handlers[handler.connection]
-
-    def handle_incoming_connection(self, rendezvous, address, connection):
-        """
-        Handles an incoming connection from the connection listener
-        """
-
-        handler = self.__handler(self, rendezvous, address, connection)
-        self.add_handler(handler)
+        NetworkListenerBase.remove_handler(self, handler)
+        if not isinstance(handler.connection, LocalConnection):
+            self.unwatch_connection(handler.connection)
+            self.__reader.remove_connection(handler.connection)
 
     def __handle_incoming_data(self, datagram, connection):
         """
@@ -635,76 +1584,385 @@ class NetworkListener(NetworkManager):
 
         self._handlers[connection].handle_incoming_data(datagram)
 
-    def has_channel_to_handler(self, channel):
+    def handle_send_datagram(self, datagram, connection):
         """
-        Returns True if a handler instance if one is associated with that channel else False
+        Sends a datagram to a specific connection, returns True if it was accepted for writing
         """
 
-        return channel in self._channel2handlers
+        if not self.has_handler(connection):
+            return False
 
-    def add_channel_to_handler(self, channel, handler):
+        if isinstance(connection, LocalConnection):
+            return connection.send_to_connector(datagram)
+
+        return self.__writer.send(datagram, connection)
+
+    def has_queued_writes(self):
+        return self._threaded and self.__writer.get_current_queue_size() > 0
+
+    def get_write_allowance(self, connection):
+        # without writer threads, panda keeps writing until the whole datagram is out even
+        # when the socket would block. A socket that isn't draining isn't written to at all,
+        # the datagrams are held onto by the caller and count against it's backlog instead...
+        if self._threaded or isinstance(connection, LocalConnection):
+            return -1
+
+        try:
+            _, writable, _ = select.select([], [connection.get_socket().GetSocket()], [], 0)
+        except (OSError, ValueError):
+            # the write itself is left to fail, so that
+            # the connection is found to be lost...
+            return -1
+
+        return self._write_allowance if writable else 0
+
+    def handle_disconnect(self, handler):
         """
-        Associates a handler with a channel
+        Disconnects the handlers client socket instance
         """
 
-        if self.has_channel_to_handler(channel):
-            return
+        # a connection we close ourselves is never reported as reset, the handler
+        # is disconnected on the next frame rather than in the middle of routing...
+        if isinstance(handler.connection, LocalConnection):
+            handler.connection.close()
+        else:
+            self.unwatch_connection(handler.connection)
+            self.__manager.close_connection(handler.connection)
 
-        self._channel2handlers[channel] = handler
+        self._closed_handlers.append(handler)
 
-    def remove_channel_to_handler(self, channel):
+    def shutdown(self):
+        if self.__listen_task:
+            task_mgr.remove(self.__listen_task)
+
+        if self.__read_task:
+            task_mgr.remove(self.__read_task)
+
+        if self.__dispatch_task:
+            task_mgr.remove(self.__dispatch_task)
+
+        if self.__disconnect_task:
+            task_mgr.remove(self.__disconnect_task)
+
+        if self.__sweep_task:
+            task_mgr.remove(self.__sweep_task)
+
+        self.__listen_task = None
+        self.__read_task = None
+        self.__dispatch_task = None
+        self.__disconnect_task = None
+        self.__sweep_task = None
+
+        unregister_local_listener(self.__port, self)
+        self.unwatch_connection(self.__socket)
+        self.__listener.remove_connection(self.__socket)
+
+
+class AsyncNetworkConnector(NetworkConnectorBase):
+    """
+    The asyncio backend's connector, its connection is an aio.NetworkProtocol
+    run on asyncio's event loop rather than one of panda's connections...
+    """
+
+    notify = notify.new_category('AsyncNetworkConnector')
+
+    def __init__(self, dc_loader, address, port, channel, timeout=5000):
+        NetworkConnectorBase.__init__(self, dc_loader, channel)
+
+        self.__address = address
+        self.__port = port
+        self.__timeout = timeout
+
+        self.__connection = None
+        self.__local = False
+        self.__closed = False
+
+        self.__update_task = None
+        self.__disconnect_task = None
+
+    @property
+    def local(self):
+        return self.__local
+
+    def setup(self):
+        listener = None
+        if self._want_local_transport:
+            listener = get_local_listener(self.__address, self.__port)
+
+        if listener is not None:
+            self.__connection = listener.open_local_connection(self)
+            self.__local = True
+        else:
+            # connect straight away so that a failure is raised here, like with panda,
+            # the event loop takes the connected socket over from then on...
+            try:
+                connection_socket = socket.create_connection((self.__address, self.__port),
+                                                             self.__timeout / 1000.0)
+            except OSError:
+                raise NetworkError('Failed to connect TCP socket on address: <%s:%d>!' % (
+                    self.__address, self.__port))
+
+            connection_socket.setblocking(False)
+            self.__connection = aio.NetworkProtocol(None, self.__handle_datagram, self.__handle_lost_connection)
+            self.__local = False
+
+            loop = aio.install_event_loop()
+            connect = loop.create_task(loop.create_connection(lambda: self.__connection, sock=connection_socket))
+            connect.add_done_callback(self.__handle_connect_done)
+
+        self.__closed = False
+        if self._channel:
+            self.register_for_channel(self._channel)
+
+        self.__update_task = task_mgr.add(self.__update,
+                                          self.get_unique_name('update-handler'))
+
+        self.__disconnect_task = task_mgr.add(self.__listen_disconnect,
+                                              self.get_unique_name('listen-disconnect'))
+
+    def __handle_connect_done(self, future):
+        if future.cancelled() or future.exception() is not None:
+            self.__closed = True
+
+    def __update(self, task):
         """
-        Removes association of a channel to a handler
+        Gets the datagrams from the queue and handles them
         """
 
-        if not self.has_channel_to_handler(channel):
+        self.update_readable()
+        return task.cont
+
+    def __listen_disconnect(self, task):
+        """
+        Handles our connection being lost or closed by us...
+        """
+
+        if self.__connection.closed:
+            self.__closed = True
+
+        if not self.__closed:
+            return task.cont
+
+        self.__disconnect_task = None
+        self.handle_disconnected()
+        return task.done
+
+    def __handle_datagram(self, connection, datagram):
+        self._readable.append(datagram)
+
+    def __handle_lost_connection(self, connection):
+        self.__closed = True
+
+    def handle_send_connection_datagram(self, datagram):
+        """
+        Sends a datagram to our connection
+        """
+
+        if self.__local:
+            self.__connection.send_to_handler(datagram)
             return
 
-        del self._channel2handlers[channel]
+        self.__connection.send(datagram)
 
-    def get_handler_from_channel(self, channel):
+    def handle_disconnect(self):
         """
-        Returns a handler instance if one is associated with that channel
+        Disconnects our client socket instance
         """
 
-        return self._channel2handlers.get(channel)
+        if self.__local:
+            self.__connection.disconnect()
+        else:
+            self.__connection.close()
 
-    def handle_send_datagram(self, datagram, connection):
+        self.__closed = True
+
+    def handle_disconnected(self):
         """
-        Sends a datagram to a specific connection
+        Handles disconnection when the socket connection closes
         """
 
-        if not self.has_handler(connection):
+        self.unregister_for_channel(self._channel)
+        self.__connection.close()
+
+    def shutdown(self):
+        if self.__update_task:
+            task_mgr.remove(self.__update_task)
+
+        if self.__disconnect_task:
+            task_mgr.remove(self.__disconnect_task)
+
+        self.__update_task = None
+        self.__disconnect_task = None
+
+
+class AsyncNetworkListener(NetworkListenerBase):
+    """
+    The asyncio backend's listener, each accepted connection is
+    an aio.NetworkProtocol its handler is keyed by...
+    """
+
+    notify = notify.new_category('AsyncNetworkListener')
+
+    # several processes may listen on the same port,
+    # the kernel then balances connections between them...
+    can_reuse_port = hasattr(socket, 'SO_REUSEPORT')
+
+    def __init__(self, address, port, handler, backlog=10000, reuse_port=False):
+        NetworkListenerBase.__init__(self, handler)
+
+        self.__address = address
+        self.__port = port
+        self.__backlog = backlog
+        self.__reuse_port = reuse_port
+
+        self.__socket = None
+        self.__server = None
+        self.__lost_connections = collections.deque()
+
+        self.__dispatch_task = None
+        self.__disconnect_task = None
+
+    def setup(self):
+        # bind straight away so that a failure is raised here, like with panda,
+        # the event loop accepts connections on the socket from then on...
+        try:
+            family, socket_type, protocol, _, address = socket.getaddrinfo(
+                self.__address or None, self.__port, 0, socket.SOCK_STREAM, 0, socket.AI_PASSIVE)[0]
+
+            self.__socket = socket.socket(family, socket_type, protocol)
+            self.__socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            if self.__reuse_port:
+                self.__socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+
+            self.__socket.bind(address)
+            self.__socket.listen(self.__backlog)
+            self.__socket.setblocking(False)
+        except OSError:
+            if self.__socket is not None:
+                self.__socket.close()
+
+            raise NetworkError('Failed to bind TCP socket on address: <%s:%d>!' % (
+                self.__address, self.__port))
+
+        loop = aio.install_event_loop()
+        self.__server = loop.create_task(loop.create_server(
+            lambda: aio.NetworkProtocol(self.__handle_connection, self.__handle_datagram, self.__handle_lost_connection),
+            sock=self.__socket))
+
+        register_local_listener(self.__address, self.__port, self)
+
+        self.__dispatch_task = task_mgr.add(self.__dispatch,
+                                            self.get_unique_name('dispatch-handlers'))
+
+        self.__disconnect_task = task_mgr.add(self.__listen_disconnect,
+                                              self.get_unique_name('listen-disconnect'))
+
+    def __handle_connection(self, connection):
+        self.handle_incoming_connection(None, connection.address, connection)
+
+    def __handle_datagram(self, connection, datagram):
+        handler = self._handlers.get(connection)
+        if handler is not None:
+            handler.handle_incoming_data(datagram)
+
+    def __handle_lost_connection(self, connection):
+        # the handler is disconnected on the next frame,
+        # rather than in the middle of routing...
+        self.__lost_connections.append(connection)
+
+    def __dispatch(self, task):
+        """
+        Updates each of the handlers with datagrams waiting to be handled
+        """
+
+        self.dispatch_handlers()
+        return task.cont
+
+    def __listen_disconnect(self, task):
+        """
+        Handles the connections which were lost and those we closed ourselves...
+        """
+
+        while self.__lost_connections:
+            handler = self._handlers.get(self.__lost_connections.popleft())
+            if handler is not None:
+                handler.handle_disconnected()
+
+        self.handle_closed_handlers()
+        return task.cont
+
+    def has_pending_work(self):
+        return NetworkListenerBase.has_pending_work(self) or len(self.__lost_connections) > 0
+
+    def remove_handler(self, handler):
+        """
+        Removes a handler from the handlers dictionary
+        """
+
+        if not self.has_handler(handler.connection):
             return
 
-        self.__writer.send(datagram, connection)
+        NetworkListenerBase.remove_handler(self, handler)
+        if not isinstance(handler.connection, LocalConnection):
+            handler.connection.close()
 
-    def handle_disconnect(self, handler):
+    def handle_send_datagram(self, datagram, connection):
         """
-        Disconnects the handlers client socket instance
+        Sends a datagram to a specific connection, returns True if it was accepted for writing
         """
 
-        self.__manager.close_connection(handler.connection)
+        if not self.has_handler(connection):
+            return False
+
+        if isinstance(connection, LocalConnection):
+            return connection.send_to_connector(datagram)
 
-    def handle_disconnected(self, handler):
+        return connection.send(datagram, True)
+
+    def handle_disconnect(self, handler):
         """
-        Handles disconnection of a client socket instance
+        Disconnects the handlers client socket instance
         """
 
-        self.remove_handler(handler)
+        handler.connection.close()
+        self._closed_handlers.append(handler)
 
     def shutdown(self):
-        if self.__listen_task:
-            task_mgr.remove(self.__listen_task)
-
-        if self.__read_task:
-            task_mgr.remove(self.__read_task)
+        if self.__dispatch_task:
+            task_mgr.remove(self.__dispatch_task)
 
         if self.__disconnect_task:
             task_mgr.remove(self.__disconnect_task)
 
-        self.__listen_task = None
-        self.__read_task = None
+        self.__dispatch_task = None
         self.__disconnect_task = None
 
-        self.__listener.remove_connection(self.__socket)
+        unregister_local_listener(self.__port, self)
+        if self.__server is not None:
+            if self.__server.done() and not self.__server.cancelled() and self.__server.exception() is None:
+                self.__server.result().close()
+            else:
+                self.__server.cancel()
+
+            self.__server = None
+
+        if self.__socket is not None:
+            self.__socket.close()
+            self.__socket = None
+
+
+# the network backend the connectors and listeners are built on, the asyncio backend
+# implements them in pure python on asyncio's event loop rather than with panda's
+# connection classes, everything using them is none the wiser...
+NETWORK_BACKEND_PANDA = 'panda'
+NETWORK_BACKEND_ASYNCIO = 'asyncio'
+
+network_backend = config.GetString('net-backend', NETWORK_BACKEND_PANDA)
+if network_backend == NETWORK_BACKEND_ASYNCIO:
+    NetworkDatagram = aio.NetworkDatagram
+    NetworkDatagramIterator = aio.NetworkDatagramIterator
+    NetworkConnector = AsyncNetworkConnector
+    NetworkListener = AsyncNetworkListener
+elif network_backend != NETWORK_BACKEND_PANDA:
+    notify.new_category('NetworkManager').warning('Unknown network backend: %s, falling back to panda!' % (
+        network_backend))
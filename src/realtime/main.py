@@ -4,8 +4,12 @@
  * Licensing information can found in 'LICENSE', which is part of this source code package.
 """
 
+import argparse
 import builtins
 import os
+import subprocess
+import sys
+import time
 
 from panda3d.core import *
 from pandac.PandaModules import get_config_showbase
@@ -13,6 +17,16 @@ from pandac.PandaModules import get_config_showbase
 if os.path.exists('$OTP_SERVER/config/general.prc'):
     loadPrcFile('$OTP_SERVER/config/general.prc')
 
+parser = argparse.ArgumentParser()
+parser.add_argument('prc_filenames', nargs='*')
+parser.add_argument('--messagedirector-worker', type=int, default=0)
+arguments = parser.parse_args()
+
+# any additional config files passed on the command line are loaded
+# on top of the general config, to override it for this process...
+for prc_filename in arguments.prc_filenames:
+    loadPrcFile(prc_filename)
+
 from direct.task.TaskManagerGlobal import taskMgr as task_mgr
 
 from otp_server.realtime.notifier import notify
@@ -21,7 +35,7 @@ builtins.config = get_config_showbase()
 builtins.task_mgr = task_mgr
 builtins.vfs = VirtualFileSystem.get_global_ptr()
 
-from otp_server.realtime import io, types, clientagent, messagedirector, stateserver, database
+from otp_server.realtime import aio, io, types, clientagent, messagedirector, stateserver, database
 
 notify = notify.new_category('Main')
 
@@ -43,7 +57,147 @@ def shutdown_component(component):
     component.shutdown()
 
 
+def setup_event_loop():
+    # the selector loop sleeps until a connection is readable instead of running
+    # frames back to back, it needs to watch every connection as it's set up. When
+    # panda's own threads read the sockets it wakes up at an interval instead...
+    event_loop = config.GetString('net-event-loop', 'task-manager')
+    if io.network_backend == io.NETWORK_BACKEND_ASYNCIO:
+        # the asyncio backend is always run on asyncio's own event loop...
+        aio.install_event_loop()
+    elif event_loop == 'selector':
+        io.install_network_selector(config.GetBool('net-want-threads', False))
+    elif event_loop != 'task-manager':
+        notify.warning('Unknown event loop: %s, falling back to the task manager!' % event_loop)
+
+
+def get_idle_timeout(components, idle_timeout):
+    """
+    Returns how long the event loop may sleep for, until the next task is due to wake
+    up or the soonest of the components' deadlines, at most the idle timeout
+    """
+
+    timeout = idle_timeout
+    wake_time = task_mgr.mgr.get_next_wake_time()
+    if wake_time >= 0:
+        timeout = min(timeout, wake_time - task_mgr.globalClock.get_real_time())
+
+    timestamp = time.monotonic()
+    for component in components:
+        deadline = component.get_next_deadline()
+        if deadline is not None:
+            timeout = min(timeout, deadline - timestamp)
+
+    return max(0.0, timeout)
+
+
+def run_event_loop(components):
+    idle_timeout = config.GetFloat('net-selector-idle-timeout', 1.0)
+    if io.network_backend == io.NETWORK_BACKEND_ASYNCIO:
+        aio.run_event_loop(components, lambda: get_idle_timeout(components, idle_timeout))
+        return
+
+    selector = io.network_selector
+    if selector is None:
+        task_mgr.run()
+        return
+
+    # run a frame, then unless any component still has work waiting, sleep until a
+    # connection is readable or the next task or deadline is due, whichever is first...
+    task_mgr.running = True
+    try:
+        while task_mgr.running:
+            task_mgr.step()
+            if any(component.has_pending_work() for component in components):
+                continue
+
+            timeout = get_idle_timeout(components, idle_timeout)
+            if timeout > 0:
+                selector.select(timeout)
+    except KeyboardInterrupt:
+        task_mgr.stop()
+
+
+def spawn_message_director_workers(worker_count):
+    # the workers are started the same way we were, with the same config
+    # files, but each of them only runs it's own message director...
+    if __spec__ is not None:
+        command = [sys.executable, '-m', __spec__.name]
+    else:
+        command = [sys.executable, os.path.abspath(sys.argv[0])]
+
+    workers = []
+    for worker_index in range(1, worker_count):
+        notify.info('Starting message director worker: %d...' % worker_index)
+        workers.append(subprocess.Popen(command + arguments.prc_filenames + [
+            '--messagedirector-worker', str(worker_index)]))
+
+    return workers
+
+
+def shutdown_message_director_workers(workers):
+    for worker in workers:
+        worker.terminate()
+
+    for worker in workers:
+        worker.wait()
+
+
+def check_listening_ports(worker_count):
+    """
+    Returns True if none of the ports the components are to listen on collide, else False
+    """
+
+    ports = []
+    if config.GetBool('want-message-director', True):
+        ports.append(('messagedirector-port', config.GetInt('messagedirector-port', 6666)))
+
+        admin_port = config.GetInt('messagedirector-admin-port', 0)
+        if admin_port:
+            ports.extend(('messagedirector-admin-port', admin_port + worker_index)
+                         for worker_index in range(worker_count))
+
+        if worker_count > 1:
+            worker_port = config.GetInt('messagedirector-worker-port-base', 6680)
+            ports.extend(('messagedirector-worker-port-base', worker_port + worker_index)
+                         for worker_index in range(worker_count))
+
+    if config.GetBool('want-client-agent', True):
+        ports.append(('clientagent-port', config.GetInt('clientagent-port', 6667)))
+
+    # a collision would otherwise only show up as a bind
+    # failure in whichever component was started last...
+    names = {}
+    for name, port in ports:
+        if port in names:
+            notify.error('Port: %d of %s collides with %s!' % (port, name, names[port]))
+            return False
+
+        names[port] = name
+
+    return True
+
+
+def run_message_director_worker(worker_index, worker_count):
+    setup_event_loop()
+    message_director = setup_component(messagedirector.MessageDirector,
+                                       config.GetString('messagedirector-address', '0.0.0.0'),
+                                       config.GetInt('messagedirector-port', 6666),
+                                       worker_index, worker_count)
+
+    run_event_loop([message_director])
+    shutdown_component(message_director)
+
+
 def main():
+    message_director_workers = config.GetInt('messagedirector-workers', 1)
+    if arguments.messagedirector_worker:
+        run_message_director_worker(arguments.messagedirector_worker, message_director_workers)
+        return
+
+    if not check_listening_ports(message_director_workers):
+        return
+
     dc_loader = io.NetworkDCLoader()
     dc_loader.read_dc_files(['otp.dc', 'toon.dc'])
 
@@ -64,25 +218,38 @@ def main():
     database_connect_port = config.GetInt('database-connect-port', message_director_port)
     database_channel = config.GetInt('database-channel', types.DBSERVER_ID)
 
-    message_director = setup_component(messagedirector.MessageDirector, message_director_address,
-                                       message_director_port)
+    # each component can be turned off, so that for example several message
+    # directors linked to one another can be run as separate processes...
+    setup_event_loop()
 
-    client_agent = setup_component(clientagent.ClientAgent, dc_loader, client_agent_address,
-                                   client_agent_port, client_agent_connect_address, client_agent_connect_port,
-                                   client_agent_channel)
+    components = []
+    workers = []
+    if config.GetBool('want-message-director', True):
+        if message_director_workers > 1:
+            workers = spawn_message_director_workers(message_director_workers)
 
-    state_server = setup_component(stateserver.StateServer, dc_loader, state_server_connect_address,
-                                   state_server_connect_port, state_server_channel)
+        components.append(setup_component(messagedirector.MessageDirector, message_director_address,
+                                          message_director_port, 0, message_director_workers))
 
-    database_server = setup_component(database.DatabaseServer, dc_loader, database_connect_address,
-                                      database_connect_port, database_channel)
+    if config.GetBool('want-client-agent', True):
+        components.append(setup_component(clientagent.ClientAgent, dc_loader, client_agent_address,
+                                          client_agent_port, client_agent_connect_address, client_agent_connect_port,
+                                          client_agent_channel))
 
-    task_mgr.run()
+    if config.GetBool('want-state-server', True):
+        components.append(setup_component(stateserver.StateServer, dc_loader, state_server_connect_address,
+                                          state_server_connect_port, state_server_channel))
 
-    shutdown_component(message_director)
-    shutdown_component(client_agent)
-    shutdown_component(state_server)
-    shutdown_component(database_server)
+    if config.GetBool('want-database-server', True):
+        components.append(setup_component(database.DatabaseServer, dc_loader, database_connect_address,
+                                          database_connect_port, database_channel))
+
+    run_event_loop(components)
+
+    for component in components:
+        shutdown_component(component)
+
+    shutdown_message_director_workers(workers)
 
 
 main()
@@ -5,22 +5,130 @@
  * Licensing information can found in 'LICENSE', which is part of this source code package.
 """
 
+import bisect
 import collections
+import json
+import signal
+import socket
+import struct
 import time
 
-from panda3d.core import *
-
 from otp_server.realtime import io
 from otp_server.realtime import types
 from otp_server.realtime.notifier import notify
 
 
+# the length prefix of each post remove held in a channel's post remove buffer...
+POST_REMOVE_LENGTH = struct.Struct('<H')
+
+# the layout of a routed message's header, a channel count followed by
+# that many channels, then the sender and the message type...
+MESSAGE_CHANNEL = struct.Struct('<Q')
+MESSAGE_SENDER_TYPE = struct.Struct('<QH')
+
+# the collect interval of a coalescing participant's connection, long enough that panda
+# never flushes by itself and everything is written by the flush after a routing pass...
+COLLECT_TCP_INTERVAL = 3600.0
+
+# the connection name a message director worker gives it's links to the other
+# workers, followed by it's worker index, so they can tell it's not a participant...
+PEER_CONNECTION_NAME = 'MessageDirectorPeer'
+
+# a capture file starts with it's magic, then holds a record for each connection
+# made, frame received and connection lost, each followed by the frame if any...
+CAPTURE_MAGIC = b'OTPMDCAP\x01'
+CAPTURE_RECORD = struct.Struct('<dIBI')
+
+CAPTURE_CONNECTED = 0
+CAPTURE_FRAME = 1
+CAPTURE_DISCONNECTED = 2
+
+
+def get_channels_datagram(datagram, channels, subset, sender, message_type):
+    """
+    Returns the message addressed to only the subset of it's channels,
+    the message itself is returned if the subset contains all of them
+    """
+
+    if len(subset) == len(channels):
+        return datagram
+
+    header_size = 1 + len(channels) * MESSAGE_CHANNEL.size + MESSAGE_SENDER_TYPE.size
+
+    subset_datagram = io.NetworkDatagram()
+    subset_datagram.add_multi_header(subset, sender, message_type)
+    subset_datagram.append_data(datagram.get_message()[header_size:])
+    return subset_datagram
+
+
 class MessageError(RuntimeError):
     """
     An message director specific runtime error
     """
 
 
+class MessageCapture(object):
+    """
+    Appends every frame the message director receives to a capture file,
+    along with when and from which connection it was received...
+    """
+
+    notify = notify.new_category('MessageCapture')
+
+    def __init__(self, filename):
+        self._filename = filename
+        self._file = None
+        self._connection_ids = 0
+
+    @property
+    def filename(self):
+        return self._filename
+
+    def setup(self):
+        self._file = open(self._filename, 'ab')
+        if not self._file.tell():
+            self._file.write(CAPTURE_MAGIC)
+
+        self.notify.info('Capturing incoming frames to: %s.' % self._filename)
+
+    def allocate_connection_id(self):
+        self._connection_ids += 1
+        return self._connection_ids
+
+    def record(self, connection_id, kind, data=b''):
+        self._file.write(CAPTURE_RECORD.pack(time.time(), connection_id, kind, len(data)))
+        if data:
+            self._file.write(data)
+
+    def shutdown(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def read_capture(filename):
+    """
+    Yields each record of a capture file as a tuple of it's
+    timestamp, connection id, kind and frame
+    """
+
+    with open(filename, 'rb') as capture_file:
+        if capture_file.read(len(CAPTURE_MAGIC)) != CAPTURE_MAGIC:
+            raise MessageError('Failed to read capture: %s, unknown file format!' % filename)
+
+        while True:
+            header = capture_file.read(CAPTURE_RECORD.size)
+            if len(header) < CAPTURE_RECORD.size:
+                break
+
+            timestamp, connection_id, kind, length = CAPTURE_RECORD.unpack(header)
+            data = capture_file.read(length)
+            if len(data) < length:
+                break
+
+            yield timestamp, connection_id, kind, data
+
+
 class Participant(io.NetworkHandler):
     notify = notify.new_category('Participant')
 
@@ -29,7 +137,279 @@ class Participant(io.NetworkHandler):
 
         self.connectionName = ""
         self.connectionURL = ""
-        self.connectionHosts = []
+        self.connectionHosts = set()
+        self.connectionRanges = []
+
+        # the channels we've added post removes for, a channel covered by one of
+        # our ranges has post removes without ever being one of our hosts...
+        self.connectionPostRemoves = set()
+
+        self._send_queue = collections.deque()
+        self._send_queue_timestamp = 0
+        self._send_queue_bytes = 0
+        self._send_queue_peak_bytes = 0
+        self._send_stalled = False
+        self._send_unflushed = False
+        self._evicted = False
+
+        # the connection is checked for room once each routing pass,
+        # then handed no more than it's allowance until the next pass...
+        self._write_pass = 0
+        self._write_allowance = 0
+        self._write_blocked = False
+
+        self._sent_datagrams = 0
+        self._dropped_datagrams = 0
+        self._send_stalls = 0
+
+        self._capture_id = 0
+        self._participant_id = 0
+
+    @property
+    def participant_id(self):
+        return self._participant_id
+
+    @property
+    def is_peer(self):
+        return self.connectionName.startswith(PEER_CONNECTION_NAME)
+
+    @property
+    def send_queue(self):
+        return self._send_queue
+
+    @property
+    def send_queue_timestamp(self):
+        return self._send_queue_timestamp
+
+    @property
+    def send_queue_bytes(self):
+        return self._send_queue_bytes
+
+    @property
+    def send_stalled(self):
+        return self._send_stalled
+
+    @property
+    def evicted(self):
+        return self._evicted
+
+    def get_send_queue_stats(self):
+        return {
+            'name': self.connectionName,
+            'address': str(self.address),
+            'queued_datagrams': len(self._send_queue),
+            'queued_bytes': self._send_queue_bytes,
+            'peak_queued_bytes': self._send_queue_peak_bytes,
+            'sent_datagrams': self._sent_datagrams,
+            'dropped_datagrams': self._dropped_datagrams,
+            'send_stalls': self._send_stalls,
+            'stalled': self._send_stalled,
+            'evicted': self._evicted,
+        }
+
+    def setup(self):
+        io.NetworkHandler.setup(self)
+        self._participant_id = self.network.message_interface.allocate_participant_id()
+
+        capture = self.network.capture
+        if capture is not None:
+            self._capture_id = capture.allocate_connection_id()
+            capture.record(self._capture_id, CAPTURE_CONNECTED)
+
+        # when coalescing writes, have the connection collect the datagrams we send
+        # into one TCP write instead of writing each one immediately. Panda is never
+        # left to flush them by itself, they are written by our own flush instead...
+        message_interface = self.network.message_interface
+        if message_interface.write_batch_size:
+            self.connection.set_collect_tcp(True)
+            self.connection.set_collect_tcp_interval(COLLECT_TCP_INTERVAL)
+
+    def handle_send_datagram(self, datagram):
+        if self._evicted:
+            return
+
+        # nothing is waiting ahead of this datagram, so unless we are
+        # coalescing writes, try to write it out straight away...
+        message_interface = self.network.message_interface
+        if not message_interface.write_batch_size and not self._send_queue:
+            if self.is_writable() and io.NetworkHandler.handle_send_datagram(self, datagram):
+                self.spend_write_allowance(datagram)
+                self._sent_datagrams += 1
+                return
+
+            # a connection which refused the datagram or whose socket is full is stalled,
+            # one which has only used up it's allowance for this pass isn't...
+            if self._write_allowance or self._write_blocked:
+                self._send_stalls += 1
+                self._send_stalled = True
+
+        if not self._send_queue:
+            self._send_queue_timestamp = message_interface.get_timestamp()
+            message_interface.add_pending_participant(self)
+
+        self._send_queue.append(datagram)
+        self._send_queue_bytes += datagram.get_length()
+        self._send_queue_peak_bytes = max(self._send_queue_peak_bytes, self._send_queue_bytes)
+
+        if self._send_queue_bytes > message_interface.send_queue_high_watermark:
+            self.handle_send_queue_overflow()
+            return
+
+        if message_interface.write_batch_size and len(self._send_queue) >= message_interface.write_batch_size:
+            self.flush_send_queue()
+
+    def is_writable(self):
+        """
+        Returns True if our connection can be handed more datagrams this routing pass else False
+        """
+
+        write_pass = self.network.message_interface.write_pass
+        if self._write_pass != write_pass:
+            self._write_pass = write_pass
+            self._write_allowance = self.get_write_allowance()
+            self._write_blocked = self._write_allowance == 0
+
+        return self._write_allowance != 0
+
+    def spend_write_allowance(self, datagram):
+        if self._write_allowance > 0:
+            self._write_allowance = max(0, self._write_allowance - datagram.get_length())
+
+    def flush_send_queue(self):
+        """
+        Writes out as much of our send queue as the connection will accept, returns
+        True if the queue has been completely drained and written by the connection
+        """
+
+        # a connection which isn't draining it's socket isn't handed anything more,
+        # what's queued is held onto and counts against our watermarks instead...
+        if not self.is_writable():
+            if self._write_blocked and (self._send_queue or self._send_unflushed) and not self._send_stalled:
+                self._send_stalls += 1
+                self._send_stalled = True
+
+            return not self._send_queue and not self._send_unflushed
+
+        # whatever is left over once our allowance is spent is written on the
+        # next pass, the connection isn't stalled just because it's used up...
+        sent = False
+        while self._send_queue and self._write_allowance:
+            datagram = self._send_queue[0]
+            if not io.NetworkHandler.handle_send_datagram(self, datagram):
+                # the connection isn't accepting any more data, hold onto the rest
+                # of our queue until the next routing pass...
+                if not self._send_stalled:
+                    self._send_stalls += 1
+                    self._send_stalled = True
+
+                break
+
+            self._send_queue.popleft()
+            self._send_queue_bytes -= datagram.get_length()
+            self._sent_datagrams += 1
+            self.spend_write_allowance(datagram)
+            sent = True
+
+        if sent:
+            self._send_unflushed = True
+            if not self.flush_connection() and not self._send_stalled:
+                self._send_stalls += 1
+
+            self._send_stalled = bool(self._send_queue) and self._write_allowance != 0
+        else:
+            self.flush_connection()
+
+        return not self._send_queue and not self._send_unflushed
+
+    def flush_connection(self):
+        """
+        Writes out whatever the connection has collected of the datagrams we sent it,
+        returns False if the connection couldn't write all of it
+        """
+
+        if not self._send_unflushed:
+            return True
+
+        # what the connection collected was handed to it within our allowance,
+        # with writer threads the datagrams may not have reached the connection
+        # yet, we keep flushing on each pass until the writers have caught up...
+        flushed = self.connection.flush()
+        self._send_unflushed = not flushed or self.network.has_queued_writes()
+        return flushed
+
+    def get_datagram_message_type(self, datagram):
+        di = io.NetworkDatagramIterator(datagram)
+        di.skip_bytes(di.get_uint8() * 8 + 8)
+        return di.get_uint16()
+
+    def drop_send_queue_head(self, low_watermark):
+        while self._send_queue and self._send_queue_bytes > low_watermark:
+            datagram = self._send_queue.popleft()
+            self._send_queue_bytes -= datagram.get_length()
+            self._dropped_datagrams += 1
+
+    def drop_send_queue_types(self, message_types, low_watermark):
+        send_queue = collections.deque()
+        for datagram in self._send_queue:
+            if self._send_queue_bytes > low_watermark and \
+                    self.get_datagram_message_type(datagram) in message_types:
+                self._send_queue_bytes -= datagram.get_length()
+                self._dropped_datagrams += 1
+                continue
+
+            send_queue.append(datagram)
+
+        self._send_queue = send_queue
+
+    def handle_send_queue_overflow(self):
+        message_interface = self.network.message_interface
+        policy = message_interface.send_queue_overflow_policy
+
+        self.notify.warning('Send queue for participant: %s overflowed with %d bytes queued, applying policy: %s!' % (
+            self.connectionName or self.address, self._send_queue_bytes, policy))
+
+        if policy == MessageInterface.OVERFLOW_POLICY_DISCONNECT:
+            self.handle_evict()
+            return
+
+        # drop the message types we can afford to lose first, if that isn't
+        # enough, fall back to dropping the oldest messages in our queue...
+        if policy == MessageInterface.OVERFLOW_POLICY_DROP_TYPE:
+            self.drop_send_queue_types(message_interface.send_queue_droppable_types,
+                                       message_interface.send_queue_low_watermark)
+
+        self.drop_send_queue_head(message_interface.send_queue_low_watermark)
+
+    def handle_evict(self):
+        """
+        Disconnects a participant which can no longer keep up with the messages routed to it
+        """
+
+        self._evicted = True
+        self._dropped_datagrams += len(self._send_queue)
+        self._send_queue.clear()
+        self._send_queue_bytes = 0
+
+        self.network.message_interface.remove_pending_participant(self)
+        self.network.message_interface.handle_participant_evicted(self)
+        self.handle_disconnect()
+
+    def handle_incoming_data(self, datagram):
+        capture = self.network.capture
+        if capture is not None:
+            capture.record(self._capture_id, CAPTURE_FRAME, datagram.get_message())
+
+        # when routing immediately there is no reason to wait for our update task,
+        # route the datagram in the same pass it was read from the connection...
+        if not self.network.message_interface.route_immediately:
+            io.NetworkHandler.handle_incoming_data(self, datagram)
+            return
+
+        di = io.NetworkDatagramIterator(datagram)
+        if not di.get_remaining_size():
+            return
+
+        self.handle_datagram(di)
 
     def handle_datagram(self, di):
         channelCount = di.get_uint8()
@@ -47,8 +427,14 @@ class Participant(io.NetworkHandler):
         sender = di.get_uint64()
         message_type = di.get_uint16()
 
-        self.network.message_interface.append_handle(channel, sender, message_type,
-                                                     io.NetworkDatagram(Datagram(di.get_remaining_bytes())))
+        if not di.get_remaining_size():
+            self.notify.warning('Received message from sender: %d to channels: %r with no payload!' % (
+                sender, channels))
+
+        # the received frame is already laid out exactly as it will be sent
+        # to each of the subscribers, so it is routed as-is without being copied...
+        self.network.message_interface.append_handle(channels, sender, message_type,
+                                                     di.get_network_datagram())
 
     def handle_control_message(self, di):
         message_type = di.get_uint16()
@@ -65,82 +451,376 @@ class Participant(io.NetworkHandler):
         sender = di.get_uint64()
 
         if message_type == types.CONTROL_SET_CHANNEL:
-            if not sender in self.connectionHosts:
-                self.connectionHosts.append(sender)
+            self.connectionHosts.add(sender)
             self.network.interface.add_participant(sender, self)
+            self.network.message_interface.flush_parked_handles(sender)
         elif message_type == types.CONTROL_REMOVE_CHANNEL:
-            self.network.message_interface.flush_post_handles(sender)
-            self.network.interface.remove_participant(sender)
+            self.network.message_interface.flush_post_handles(sender, self)
+            self.connectionPostRemoves.discard(sender)
+            self.connectionHosts.discard(sender)
+            self.network.interface.remove_participant(sender, self)
         elif message_type == types.CONTROL_ADD_RANGE:
-            pass
+            # the range is inclusive, the low channel takes the place of
+            # the sender and is followed by the high channel...
+            channel_range = (sender, di.get_uint64())
+            if channel_range not in self.connectionRanges:
+                self.connectionRanges.append(channel_range)
+
+            self.network.interface.add_range(channel_range[0], channel_range[1], self)
+            self.network.message_interface.flush_parked_range(channel_range[0], channel_range[1])
         elif message_type == types.CONTROL_REMOVE_RANGE:
-            pass
+            channel_range = (sender, di.get_uint64())
+            if channel_range in self.connectionRanges:
+                self.connectionRanges.remove(channel_range)
+
+            self.network.interface.remove_range(channel_range[0], channel_range[1], self)
         elif message_type == types.CONTROL_ADD_POST_REMOVE:
-            self.network.message_interface.append_post_handle(sender,
-                                                              io.NetworkDatagram(Datagram(di.get_remaining_bytes())))
+            self.connectionPostRemoves.add(sender)
+            self.network.message_interface.append_post_handle(sender, di.get_remaining_bytes())
         elif message_type == types.CONTROL_CLEAR_POST_REMOVE:
+            self.connectionPostRemoves.discard(sender)
             self.network.message_interface.clear_post_handles(sender)
         else:
             self.notify.warning('Failed to handle unknown datagram with message type: %d!' % message_type)
 
     def handle_disconnected(self):
-        for host in self.connectionHosts:
-            self.network.message_interface.flush_post_handles(host)
-            self.network.interface.remove_participant(host)
-        io.NetworkHandler.handle_disconnected(self)
+        for channel in list(self.connectionPostRemoves - self.connectionHosts):
+            self.network.message_interface.flush_post_handles(channel, self)
+
+        for host in list(self.connectionHosts):
+            self.network.message_interface.flush_post_handles(host, self)
+            self.network.interface.remove_participant(host, self)
+
+        for low, high in self.connectionRanges:
+            self.network.interface.remove_range(low, high, self)
+
+        self.connectionHosts.clear()
+        self.connectionRanges = []
+        self.connectionPostRemoves.clear()
+
+        capture = self.network.capture
+        if capture is not None:
+            capture.record(self._capture_id, CAPTURE_DISCONNECTED)
+
+        # a participant has no channel of it's own registered with a message
+        # director, there is nothing to unregister before it's removed...
+        self.network.handle_disconnected(self)
 
     def shutdown(self):
         self.allocated_channel = 0
         self.connectionName = ""
         self.connectionURL = ""
-        self.connectionHosts = []
+        self.connectionHosts = set()
+        self.connectionRanges = []
+        self.connectionPostRemoves = set()
+        self._send_queue.clear()
+        self._send_queue_bytes = 0
+        self.network.message_interface.remove_pending_participant(self)
         io.NetworkHandler.shutdown(self)
 
 
+class ChannelRangeIndex(object):
+    """
+    An index of channel range subscriptions, kept as a sorted list of
+    disjoint intervals each holding the participants subscribed to it.
+    Looking up the subscribers of a channel is a binary search...
+    """
+
+    def __init__(self):
+        # interval i begins at self._bounds[i] and spans up to, but not including
+        # the beginning of interval i + 1. Each interval counts how many of a
+        # participant's ranges cover it, so that overlapping ranges can be removed
+        # one at a time...
+        self._bounds = []
+        self._participants = []
+
+    def __len__(self):
+        return len(self._bounds)
+
+    def __split(self, channel):
+        index = bisect.bisect_left(self._bounds, channel)
+        if index < len(self._bounds) and self._bounds[index] == channel:
+            return index
+
+        # the new interval begins with the subscribers of
+        # the interval it was split off from...
+        participants = dict(self._participants[index - 1]) if index else {}
+        self._bounds.insert(index, channel)
+        self._participants.insert(index, participants)
+        return index
+
+    def __merge(self):
+        # intervals with no subscribers before the first subscribed
+        # interval are implied and do not need to be stored...
+        while self._participants and not self._participants[0]:
+            del self._bounds[0]
+            del self._participants[0]
+
+        index = 1
+        while index < len(self._bounds):
+            if self._participants[index] == self._participants[index - 1]:
+                del self._bounds[index]
+                del self._participants[index]
+            else:
+                index += 1
+
+    def add_range(self, low, high, participant):
+        start = self.__split(low)
+        stop = self.__split(high + 1)
+        for index in range(start, stop):
+            participants = self._participants[index]
+            participants[participant] = participants.get(participant, 0) + 1
+
+        self.__merge()
+
+    def remove_range(self, low, high, participant):
+        start = self.__split(low)
+        stop = self.__split(high + 1)
+        for index in range(start, stop):
+            participants = self._participants[index]
+            count = participants.get(participant, 0)
+            if count > 1:
+                participants[participant] = count - 1
+            elif count:
+                del participants[participant]
+
+        self.__merge()
+
+    def get_participants(self, channel):
+        index = bisect.bisect_right(self._bounds, channel) - 1
+        if index < 0:
+            return ()
+
+        return self._participants[index].keys()
+
+
 class ParticipantInterface(object):
+    """
+    The routing table of the message director, maps each channel to the
+    set of participants which are subscribed to that channel...
+    """
+
     notify = notify.new_category('ParticipantInterface')
 
     def __init__(self, network):
         self._network = network
         self._participants = {}
+        self._ranges = ChannelRangeIndex()
+
+        # the participants subscribed to each range, so that a range subscribed
+        # to twice by the same participant is only counted the once...
+        self._range_participants = {}
 
     @property
     def participants(self):
         return self._participants
 
+    @property
+    def ranges(self):
+        return self._ranges
+
     def has_participant(self, channel):
         return channel in self._participants
 
     def add_participant(self, channel, participant):
-        if self.has_participant(channel):
-            self.notify.debug('Failed to add participant with channel: %d, participant already exists!' % channel)
+        participants = self._participants.get(channel)
+        if participants is None:
+            participants = self._participants[channel] = set()
+            self._network.handle_channel_subscribed(channel)
+
+        if participant in participants:
+            self.notify.debug('Failed to add participant with channel: %d, participant already subscribed!' % channel)
+            return
+
+        participants.add(participant)
+
+    def remove_participant(self, channel, participant):
+        participants = self._participants.get(channel)
+        if not participants or participant not in participants:
+            self.notify.debug('Failed to remove participant with channel: %d, participant not subscribed!' % channel)
+            return
+
+        participants.remove(participant)
+        if not participants:
+            del self._participants[channel]
+            self._network.handle_channel_unsubscribed(channel)
+
+    def add_range(self, low, high, participant):
+        if low > high:
+            self.notify.debug('Failed to add range: %d-%d, invalid range!' % (low, high))
+            return
+
+        participants = self._range_participants.get((low, high))
+        if participants is None:
+            participants = self._range_participants[(low, high)] = set()
+
+        if participant in participants:
+            self.notify.debug('Failed to add range: %d-%d, participant already subscribed!' % (low, high))
             return
 
-        self._participants[channel] = participant
+        participants.add(participant)
+        self._ranges.add_range(low, high, participant)
+        self._network.handle_range_subscribed(low, high, participant)
 
-    def remove_participant(self, channel):
-        if not self.has_participant(channel):
-            self.notify.debug('Failed to remove participant with channel: %d, participant does not exist!' % channel)
+    def remove_range(self, low, high, participant):
+        participants = self._range_participants.get((low, high))
+        if not participants or participant not in participants:
+            self.notify.debug('Failed to remove range: %d-%d, participant not subscribed!' % (low, high))
             return
 
-        del self._participants[channel]
+        participants.remove(participant)
+        if not participants:
+            del self._range_participants[(low, high)]
+
+        self._ranges.remove_range(low, high, participant)
+        self._network.handle_range_unsubscribed(low, high, participant)
+
+    def get_participants(self, channel):
+        participants = self._participants.get(channel, ())
+        if not self._ranges:
+            return participants
+
+        range_participants = self._ranges.get_participants(channel)
+        if not range_participants:
+            return participants
+
+        if not participants:
+            return range_participants
+
+        return participants | range_participants
+
+    def get_participant_channels(self, channels):
+        """
+        Returns the channels each of the subscribers is subscribed to, out of the given channels
+        """
 
-    def get_participant(self, channel):
-        return self._participants.get(channel)
+        participant_channels = {}
+        for channel in channels:
+            for participant in self.get_participants(channel):
+                subscribed_channels = participant_channels.get(participant)
+                if subscribed_channels is None:
+                    participant_channels[participant] = [channel]
+                elif subscribed_channels[-1] != channel:
+                    subscribed_channels.append(channel)
+
+        return participant_channels
+
+
+class MessageRing(object):
+    """
+    A queue of messages waiting to be routed, stored as a ring of parallel
+    preallocated lists rather than as an object per message. The ring doubles
+    in size whenever it fills up...
+    """
+
+    def __init__(self, capacity=1024):
+        # the capacity is kept a power of two, so that
+        # indices wrap around with a mask...
+        capacity = 1 << max(capacity - 1, 1).bit_length()
+
+        self._mask = capacity - 1
+        self._channels = [None] * capacity
+        self._senders = [0] * capacity
+        self._message_types = [0] * capacity
+        self._datagrams = [None] * capacity
+        self._deadlines = [0.0] * capacity
+        self._sequences = [0] * capacity
+        self._slots = (self._channels, self._senders, self._message_types, self._datagrams, self._deadlines,
+                       self._sequences)
+
+        self._head = 0
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def capacity(self):
+        return self._mask + 1
+
+    @property
+    def head(self):
+        return self._head
+
+    @property
+    def head_sequence(self):
+        return self._sequences[self._head]
+
+    @property
+    def slots(self):
+        """
+        The ring's parallel lists of channels, senders, message types, datagrams, deadlines and
+        sequences, the message at the head is read from them at the head's index and then discarded...
+        """
+
+        return self._slots
+
+    def __grow(self):
+        capacity = self._mask + 1
+        head = self._head
+
+        # unroll the ring so the head is at the start of the new lists...
+        for name in ('_channels', '_senders', '_message_types', '_datagrams', '_deadlines', '_sequences'):
+            values = getattr(self, name)
+            setattr(self, name, values[head:] + values[:head] + [None] * capacity)
+
+        self._slots = (self._channels, self._senders, self._message_types, self._datagrams, self._deadlines,
+                       self._sequences)
+
+        self._mask = capacity * 2 - 1
+        self._head = 0
+
+    def append(self, channels, sender, message_type, datagram, deadline, sequence):
+        if self._size > self._mask:
+            self.__grow()
+
+        index = (self._head + self._size) & self._mask
+        self._channels[index] = channels
+        self._senders[index] = sender
+        self._message_types[index] = message_type
+        self._datagrams[index] = datagram
+        self._deadlines[index] = deadline
+        self._sequences[index] = sequence
+        self._size += 1
+
+    def discard_left(self):
+        """
+        Removes the message at the head of the ring, once it has been read from the slots
+        """
+
+        if not self._size:
+            raise IndexError('discard from an empty message ring')
+
+        # release our references to the message, the
+        # datagram is owned by whoever routes it now...
+        index = self._head
+        self._channels[index] = None
+        self._datagrams[index] = None
+
+        self._head = (index + 1) & self._mask
+        self._size -= 1
+
+    def clear(self):
+        while self._size:
+            self.discard_left()
 
 
 class MessageHandle(object):
+    """
+    A message which could not be routed yet, parked on each of it's channels
+    until one of them is registered or it's deadline passes...
+    """
 
-    def __init__(self, channel, sender, message_type, datagram, timestamp):
-        self._channel = channel
+    def __init__(self, channels, sender, message_type, datagram, deadline):
+        self._channels = channels
         self._sender = sender
         self._message_type = message_type
         self._datagram = datagram
-        self._timestamp = timestamp
+        self._deadline = deadline
 
     @property
-    def channel(self):
-        return self._channel
+    def channels(self):
+        return self._channels
 
     @property
     def sender(self):
@@ -155,89 +835,415 @@ class MessageHandle(object):
         return self._datagram
 
     @property
-    def timestamp(self):
-        return self._timestamp
+    def deadline(self):
+        return self._deadline
 
     def destroy(self):
-        self._channel = None
+        self._channels = None
         self._sender = None
         self._message_type = None
         self._datagram = None
-        self._timestamp = None
+        self._deadline = None
 
 
-class PostMessageHandle(object):
+class TimerWheel(object):
+    """
+    A hashed timer wheel, keys are scheduled into the slot of the tick
+    their deadline falls on and are handed back once that tick has passed.
+    Deadlines further away than the wheel spans are clamped to it's last slot,
+    the owner is expected to check the deadline and reschedule the key...
+    """
 
-    def __init__(self, channel, datagram):
-        self._channel = channel
-        self._datagram = datagram
+    def __init__(self, resolution, span, timestamp):
+        self._resolution = resolution
+        self._slots = [set() for _ in range(int(span / resolution) + 2)]
+        self._tick = self.get_tick(timestamp)
 
-    @property
-    def channel(self):
-        return self._channel
+    def get_tick(self, timestamp):
+        return int(timestamp / self._resolution)
 
-    @property
-    def datagram(self):
-        return self._datagram
+    def schedule(self, key, deadline):
+        tick = max(self.get_tick(deadline) + 1, self._tick + 1)
+        tick = min(tick, self._tick + len(self._slots) - 1)
+        self._slots[tick % len(self._slots)].add(key)
 
-    def destroy(self):
-        self._channel = None
-        self._datagram = None
+    def advance(self, timestamp):
+        expired = set()
+        tick = self.get_tick(timestamp)
+        while self._tick < tick:
+            self._tick += 1
+
+            slot = self._slots[self._tick % len(self._slots)]
+            if slot:
+                expired.update(slot)
+                slot.clear()
+
+        return expired
+
+    def get_next_deadline(self):
+        """
+        Returns the timestamp the soonest scheduled key is handed back at, or None if there are none
+        """
+
+        for tick in range(self._tick + 1, self._tick + len(self._slots)):
+            if self._slots[tick % len(self._slots)]:
+                return tick * self._resolution
+
+        return None
+
+
+class DeadLetterLog(object):
+    """
+    A record of the messages the message director has given up on, keeps the most
+    recent of them along with counters by message type, channel and sender...
+    """
+
+    REASON_EXPIRED = 'expired'
+    REASON_UNROUTABLE = 'unroutable'
+
+    def __init__(self, size, max_keys):
+        self._letters = collections.deque(maxlen=max(size, 1))
+        self._max_keys = max(max_keys, 1)
+        self._total = 0
+        self._reasons = collections.Counter()
+        self._message_types = collections.Counter()
+        self._channels = collections.Counter()
+        self._senders = collections.Counter()
+        self._overflowed_keys = 0
+
+    @property
+    def total(self):
+        return self._total
+
+    def __count(self, counter, key):
+        # the counters are bounded as well, once full anything
+        # not already counted is only added to the overflow...
+        if key in counter or len(counter) < self._max_keys:
+            counter[key] += 1
+        else:
+            self._overflowed_keys += 1
+
+    def record(self, channels, sender, message_type, datagram, reason):
+        self._letters.append((time.time(), reason, list(channels), sender, message_type,
+                              datagram.get_length()))
+
+        self._total += 1
+        self._reasons[reason] += 1
+        self.__count(self._message_types, message_type)
+        self.__count(self._senders, sender)
+        for channel in channels:
+            self.__count(self._channels, channel)
+
+    def get_stats(self, top=20):
+        return {
+            'total': self._total,
+            'reasons': dict(self._reasons),
+            'message_types': dict(self._message_types.most_common(top)),
+            'channels': dict(self._channels.most_common(top)),
+            'senders': dict(self._senders.most_common(top)),
+            'overflowed_keys': self._overflowed_keys,
+            'letters': [{
+                'timestamp': timestamp,
+                'reason': reason,
+                'channels': channels,
+                'sender': sender,
+                'message_type': message_type,
+                'length': length,
+            } for timestamp, reason, channels, sender, message_type, length in self._letters],
+        }
+
+    def clear(self):
+        self._letters.clear()
+        self._total = 0
+        self._reasons.clear()
+        self._message_types.clear()
+        self._channels.clear()
+        self._senders.clear()
+        self._overflowed_keys = 0
 
 
 class MessageInterface(object):
     notify = notify.new_category('MessageInterface')
 
+    ROUTING_MODE_QUEUED = 'queued'
+    ROUTING_MODE_IMMEDIATE = 'immediate'
+
+    OVERFLOW_POLICY_DROP_OLDEST = 'drop-oldest'
+    OVERFLOW_POLICY_DROP_TYPE = 'drop-type'
+    OVERFLOW_POLICY_DISCONNECT = 'disconnect'
+
+    PRIORITY_HIGH = 0
+    PRIORITY_NORMAL = 1
+    PRIORITY_BULK = 2
+
+    LANE_SCHEDULING_STRICT = 'strict'
+    LANE_SCHEDULING_WEIGHTED = 'weighted'
+
     def __init__(self, network):
         self._network = network
         self._message_timeout = config.GetFloat('messagedirector-message-timeout', 15.0)
 
-        self._messages = collections.deque()
+        # in queued mode messages are routed by the flush task on the next frame,
+        # in immediate mode they are routed as soon as they are read and only
+        # messages that cannot be delivered yet are queued...
+        self._routing_mode = config.GetString('messagedirector-routing-mode', self.ROUTING_MODE_QUEUED)
+        if self._routing_mode not in (self.ROUTING_MODE_QUEUED, self.ROUTING_MODE_IMMEDIATE):
+            self.notify.warning('Unknown routing mode: %s, falling back to: %s!' % (
+                self._routing_mode, self.ROUTING_MODE_QUEUED))
+
+            self._routing_mode = self.ROUTING_MODE_QUEUED
+
+        self._route_immediately = self._routing_mode == self.ROUTING_MODE_IMMEDIATE
+
+        # datagrams routed to a participant are accumulated during a routing pass
+        # and written out together, once the batch is full or it's oldest datagram
+        # has waited the flush interval. A batch size of zero disables coalescing...
+        self._write_batch_size = max(0, config.GetInt('messagedirector-write-batch-size', 64))
+        self._write_flush_interval = max(0.0, config.GetFloat('messagedirector-write-flush-interval', 0.0))
+        self._pending_participants = collections.OrderedDict()
+
+        # a participant whose connection isn't draining is retried at this interval,
+        # rather than the event loop spinning until it drains...
+        self._send_retry_interval = max(0.001, config.GetFloat('messagedirector-send-retry-interval', 0.01))
+
+        # each participant's send queue is bounded, once it grows past the high
+        # watermark the overflow policy is applied to bring it back under the low one...
+        self._send_queue_high_watermark = config.GetInt('messagedirector-send-queue-high-watermark', 8388608)
+        self._send_queue_low_watermark = min(config.GetInt('messagedirector-send-queue-low-watermark', 4194304),
+                                             self._send_queue_high_watermark)
+
+        self._send_queue_overflow_policy = config.GetString('messagedirector-send-queue-overflow-policy',
+                                                            self.OVERFLOW_POLICY_DISCONNECT)
+
+        if self._send_queue_overflow_policy not in (self.OVERFLOW_POLICY_DROP_OLDEST,
+                                                    self.OVERFLOW_POLICY_DROP_TYPE,
+                                                    self.OVERFLOW_POLICY_DISCONNECT):
+            self.notify.warning('Unknown send queue overflow policy: %s, falling back to: %s!' % (
+                self._send_queue_overflow_policy, self.OVERFLOW_POLICY_DISCONNECT))
+
+            self._send_queue_overflow_policy = self.OVERFLOW_POLICY_DISCONNECT
+
+        self._send_queue_droppable_types = self.get_config_message_types(
+            'messagedirector-send-queue-droppable-types', [types.STATESERVER_OBJECT_UPDATE_FIELD])
+
+        self._evicted_participants = 0
+        self._participant_ids = 0
+
+        # each routing pass is numbered, a participant checks it's connection
+        # for room once per pass rather than on every write...
+        self._write_pass = 1
+
+        # queued messages wait in one of several lanes by priority, so that latency
+        # sensitive state changes are routed ahead of bulk field updates. Messages
+        # are only reordered between lanes, never within the same lane...
+        self._message_priorities = {}
+        for message_type in self.get_config_message_types('messagedirector-bulk-types', [
+                types.STATESERVER_OBJECT_UPDATE_FIELD, types.STATESERVER_OBJECT_UPDATE_FIELD_MULTIPLE]):
+
+            self._message_priorities[message_type] = self.PRIORITY_BULK
+
+        for message_type in self.get_config_message_types('messagedirector-priority-types', [
+                types.CLIENT_AGENT_DISCONNECT, types.STATESERVER_OBJECT_SET_ZONE,
+                types.STATESERVER_OBJECT_CHANGING_LOCATION, types.STATESERVER_OBJECT_LOCATION_ACK,
+                types.CLIENT_AGENT_OPEN_CHANNEL, types.CLIENT_AGENT_CLOSE_CHANNEL, types.CHANNEL_PUPPET_ACTION]):
+
+            self._message_priorities[message_type] = self.PRIORITY_HIGH
+
+        self._lanes = [MessageRing(config.GetInt('messagedirector-lane-capacity', 1024))
+                       for _ in range(self.PRIORITY_BULK + 1)]
+
+        # with strict scheduling a lane is only served once every higher priority lane
+        # is empty, with weighted scheduling each lane is served up to it's weight in
+        # turn. The flush budget limits how many messages are routed per pass...
+        self._lane_scheduling = config.GetString('messagedirector-lane-scheduling', self.LANE_SCHEDULING_WEIGHTED)
+        if self._lane_scheduling not in (self.LANE_SCHEDULING_STRICT, self.LANE_SCHEDULING_WEIGHTED):
+            self.notify.warning('Unknown lane scheduling: %s, falling back to: %s!' % (
+                self._lane_scheduling, self.LANE_SCHEDULING_WEIGHTED))
+
+            self._lane_scheduling = self.LANE_SCHEDULING_WEIGHTED
+
+        self._lane_weights = [max(1, int(weight)) for weight in config.GetString(
+            'messagedirector-lane-weights', '8,4,1').split(',') if weight.strip()]
+
+        if len(self._lane_weights) != len(self._lanes):
+            self.notify.warning('Invalid lane weights: %r, expected one weight per lane!' % self._lane_weights)
+            self._lane_weights = [8, 4, 1]
+
+        self._flush_budget = max(0, config.GetInt('messagedirector-flush-budget', 0))
+
+        # every queued message is numbered as it arrives, the lanes are routed in that order
+        # unless there are more messages queued than the flush budget allows. Only then are
+        # lanes scheduled by priority, and even then never ahead of an earlier message from
+        # the same sender, which are tracked per sender only while there's a budget...
+        self._sequence = 0
+        self._sender_sequences = {} if self._flush_budget else None
+
         self._post_messages = {}
 
+        # messages which expire while parked are recorded as dead letters, which
+        # can be dumped to the log on SIGUSR1 or read from the admin socket...
+        self._dead_letters = DeadLetterLog(config.GetInt('messagedirector-dead-letter-size', 256),
+                                           config.GetInt('messagedirector-dead-letter-max-keys', 1024))
+
+        self._dump_requested = False
+
+        # messages which could not be routed because none of their channels had
+        # a subscriber are parked by channel until it is registered or they expire...
+        self._parked_messages = {}
+        self._timer_wheel = TimerWheel(config.GetFloat('messagedirector-timer-resolution', 0.5),
+                                       self._message_timeout, self.get_timestamp())
+
+    @property
+    def lanes(self):
+        return self._lanes
+
+    @property
+    def dead_letters(self):
+        return self._dead_letters
+
+    @property
+    def lane_scheduling(self):
+        return self._lane_scheduling
+
+    @property
+    def flush_budget(self):
+        return self._flush_budget
+
     @property
-    def messages(self):
-        return self._messages
+    def parked_messages(self):
+        return self._parked_messages
+
+    @property
+    def routing_mode(self):
+        return self._routing_mode
+
+    @property
+    def route_immediately(self):
+        return self._route_immediately
+
+    @property
+    def write_batch_size(self):
+        return self._write_batch_size
+
+    @property
+    def write_flush_interval(self):
+        return self._write_flush_interval
+
+    @property
+    def send_queue_high_watermark(self):
+        return self._send_queue_high_watermark
+
+    @property
+    def send_queue_low_watermark(self):
+        return self._send_queue_low_watermark
+
+    @property
+    def send_queue_overflow_policy(self):
+        return self._send_queue_overflow_policy
+
+    @property
+    def send_queue_droppable_types(self):
+        return self._send_queue_droppable_types
+
+    @property
+    def evicted_participants(self):
+        return self._evicted_participants
+
+    @property
+    def write_pass(self):
+        return self._write_pass
+
+    def get_config_message_types(self, name, default):
+        message_types = set()
+        for message_type in config.GetString(name, ','.join(str(value) for value in default)).split(','):
+            if message_type.strip():
+                message_types.add(int(message_type))
+
+        return message_types
+
+    def get_message_priority(self, message_type):
+        return self._message_priorities.get(message_type, self.PRIORITY_NORMAL)
+
+    def handle_participant_evicted(self, participant):
+        self._evicted_participants += 1
+
+    def get_send_queue_stats(self):
+        # participants are keyed by id, as several of them may share the same name...
+        participant_stats = {}
+        for participant in self._network.get_participants():
+            participant_stats[participant.participant_id] = participant.get_send_queue_stats()
+
+        return {
+            'evicted_participants': self._evicted_participants,
+            'participants': participant_stats,
+        }
+
+    def allocate_participant_id(self):
+        self._participant_ids += 1
+        return self._participant_ids
+
+    def add_pending_participant(self, participant):
+        self._pending_participants[participant] = None
+
+    def remove_pending_participant(self, participant):
+        self._pending_participants.pop(participant, None)
+
+    def flush_pending_participants(self):
+        if not self._pending_participants:
+            return
+
+        timestamp = self.get_timestamp()
+        for participant in list(self._pending_participants):
+            if participant.send_queue and timestamp - participant.send_queue_timestamp < self._write_flush_interval:
+                continue
+
+            # a participant which isn't draining it's connection keeps whatever
+            # is left of it's queue, or still to be flushed, pending until the next pass...
+            if participant.flush_send_queue():
+                del self._pending_participants[participant]
 
     @property
     def post_messages(self):
         return self._post_messages
 
     def get_timestamp(self):
-        return round(time.time(), 2)
+        return time.monotonic()
 
-    def append_handle(self, channel, sender, message_type, datagram):
-        if not datagram.get_length():
-            self.notify.warning(
-                'Failed to append messenger handle from sender: %d to channel: %d, invalid datagram!' % (
-                sender, channel))
-            # return
+    def get_deadline(self):
+        return time.monotonic() + self._message_timeout
 
-        message_handle = MessageHandle(channel, sender, message_type, datagram, self.get_timestamp())
+    def append_handle(self, channels, sender, message_type, datagram):
+        if not self._route_immediately:
+            self._sequence += 1
+            self._lanes[self._message_priorities.get(message_type, self.PRIORITY_NORMAL)].append(
+                channels, sender, message_type, datagram, self.get_deadline(), self._sequence)
 
-        self._messages.append(message_handle)
+            sender_sequences = self._sender_sequences
+            if sender_sequences is not None:
+                sequences = sender_sequences.get(sender)
+                if sequences is None:
+                    sequences = sender_sequences[sender] = collections.deque()
 
-    def remove_handle(self, message_handle):
-        if not isinstance(message_handle, MessageHandle):
-            raise MessageError('Failed to remove message handle of invalid type: %r!' % message_handle)
+                sequences.append(self._sequence)
 
-        self._messages.remove(message_handle)
-
-    def append_post_handle(self, channel, datagram):
-        message_handle = PostMessageHandle(channel, datagram)
-        messages = self._post_messages.setdefault(channel, collections.deque())
-        messages.append(message_handle)
+            return
 
-    def remove_post_handle(self, message_handle):
-        if not isinstance(message_handle, PostMessageHandle):
-            raise MessageError('Failed to remove post message handle of invalid type: %r!' % message_handle)
+        if not self.route_message(channels, sender, message_type, datagram):
+            self.park_handle(MessageHandle(channels, sender, message_type, datagram, self.get_deadline()))
 
-        messages = self._post_messages.get(message_handle.channel)
-        if not messages:
-            self.notify.debug('Failed to remove post message handle, unknown channel: %d!' % channel)
+    def append_post_handle(self, channel, data):
+        # post removes are stored as a single contiguous buffer per channel,
+        # each message prefixed by it's length, rather than an object per message...
+        if len(data) > 0xffff:
+            self.notify.warning('Failed to append post remove for channel: %d, message too large!' % channel)
             return
 
-        messages.remove(message_handle)
+        messages = self._post_messages.get(channel)
+        if messages is None:
+            messages = self._post_messages[channel] = bytearray()
+
+        messages += POST_REMOVE_LENGTH.pack(len(data))
+        messages += data
 
     def clear_post_handles(self, channel):
         messages = self._post_messages.get(channel)
@@ -247,111 +1253,721 @@ class MessageInterface(object):
 
         del self._post_messages[channel]
 
+    def has_pending_work(self):
+        if any(self._lanes):
+            return True
+
+        # a participant's queue is only work for the next frame once it is due to be
+        # written, a participant which is stalled waits for it's retry deadline instead...
+        timestamp = self.get_timestamp()
+        for participant in self._pending_participants:
+            if participant.send_queue and not participant.send_stalled and \
+                    timestamp - participant.send_queue_timestamp >= self._write_flush_interval:
+                return True
+
+        return False
+
+    def get_next_deadline(self):
+        """
+        Returns the timestamp by which we next need to route, or None if there is nothing waiting
+        """
+
+        deadline = self._timer_wheel.get_next_deadline()
+        if not self._pending_participants:
+            return deadline
+
+        timestamp = self.get_timestamp()
+        for participant in self._pending_participants:
+            if participant.send_queue and not participant.send_stalled:
+                participant_deadline = participant.send_queue_timestamp + self._write_flush_interval
+            else:
+                participant_deadline = timestamp + self._send_retry_interval
+
+            if deadline is None or participant_deadline < deadline:
+                deadline = participant_deadline
+
+        return deadline
+
+    def get_stats(self):
+        return {
+            'queued_messages': [len(lane) for lane in self._lanes],
+            'parked_channels': len(self._parked_messages),
+            'dead_letters': self._dead_letters.get_stats(),
+            'send_queues': self.get_send_queue_stats(),
+        }
+
+    def dump_dead_letters(self):
+        self.notify.info('Dead letters: %s' % json.dumps(self._dead_letters.get_stats(), sort_keys=True))
+
+    def __handle_dump_signal(self, signum, frame):
+        # the dump itself is left to the next routing pass,
+        # rather than done from within the signal handler...
+        self._dump_requested = True
+        io.wake_network_selector()
+
     def setup(self):
+        if hasattr(signal, 'SIGUSR1'):
+            signal.signal(signal.SIGUSR1, self.__handle_dump_signal)
+
         self.__flush_task = task_mgr.add(self.__flush, self._network.get_unique_name('flush-queue'))
 
     def __flush(self, task):
-        # check to see if we have any available messages in the
-        # queue to route...
-        if not len(self._messages):
-            return task.cont
+        self.run_routing_pass()
+        return task.cont
 
-        for _ in range(len(self._messages)):
-            # pull a message handle object off the top of the queue,
+    def run_routing_pass(self):
+        """
+        Expires the parked messages which are due, routes the queued
+        messages and writes out everything routed to the participants
+        """
+
+        self._write_pass += 1
+
+        # expire any parked messages which have outlived
+        # the message timeout while waiting for their channel...
+        timestamp = self.get_timestamp()
+        for channel in self._timer_wheel.advance(timestamp):
+            self.expire_parked_handles(channel, timestamp)
+
+        if self._dump_requested:
+            self._dump_requested = False
+            self.dump_dead_letters()
+
+        # check to see if we have any available messages in the lanes to route,
+        # they're routed in the order they arrived unless that would exceed the budget...
+        budget = self._flush_budget
+        if not budget or sum(len(lane) for lane in self._lanes) <= budget:
+            self.route_lanes_in_order()
+        else:
+            self.route_lanes_by_priority(budget)
+
+        # this is the end of our routing pass, write out everything
+        # that has been accumulated for each of the participants...
+        self.flush_pending_participants()
+
+    def route_lanes_in_order(self):
+        """
+        Routes every queued message in the order they arrived, across all of the lanes
+        """
+
+        lanes = [lane for lane in self._lanes if lane]
+        while len(lanes) > 1:
+            # route the lane holding the oldest message until it reaches
+            # a message newer than the oldest in any of the other lanes...
+            lanes.sort(key=lambda lane: lane.head_sequence)
+            self.route_lane(lanes[0], -1, lanes[1].head_sequence)
+            lanes = [lane for lane in lanes if lane]
+
+        if lanes:
+            self.route_lane(lanes[0], -1)
+
+    def route_lanes_by_priority(self, budget):
+        """
+        Routes up to budget messages with the lane scheduling, a lane waits whenever
+        it's next message has an earlier message from the same sender in another lane
+        """
+
+        while budget:
+            remaining = budget
+            if self._lane_scheduling == self.LANE_SCHEDULING_STRICT:
+                for lane in self._lanes:
+                    budget = self.route_lane(lane, budget, in_sender_order=True)
+                    if not budget:
+                        break
+            else:
+                for lane, weight in zip(self._lanes, self._lane_weights):
+                    count = min(weight, budget)
+                    budget -= count - self.route_lane(lane, count, in_sender_order=True)
+                    if not budget:
+                        break
+
+            # every lane is either empty or waiting on another...
+            if budget == remaining:
+                break
+
+    def route_lane(self, lane, count, until=None, in_sender_order=False):
+        """
+        Routes up to count messages from the lane, a negative count routes every message,
+        stopping at the first message numbered after until. Returns the part of the count left unused
+        """
+
+        timestamp = self.get_timestamp()
+        sender_sequences = self._sender_sequences
+        while lane and count:
+            # read the message at the top of the lane straight out of it's slots,
             # then attempt to route it to its appropiate channel...
-            message_handle = self._messages.popleft()
-
-            # before we can attempt to route this message, we need to check and
-            # see if the sender exists on the participant interface...
-            if not self._network.interface.has_participant(message_handle.sender):
-                # each message has a delay as to when it will be automatically removed.
-                # let's just check to make sure we can "re-queue" it again...
-                if self.get_timestamp() - message_handle.timestamp > self._message_timeout:
+            channel_slots, sender_slots, message_type_slots, datagram_slots, deadline_slots, sequence_slots = lane.slots
+            index = lane.head
+            sequence = sequence_slots[index]
+            if until is not None and sequence > until:
+                break
+
+            sender = sender_slots[index]
+            if sender_sequences is not None:
+                sequences = sender_sequences[sender]
+                if in_sender_order and sequences[0] != sequence:
+                    break
+
+                sequences.popleft()
+                if not sequences:
+                    del sender_sequences[sender]
+
+            channels = channel_slots[index]
+            message_type = message_type_slots[index]
+            datagram = datagram_slots[index]
+            deadline = deadline_slots[index]
+            lane.discard_left()
+            count -= 1
+
+            # a message which waited in the lane past it's deadline
+            # is given up on, the same as a parked one would be...
+            if timestamp > deadline:
+                self._dead_letters.record(channels, sender, message_type, datagram, DeadLetterLog.REASON_EXPIRED)
+                continue
+
+            if not self.route_message(channels, sender, message_type, datagram):
+                # even though this message's channels have no subscribers yet,
+                # this message is still valid until the message timeout expires,
+                # park it until one of it's channels is registered...
+                self.park_handle(MessageHandle(channels, sender, message_type, datagram, deadline))
+
+        return count
+
+    def route_handle(self, message_handle):
+        return self.route_message(message_handle.channels, message_handle.sender,
+                                  message_handle.message_type, message_handle.datagram)
+
+    def route_message(self, channels, sender, message_type, datagram, forward_upstream=True, from_peer=False):
+        """
+        Routes a message to the subscribers of it's channels, returns True if the
+        message was delivered or forwarded anywhere else False
+        """
+
+        # a message from another worker was routed to us because our own participants
+        # are subscribed to it, the other workers have already received it...
+        if from_peer:
+            return self.deliver_message(channels, sender, message_type, datagram, include_peers=False)
+
+        network = self._network
+        forwarded = False
+
+        # when running as one of several workers, the channels owned by another
+        # worker are routed by that worker, which sends them back to us
+        # if any of our participants are subscribed to them...
+        if network.worker_count > 1:
+            owned_channels = network.get_channels_by_owner(channels)
+            local_channels = owned_channels.pop(network.worker_index, None)
+            for worker_index, worker_channels in owned_channels.items():
+                if network.get_peer(worker_index).forward_message(channels, worker_channels, sender,
+                                                                  message_type, datagram):
+                    forwarded = True
+
+            if not local_channels:
+                return forwarded
+
+            datagram = get_channels_datagram(datagram, channels, local_channels, sender, message_type)
+            channels = local_channels
+
+        # any channels that nobody here is subscribed to are handed on
+        # to our upstream message director, if we have one...
+        upstream = network.upstream
+        if forward_upstream and upstream is not None:
+            interface = network.interface
+            missing_channels = [channel for channel in channels if not interface.get_participants(channel)]
+            if missing_channels and upstream.forward_message(channels, missing_channels, sender,
+                                                             message_type, datagram):
+                forwarded = True
+
+        return self.deliver_message(channels, sender, message_type, datagram) or forwarded
+
+    def deliver_message(self, channels, sender, message_type, datagram, include_peers=True):
+        # the common case is a message sent to a single channel, in which case
+        # the frame we received is forwarded as-is to each of it's subscribers...
+        interface = self._network.interface
+        if len(channels) == 1:
+            delivered = False
+            for participant in interface.get_participants(channels[0]):
+                if not include_peers and participant.is_peer:
                     continue
 
-                # even though this message's sender couldn't be found,
-                # this message is still valid because it is within the message
-                # timeout time frame, we will "re-queue" it until it expires...
-                self._messages.append(message_handle)
-                continue
+                participant.handle_send_datagram(datagram)
+                delivered = True
 
-            # we've successfully found the channel in which this message will be routed to,
-            # and have a valid message, now reconstruct the message and send it off...
-            participant = self._network.interface.get_participant(message_handle.sender)
+            return delivered
 
-            if not participant:
-                self.notify.warning(
-                    "Tried to flush messages for unknown participant with sender: %s" % (str(message_handle.sender)))
+        # otherwise each subscriber receives the message once, addressed to only the channels
+        # it's subscribed to, or it would handle the message for the other channels too.
+        # Subscribers to the same channels share the datagram built for them...
+        datagrams = {}
+        delivered = False
+        for participant, subscribed_channels in interface.get_participant_channels(channels).items():
+            if not include_peers and participant.is_peer:
                 continue
 
-            datagram = io.NetworkDatagram()
-            datagram.add_header(message_handle.channel, message_handle.sender, message_handle.message_type)
+            key = tuple(subscribed_channels)
+            subset_datagram = datagrams.get(key)
+            if subset_datagram is None:
+                subset_datagram = datagrams[key] = get_channels_datagram(datagram, channels, subscribed_channels,
+                                                                         sender, message_type)
 
-            other_datagram = message_handle.datagram
-            datagram.append_data(other_datagram.get_message())
-            print("Sending message %d, %d, %d!" % (
-            message_handle.channel, message_handle.sender, message_handle.message_type))
-            participant.handle_send_datagram(datagram)
+            participant.handle_send_datagram(subset_datagram)
+            delivered = True
+
+        return delivered
+
+    def park_handle(self, message_handle):
+        for channel in message_handle.channels:
+            messages = self._parked_messages.get(channel)
+            if messages is None:
+                messages = self._parked_messages[channel] = collections.deque()
+                self._timer_wheel.schedule(channel, message_handle.deadline)
+
+            messages.append(message_handle)
+
+    def flush_parked_handles(self, channel):
+        messages = self._parked_messages.pop(channel, None)
+        if not messages:
+            return
 
-            # destroy the datagram and message handle objects since they are
-            # no longer needed in this scope...
-            other_datagram.clear()
-            datagram.clear()
+        timestamp = self.get_timestamp()
+        for message_handle in messages:
+            # a message addressed to several channels is parked on each of them,
+            # it may have already been routed or expired through another channel...
+            if message_handle.datagram is None:
+                continue
 
-            del other_datagram
-            del datagram
+            if timestamp <= message_handle.deadline:
+                self.route_handle(message_handle)
+            else:
+                self.record_dead_letter(message_handle)
 
             message_handle.destroy()
-            del message_handle
 
-        return task.cont
+    def record_dead_letter(self, message_handle):
+        self._dead_letters.record(message_handle.channels, message_handle.sender, message_handle.message_type,
+                                  message_handle.datagram, DeadLetterLog.REASON_EXPIRED)
 
-    def flush_post_handles(self, channel):
-        messages = self._post_messages.get(channel)
+    def flush_parked_range(self, low, high):
+        for channel in [channel for channel in self._parked_messages if low <= channel <= high]:
+            self.flush_parked_handles(channel)
+
+    def expire_parked_handles(self, channel, timestamp):
+        messages = self._parked_messages.get(channel)
         if not messages:
-            self.notify.debug('Failed to flush post message handles, unknown channel: %d!' % channel)
             return
 
-        participant = self._network.interface.get_participant(channel)
-        if not participant:
-            self.notify.debug('Failed to flush post message handles, unknown participant with channel: %d!' % channel)
+        # messages are parked in the order they arrived, so they also expire
+        # in that order, stop at the first message still within the timeout...
+        while messages:
+            message_handle = messages[0]
+            if message_handle.datagram is not None:
+                if timestamp <= message_handle.deadline:
+                    break
+
+                self.record_dead_letter(message_handle)
+                message_handle.destroy()
+
+            messages.popleft()
+
+        if not messages:
+            del self._parked_messages[channel]
             return
 
-        for _ in range(len(messages)):
-            message_handle = messages.popleft()
+        self._timer_wheel.schedule(channel, messages[0].deadline)
 
-            # in order for us to properly handle post remove messages,
-            # we need to unpack and process them like we would normally...
-            datagram = message_handle.datagram
-            participant.handle_datagram(io.NetworkDatagramIterator(datagram))
+    def flush_post_handles(self, channel, participant):
+        messages = self._post_messages.pop(channel, None)
+        if not messages:
+            self.notify.debug('Failed to flush post message handles, unknown channel: %d!' % channel)
+            return
 
-            # destroy the datagram and message handle objects since they are
-            # no longer needed in this scope...
-            datagram.clear()
-            del datagram
+        # replay each post remove behind whatever is already queued for routing, the header is
+        # read directly out of our buffer and each message is copied once into it's datagram...
+        view = memoryview(messages)
+        offset = 0
+        length = len(messages)
+        while offset < length:
+            size, = POST_REMOVE_LENGTH.unpack_from(messages, offset)
+            offset += POST_REMOVE_LENGTH.size
+            message_offset = offset
+            offset += size
+
+            if not size:
+                continue
 
-            message_handle.destroy()
-            del message_handle
+            channel_count = messages[message_offset]
+            if channel_count == 1 and size >= 1 + MESSAGE_CHANNEL.size and \
+                    MESSAGE_CHANNEL.unpack_from(messages, message_offset + 1)[0] == types.CONTROL_MESSAGE:
+                participant.handle_datagram(io.NetworkDatagramIterator(io.get_network_datagram(
+                    view[message_offset:offset])))
+
+                continue
 
-        # finally clear our channel from the post removes
-        # dictionary which held the message handle objects...
-        self.clear_post_handles(channel)
+            header_size = 1 + channel_count * MESSAGE_CHANNEL.size
+            if size < header_size + MESSAGE_SENDER_TYPE.size:
+                self.notify.warning('Failed to replay post remove for channel: %d, truncated message!' % channel)
+                continue
+
+            channels = [MESSAGE_CHANNEL.unpack_from(messages, message_offset + 1 + index * MESSAGE_CHANNEL.size)[0]
+                        for index in range(channel_count)]
+
+            sender, message_type = MESSAGE_SENDER_TYPE.unpack_from(messages, message_offset + header_size)
+            self.append_handle(channels, sender, message_type, io.get_network_datagram(view[message_offset:offset]))
 
     def shutdown(self):
+        if hasattr(signal, 'SIGUSR1'):
+            signal.signal(signal.SIGUSR1, signal.SIG_DFL)
+
         if self.__flush_task:
             task_mgr.remove(self.__flush_task)
             self.__flush_task = None
 
 
+class MessageDirectorAdmin(object):
+    """
+    A read only admin socket, every connection made to it is sent the message
+    director's stats as a line of JSON and is then closed. The stats are written
+    out as each connection accepts them, never blocking the message director...
+    """
+
+    notify = notify.new_category('MessageDirectorAdmin')
+
+    def __init__(self, network, address, port):
+        self._network = network
+        self._address = address
+        self._port = port
+        self._socket = None
+        self._send_timeout = config.GetFloat('messagedirector-admin-send-timeout', 5.0)
+        self._connections = {}
+        self.__poll_task = None
+
+    def setup(self):
+        try:
+            self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self._socket.bind((self._address, self._port))
+            self._socket.listen(5)
+            self._socket.setblocking(False)
+        except socket.error as error:
+            self.notify.warning('Failed to open admin socket on address: <%s:%d>, %s!' % (
+                self._address, self._port, error))
+
+            self._socket = None
+            return
+
+        self.__poll_task = task_mgr.doMethodLater(config.GetFloat('messagedirector-admin-poll-interval', 0.25),
+                                                  self.__poll, self._network.get_unique_name('poll-admin'))
+
+    def __poll(self, task):
+        while True:
+            try:
+                connection, _ = self._socket.accept()
+            except socket.error:
+                break
+
+            self.handle_connection(connection)
+
+        for connection in list(self._connections):
+            self.send_pending_data(connection)
+
+        return task.again
+
+    def handle_connection(self, connection):
+        connection.setblocking(False)
+        data = json.dumps(self._network.message_interface.get_stats(), sort_keys=True).encode('utf-8') + b'\n'
+        self._connections[connection] = [bytearray(data), time.monotonic() + self._send_timeout]
+        self.send_pending_data(connection)
+
+    def send_pending_data(self, connection):
+        """
+        Writes as much of the stats as the connection will accept without blocking,
+        the connection is closed once they have all been written or it times out
+        """
+
+        data, deadline = self._connections[connection]
+        try:
+            while data:
+                del data[:connection.send(data)]
+        except (BlockingIOError, InterruptedError):
+            if time.monotonic() < deadline:
+                return
+
+            self.notify.debug('Timed out sending stats to admin connection!')
+        except socket.error as error:
+            self.notify.debug('Failed to send stats to admin connection, %s!' % error)
+
+        self.close_connection(connection)
+
+    def close_connection(self, connection):
+        del self._connections[connection]
+        connection.close()
+
+    def shutdown(self):
+        if self.__poll_task:
+            task_mgr.remove(self.__poll_task)
+            self.__poll_task = None
+
+        for connection in list(self._connections):
+            self.close_connection(connection)
+
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+
+class MessageDirectorLink(io.NetworkConnector):
+    """
+    A connection from this message director to another message director. Our local
+    subscriptions are propagated over it, so that messages for those channels are
+    routed to us, and messages for channels nobody here is subscribed to are forwarded
+    over it for the other message director to route...
+    """
+
+    notify = notify.new_category('MessageDirectorLink')
+
+    def __init__(self, network, address, port, peer_index=None):
+        io.NetworkConnector.__init__(self, None, address, port, 0)
+
+        self._network = network
+        self._address = address
+        self._port = port
+        self._peer_index = peer_index
+        self._connected = False
+        self._retry_interval = config.GetFloat('messagedirector-link-retry-interval', 5.0)
+
+        self._range_counts = {}
+        self.__retry_task = None
+
+    @property
+    def connected(self):
+        return self._connected
+
+    @property
+    def peer_index(self):
+        return self._peer_index
+
+    @property
+    def is_peer(self):
+        return self._peer_index is not None
+
+    def setup(self):
+        self.__retry_task = None
+
+        try:
+            io.NetworkConnector.setup(self)
+        except io.NetworkError as error:
+            self.notify.warning('%s, retrying in %.1f seconds...' % (error, self._retry_interval))
+            self.__retry_task = task_mgr.doMethodLater(self._retry_interval, self.__retry,
+                                                       self.get_unique_name('retry-link'))
+
+            return
+
+        self._connected = True
+        self.notify.info('Linked to message director on address: <%s:%d>.' % (self._address, self._port))
+
+        # a link to another worker names itself first, so that the other
+        # worker never routes it's messages back over this link...
+        if self.is_peer:
+            datagram = io.NetworkDatagram()
+            datagram.add_uint8(1)
+            datagram.add_uint64(types.CONTROL_MESSAGE)
+            datagram.add_uint16(types.CONTROL_SET_CON_NAME)
+            datagram.add_string('%s-%d' % (PEER_CONNECTION_NAME, self._network.worker_index))
+            self.handle_send_connection_datagram(datagram)
+
+        # now that we're connected, tell the other message director
+        # about every subscription we currently have...
+        self._channel_ranges = []
+        for channel in self._network.get_link_channels(self):
+            self.register_for_channel(channel)
+
+        for low, high in list(self._range_counts):
+            io.NetworkConnector.register_for_range(self, low, high)
+
+    def __retry(self, task):
+        self.setup()
+        return task.done
+
+    def register_for_channel(self, channel):
+        if not self._connected:
+            return
+
+        io.NetworkConnector.register_for_channel(self, channel)
+
+    def unregister_for_channel(self, channel):
+        if not self._connected:
+            return
+
+        io.NetworkConnector.unregister_for_channel(self, channel)
+
+    def register_for_range(self, low, high):
+        # the same range may be subscribed to by several of our participants,
+        # it only needs to be registered with the other message director once...
+        count = self._range_counts.get((low, high), 0)
+        self._range_counts[(low, high)] = count + 1
+        if count or not self._connected:
+            return
+
+        io.NetworkConnector.register_for_range(self, low, high)
+
+    def unregister_for_range(self, low, high):
+        count = self._range_counts.get((low, high), 0)
+        if not count:
+            return
+
+        if count > 1:
+            self._range_counts[(low, high)] = count - 1
+            return
+
+        del self._range_counts[(low, high)]
+        if not self._connected:
+            return
+
+        io.NetworkConnector.unregister_for_range(self, low, high)
+
+        # removing the range removes it in full on the other message director,
+        # restore any of our other ranges which overlapped with it...
+        for other_low, other_high in self._range_counts:
+            if other_low <= high and low <= other_high:
+                io.NetworkConnector.register_for_range(self, other_low, other_high)
+
+    def forward_message(self, channels, forward_channels, sender, message_type, datagram):
+        """
+        Forwards a message on for the given subset of it's channels,
+        returns True if the message was forwarded
+        """
+
+        if not self._connected:
+            return False
+
+        # only forward the message for the channels the other side is meant to route,
+        # otherwise our own subscribers would receive it again from the other side...
+        self.handle_send_connection_datagram(get_channels_datagram(datagram, channels, forward_channels,
+                                                                   sender, message_type))
+
+        return True
+
+    def handle_internal_datagram(self, di):
+        channels = [di.get_uint64() for _ in range(di.get_uint8())]
+        sender = di.get_uint64()
+        message_type = di.get_uint16()
+
+        # the other message director routed this message to us because we are
+        # subscribed to it, so never send it back the way it came...
+        message_interface = self._network.message_interface
+        datagram = di.get_network_datagram()
+        if not message_interface.route_message(channels, sender, message_type, datagram,
+                                               forward_upstream=False, from_peer=self.is_peer):
+            self.notify.debug('Dropping message type: %d from sender: %d, no subscribers for channels: %r!' % (
+                message_type, sender, channels))
+
+            message_interface.dead_letters.record(channels, sender, message_type, datagram,
+                                                  DeadLetterLog.REASON_UNROUTABLE)
+
+    def handle_disconnected(self):
+        self.notify.warning('Lost link to message director on address: <%s:%d>, reconnecting...' % (
+            self._address, self._port))
+
+        self._connected = False
+        io.NetworkConnector.handle_disconnected(self)
+        io.NetworkConnector.shutdown(self)
+
+        self.__retry_task = task_mgr.doMethodLater(self._retry_interval, self.__retry,
+                                                   self.get_unique_name('retry-link'))
+
+    def shutdown(self):
+        if self.__retry_task:
+            task_mgr.remove(self.__retry_task)
+            self.__retry_task = None
+
+        if self._connected:
+            self.handle_disconnect()
+
+        self._connected = False
+        io.NetworkConnector.shutdown(self)
+
+
+class MessageDirectorPeerListener(io.NetworkListener):
+    """
+    Accepts the links from the other message director workers, each one is
+    a participant of the worker this listener belongs to like any other...
+    """
+
+    notify = notify.new_category('MessageDirectorPeerListener')
+
+    def __init__(self, message_director, address, port):
+        io.NetworkListener.__init__(self, address, port, Participant)
+
+        self._message_director = message_director
+
+    @property
+    def interface(self):
+        return self._message_director.interface
+
+    @property
+    def message_interface(self):
+        return self._message_director.message_interface
+
+    @property
+    def capture(self):
+        return self._message_director.capture
+
+
 class MessageDirector(io.NetworkListener):
     notify = notify.new_category('MessageDirector')
 
-    def __init__(self, address, port):
-        io.NetworkListener.__init__(self, address, port, Participant)
+    def __init__(self, address, port, worker_index=0, worker_count=1):
+        # the workers share the one port participants connect to when the backend allows it,
+        # otherwise only the first worker listens on it and forwards to the others...
+        share_port = worker_count > 1 and self.can_reuse_port
+        io.NetworkListener.__init__(self, address, port, Participant, reuse_port=share_port)
+
+        self._listening = worker_index == 0 or share_port
 
         self._interface = ParticipantInterface(self)
         self._message_interface = MessageInterface(self)
 
+        # when an upstream message director is configured, we propagate our
+        # subscriptions to it and forward it anything we cannot route ourselves...
+        self._upstream = None
+        upstream_address = config.GetString('messagedirector-upstream-address', '')
+        if upstream_address:
+            self._upstream = MessageDirectorLink(self, upstream_address,
+                                                 config.GetInt('messagedirector-upstream-port', 6666))
+
+        # when a capture file is configured, every frame received is
+        # recorded to it so that it can be replayed later on...
+        self._capture = None
+        capture_filename = config.GetString('messagedirector-capture-file', '')
+        if capture_filename:
+            if worker_count > 1:
+                capture_filename = '%s.%d' % (capture_filename, worker_index)
+
+            self._capture = MessageCapture(capture_filename)
+
+        self._admin = None
+        admin_port = config.GetInt('messagedirector-admin-port', 0)
+        if admin_port:
+            self._admin = MessageDirectorAdmin(self, config.GetString('messagedirector-admin-address', '127.0.0.1'),
+                                               admin_port + worker_index)
+
+        # when running as one of several workers, each worker owns a partition
+        # of the channel space and is linked to every other worker...
+        self._worker_index = worker_index
+        self._worker_count = max(worker_count, 1)
+        self._peers = {}
+        self._peer_listener = None
+        if self._worker_count > 1:
+            # the workers link to one another on ports of their own, counting up from the
+            # worker port base, kept apart from the ports of every other component...
+            peer_address = config.GetString('messagedirector-worker-address', '127.0.0.1')
+            peer_port = config.GetInt('messagedirector-worker-port-base', 6680)
+            self._peer_listener = MessageDirectorPeerListener(self, peer_address, peer_port + worker_index)
+            for peer_index in range(self._worker_count):
+                if peer_index != worker_index:
+                    self._peers[peer_index] = MessageDirectorLink(self, peer_address, peer_port + peer_index,
+                                                                  peer_index=peer_index)
+
     @property
     def interface(self):
         return self._interface
@@ -360,10 +1976,165 @@ class MessageDirector(io.NetworkListener):
     def message_interface(self):
         return self._message_interface
 
+    @property
+    def upstream(self):
+        return self._upstream
+
+    @property
+    def capture(self):
+        return self._capture
+
+    @property
+    def worker_index(self):
+        return self._worker_index
+
+    @property
+    def worker_count(self):
+        return self._worker_count
+
+    @property
+    def listening(self):
+        return self._listening
+
+    def get_peer(self, worker_index):
+        return self._peers.get(worker_index)
+
+    def get_participants(self):
+        """
+        Returns every participant connected to us, including the other workers
+        """
+
+        participants = self.get_handlers()
+        if self._peer_listener is not None:
+            participants.extend(self._peer_listener.get_handlers())
+
+        return participants
+
+    def get_channel_owner(self, channel):
+        # channels are mostly allocated sequentially in blocks, so mix
+        # the channel before partitioning it between the workers...
+        return (((channel * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF) >> 32) % self._worker_count
+
+    def get_channels_by_owner(self, channels):
+        if len(channels) == 1:
+            return {self.get_channel_owner(channels[0]): channels}
+
+        owned_channels = {}
+        for channel in channels:
+            owned_channels.setdefault(self.get_channel_owner(channel), []).append(channel)
+
+        return owned_channels
+
+    def get_link_channels(self, link):
+        """
+        Returns the channels which are to be registered over a link when it connects
+        """
+
+        if not link.is_peer:
+            return list(self._interface.participants)
+
+        # the other workers only subscribe to the channels we own,
+        # so we only ever subscribe to those owned by them...
+        return [channel for channel in self._interface.participants
+                if self.get_channel_owner(channel) == link.peer_index]
+
+    def has_pending_work(self):
+        if io.NetworkListener.has_pending_work(self) or self._message_interface.has_pending_work():
+            return True
+
+        if self._peer_listener is not None and self._peer_listener.has_pending_work():
+            return True
+
+        if self._upstream is not None and self._upstream.has_pending_work():
+            return True
+
+        return any(peer.has_pending_work() for peer in self._peers.values())
+
+    def get_next_deadline(self):
+        deadlines = [self._message_interface.get_next_deadline()]
+        if self._upstream is not None:
+            deadlines.append(self._upstream.get_next_deadline())
+
+        deadlines.extend(peer.get_next_deadline() for peer in self._peers.values())
+        deadlines = [deadline for deadline in deadlines if deadline is not None]
+        return min(deadlines) if deadlines else None
+
+    def handle_channel_subscribed(self, channel):
+        if self._upstream is not None:
+            self._upstream.register_for_channel(channel)
+
+        if self._peers:
+            peer = self._peers.get(self.get_channel_owner(channel))
+            if peer is not None:
+                peer.register_for_channel(channel)
+
+    def handle_channel_unsubscribed(self, channel):
+        if self._upstream is not None:
+            self._upstream.unregister_for_channel(channel)
+
+        if self._peers:
+            peer = self._peers.get(self.get_channel_owner(channel))
+            if peer is not None:
+                peer.unregister_for_channel(channel)
+
+    def handle_range_subscribed(self, low, high, participant):
+        if participant.is_peer:
+            return
+
+        if self._upstream is not None:
+            self._upstream.register_for_range(low, high)
+
+        # a range spans the partitions of every worker,
+        # so it is registered with all of them...
+        for peer in self._peers.values():
+            peer.register_for_range(low, high)
+
+    def handle_range_unsubscribed(self, low, high, participant):
+        if participant.is_peer:
+            return
+
+        if self._upstream is not None:
+            self._upstream.unregister_for_range(low, high)
+
+        for peer in self._peers.values():
+            peer.unregister_for_range(low, high)
+
     def setup(self):
+        if self._capture is not None:
+            self._capture.setup()
+
         self._message_interface.setup()
-        io.NetworkListener.setup(self)
+        if self._listening:
+            io.NetworkListener.setup(self)
+
+        if self._upstream is not None:
+            self._upstream.setup()
+
+        if self._peer_listener is not None:
+            self._peer_listener.setup()
+
+        for peer in self._peers.values():
+            peer.setup()
+
+        if self._admin is not None:
+            self._admin.setup()
 
     def shutdown(self):
+        if self._admin is not None:
+            self._admin.shutdown()
+
+        for peer in self._peers.values():
+            peer.shutdown()
+
+        if self._peer_listener is not None:
+            self._peer_listener.shutdown()
+
+        if self._upstream is not None:
+            self._upstream.shutdown()
+
         self._message_interface.shutdown()
-        io.NetworkListener.shutdown(self)
+        if self._listening:
+            io.NetworkListener.shutdown(self)
+
+        if self._capture is not None:
+            self._capture.shutdown()
@@ -0,0 +1,211 @@
+"""
+ * Copyright (C) Caleb Marshall - All Rights Reserved
+ * Written by Caleb Marshall <anythingtechpro@gmail.com>, August 17th, 2017
+ * Licensing information can found in 'LICENSE', which is part of this source code package.
+"""
+
+import argparse
+import builtins
+import os
+import time
+
+if __name__ == '__main__':
+    from panda3d.core import loadPrcFile, loadPrcFileData
+    from pandac.PandaModules import get_config_showbase
+
+    parser = argparse.ArgumentParser(description='Replays a message director capture file.')
+    parser.add_argument('capture_filename')
+    parser.add_argument('prc_filenames', nargs='*')
+    parser.add_argument('--speed', choices=('recorded', 'max'), default='max')
+    parser.add_argument('--rate', type=float, default=1.0)
+    arguments = parser.parse_args()
+
+    if os.path.exists('$OTP_SERVER/config/general.prc'):
+        loadPrcFile('$OTP_SERVER/config/general.prc')
+
+    for prc_filename in arguments.prc_filenames:
+        loadPrcFile(prc_filename)
+
+    # the replayed message director runs on it's own, it must not
+    # link to anything else or capture what it is replaying...
+    loadPrcFileData('replay', '\n'.join([
+        'messagedirector-workers 1',
+        'messagedirector-upstream-address',
+        'messagedirector-capture-file',
+        'messagedirector-admin-port 0',
+    ]))
+
+    from direct.task.TaskManagerGlobal import taskMgr
+
+    # when run as a script the config and task manager are set up before the
+    # realtime components are imported, otherwise whoever imported us has...
+    builtins.config = get_config_showbase()
+    builtins.task_mgr = taskMgr
+
+from otp_server.realtime import io, messagedirector
+from otp_server.realtime.notifier import notify
+
+notify = notify.new_category('Replay')
+
+
+class ReplayConnection(object):
+    """
+    Stands in for the connection of a participant which was captured,
+    anything written to it is discarded...
+    """
+
+    def __init__(self, connection_id):
+        self._connection_id = connection_id
+
+    @property
+    def connection_id(self):
+        return self._connection_id
+
+    def set_collect_tcp(self, collect_tcp):
+        pass
+
+    def set_collect_tcp_interval(self, interval):
+        pass
+
+    def flush(self):
+        return True
+
+
+class ReplayMessageDirector(messagedirector.MessageDirector):
+    """
+    A message director without any sockets, the captured frames are fed to it's
+    participants directly and everything it routes is counted then discarded...
+    """
+
+    def __init__(self):
+        messagedirector.MessageDirector.__init__(self, '127.0.0.1', 0)
+
+        self._sent_datagrams = 0
+        self._sent_bytes = 0
+
+    @property
+    def sent_datagrams(self):
+        return self._sent_datagrams
+
+    @property
+    def sent_bytes(self):
+        return self._sent_bytes
+
+    def setup(self):
+        self.message_interface.setup()
+
+    def add_handler(self, handler):
+        if self.has_handler(handler.connection):
+            return
+
+        self._handlers[handler.connection] = handler
+        handler.setup()
+
+    def remove_handler(self, handler):
+        if not self.has_handler(handler.connection):
+            return
+
+        handler.shutdown()
+        del self._handlers[handler.connection]
+        self._ready_handlers.pop(handler, None)
+
+    def get_write_allowance(self, connection):
+        # a replay connection has no socket, everything
+        # written to it is discarded straight away...
+        return -1
+
+    def handle_send_datagram(self, datagram, connection):
+        if not self.has_handler(connection):
+            return False
+
+        self._sent_datagrams += 1
+        self._sent_bytes += datagram.get_length()
+        return True
+
+    def handle_disconnect(self, handler):
+        handler.handle_disconnected()
+
+    def shutdown(self):
+        for handler in self.get_handlers():
+            self.remove_handler(handler)
+
+        self.message_interface.shutdown()
+
+
+def route_pending(message_director):
+    """
+    Routes everything the replayed frames have queued straight away, rather than a frame at a time
+    """
+
+    message_interface = message_director.message_interface
+    while message_interface.has_pending_work():
+        message_interface.run_routing_pass()
+
+
+def replay(message_director, filename, speed, rate):
+    handlers = {}
+    frames = 0
+    first_timestamp = None
+    start = time.monotonic()
+
+    for timestamp, connection_id, kind, data in messagedirector.read_capture(filename):
+        if first_timestamp is None:
+            first_timestamp = timestamp
+
+        # at the recorded speed, keep the message director's timers running
+        # until the record is due before replaying it. At the maximum speed
+        # the only timers are the parked messages' deadlines, which are
+        # expired by each routing pass...
+        if speed == 'recorded':
+            due = start + (timestamp - first_timestamp) / rate
+            while time.monotonic() < due:
+                task_mgr.step()
+                time.sleep(min(max(due - time.monotonic(), 0.0), 0.001))
+
+        handler = handlers.get(connection_id)
+        if kind == messagedirector.CAPTURE_CONNECTED:
+            # connection ids start over each time capturing starts,
+            # a capture appended to may reuse them...
+            if handler is not None:
+                handler.handle_disconnected()
+
+            handler = messagedirector.Participant(message_director, None, 'replay:%d' % connection_id,
+                                                  ReplayConnection(connection_id))
+
+            message_director.add_handler(handler)
+            handlers[connection_id] = handler
+        elif handler is None:
+            notify.warning('Skipping record for unknown connection: %d!' % connection_id)
+        elif kind == messagedirector.CAPTURE_FRAME:
+            # the frame is handled by it's participant straight away, rather
+            # than being queued until the participant is next dispatched...
+            if data:
+                handler.handle_datagram(io.NetworkDatagramIterator(io.get_network_datagram(data)))
+
+            frames += 1
+        elif kind == messagedirector.CAPTURE_DISCONNECTED:
+            handler.handle_disconnected()
+            del handlers[connection_id]
+
+        route_pending(message_director)
+
+    route_pending(message_director)
+    return frames, time.monotonic() - start
+
+
+def main(arguments):
+    message_director = ReplayMessageDirector()
+    message_director.setup()
+
+    notify.info('Replaying capture: %s at %s speed...' % (arguments.capture_filename, arguments.speed))
+    frames, elapsed = replay(message_director, arguments.capture_filename, arguments.speed, arguments.rate)
+
+    notify.info('Replayed %d frames in %.3f seconds (%.1f frames per second), routed %d datagrams (%d bytes).' % (
+        frames, elapsed, frames / elapsed if elapsed else 0.0, message_director.sent_datagrams,
+        message_director.sent_bytes))
+
+    message_director.shutdown()
+
+
+if __name__ == '__main__':
+    main(arguments)
@@ -47,6 +47,7 @@ class StateObject(object):
         self._zone_id = zone_id
 
         self._dc_class = dc_class
+        self._dc_class_info = network.dc_loader.class_info_by_number[dc_class.get_number()]
         self._has_other = has_other
 
         self._required_fields = {}
@@ -59,14 +60,11 @@ class StateObject(object):
             field_packer = DCPacker()
             field_packer.set_unpack_data(di.get_remaining_bytes())
 
-            for field_index in range(self._dc_class.get_num_inherited_fields()):
-                field = self._dc_class.get_inherited_field(field_index)
+            for field_id in self._dc_class_info.required_fields:
+                field = self._dc_class_info.get_field(field_id)
                 if not field:
                     self.notify.error('Failed to unpack required field: %d dclass: %s, unknown field!' % (
-                    field_index, self._dc_class.get_name()))
-
-                if not field.is_required():
-                    continue
+                    field_id, self._dc_class.get_name()))
 
                 field_packer.begin_unpack(field)
                 field_args = field.unpack_args(field_packer)
@@ -78,12 +76,12 @@ class StateObject(object):
                 num_fields = field_packer.raw_unpack_uint16()
                 for _ in range(num_fields):
                     field_id = field_packer.raw_unpack_uint16()
-                    field = self._dc_class.get_field_by_index(field_id)
+                    field = self._dc_class_info.get_field(field_id)
                     if not field:
                         self.notify.error('Failed to unpack other field: %d dclass: %s, unknown field!' % (
                         field_id, self._dc_class.get_name()))
 
-                    if not field.is_ram():
+                    if not self._dc_class_info.get_flags(field_id) & io.DC_FIELD_RAM:
                         continue
 
                     field_packer.begin_unpack(field)
@@ -218,12 +216,12 @@ class StateObject(object):
 
         field_packer = DCPacker()
         for field_index, field_args in list(sorted_fields.items()):
-            field = self._dc_class.get_field_by_index(field_index)
+            field = self._dc_class_info.get_field(field_index)
             if not field:
                 self.notify.error('Failed to append required data for field: %d  dclass: %s, unknown field!' % (
                 field_index, self._dc_class.get_name()))
 
-            if broadcast_only and not field.is_broadcast():
+            if broadcast_only and not self._dc_class_info.get_flags(field_index) & io.DC_FIELD_BROADCAST:
                 continue
 
             field_packer.begin_pack(field)
@@ -235,7 +233,7 @@ class StateObject(object):
     def append_other_data(self, datagram):
         field_packer = DCPacker()
         for field_index, field_args in list(self._other_fields.items()):
-            field = self._dc_class.get_field_by_index(field_index)
+            field = self._dc_class_info.get_field(field_index)
             if not field:
                 self.notify.error('Failed to append other data for field: %d  dclass: %s, unknown field!' % (
                 field_index, self._dc_class.get_name()))
@@ -609,9 +607,13 @@ class StateObject(object):
             self.notify.warning("Sender %d tried to clear watch zone but has no watch list!" % sender)
 
     def handle_send_update_field(self, channel, sender, field, field_args):
-        datagram = io.NetworkDatagram()
-        datagram.add_header(channel, sender,
-                            types.STATESERVER_OBJECT_UPDATE_FIELD)
+        self.handle_send_multi_update_field([channel], sender, field, field_args)
+
+    def handle_send_multi_update_field(self, channels, sender, field, field_args):
+        datagram_pool = io.get_datagram_pool()
+        datagram = datagram_pool.acquire()
+        datagram.add_multi_header(channels, sender,
+                                  types.STATESERVER_OBJECT_UPDATE_FIELD)
 
         datagram.add_uint32(self._do_id)
         datagram.add_uint16(field.get_number())
@@ -625,6 +627,7 @@ class StateObject(object):
 
         datagram.append_data(field_packer.get_string())
         self._network.handle_send_connection_datagram(datagram)
+        datagram_pool.release(datagram)
 
     def handle_send_save_field(self, field, field_args):
         datagram = io.NetworkDatagram()
@@ -644,13 +647,14 @@ class StateObject(object):
 
     def handle_update_field(self, channel, sender, di):
         field_id = di.get_uint16()
-        field = self._dc_class.get_field_by_index(field_id)
+        field = self._dc_class_info.get_field(field_id)
         if not field:
             self.notify.warning('Failed to update field: %d dclass: %s, '
                                 'unknown field!' % (field_id, self._dc_class.get_name()))
 
             return
 
+        flags = self._dc_class_info.get_flags(field_id)
         datagram = io.NetworkDatagram()
         datagram.append_data(di.get_remaining_bytes())
         di = io.NetworkDatagramIterator(datagram)
@@ -692,7 +696,7 @@ class StateObject(object):
             # if the field is marked clsend the field is sendable always. Otherwise
             # if the client sends the field and it is not marked either of these,
             # the field update is invalid and the field is not sendable by a client...
-            if field.is_ownsend():
+            if flags & io.DC_FIELD_OWNSEND:
                 if sender != self._owner_id:
                     self.notify.warning('Cannot handle field update for field: %s '
                                         'dclass: %s, field not sendable!' % (
@@ -700,7 +704,7 @@ class StateObject(object):
 
                     return
             else:
-                if not field.is_clsend():
+                if not flags & io.DC_FIELD_CLSEND:
                     self.notify.warning('Cannot handle field update for field: %s '
                                         'dclass: %s, field not sendable!' % (
                                         field.get_name(), self._dc_class.get_name()))
@@ -714,13 +718,13 @@ class StateObject(object):
 
             # if the field is marked broadcast, then we can proceed to broadcast
             # this field to any other objects in our interest.
-            if field.is_broadcast():
+            if flags & io.DC_FIELD_BROADCAST:
                 self.object_manager.handle_updating_field(self, sender, field, field_args, excludes=[avatar_id])
 
             if field_args is not None:
                 # the client has sent an broadcast field that is marked ram,
                 # store this field since it passes both the is clsend or is ownsend tests...
-                if field.is_ram():
+                if flags & io.DC_FIELD_RAM:
                     # ensure the object the client sent the field update for
                     # has other fields...
                     if not self._has_other:
@@ -728,7 +732,7 @@ class StateObject(object):
 
                     # check to see if this field is a required field, if it is then
                     # this means it should be stored as a required field....
-                    if field.is_required():
+                    if flags & io.DC_FIELD_REQUIRED:
                         self._required_fields[field.get_number()] = field_args
                     else:
                         self._other_fields[field.get_number()] = field_args
@@ -740,17 +744,17 @@ class StateObject(object):
 
             # if the field is marked broadcast, then we can proceed to broadcast
             # this field to any other objects in our interest.
-            if field.is_broadcast():
+            if flags & io.DC_FIELD_BROADCAST:
                 self.object_manager.handle_updating_field(self, self._parent_id, field, field_args,
                                                           excludes=[self.do_id])
 
             if field_args is not None:
                 # if the AI object sends specifically other (ram) fields for this object,
                 # this means the object now has other fields...
-                if field.is_ram():
+                if flags & io.DC_FIELD_RAM:
                     # check to see if this field is a required field, if it is then
                     # this means it should be stored as a required field....
-                    if field.is_required():
+                    if flags & io.DC_FIELD_REQUIRED:
                         self._required_fields[field.get_number()] = field_args
                     else:
                         self._other_fields[field.get_number()] = field_args
@@ -761,7 +765,7 @@ class StateObject(object):
 
                 # check to see if the field is marked db, this means that we send the field
                 # to the database to override any current fields with that value...
-                if field.is_db():
+                if flags & io.DC_FIELD_DB:
                     self.handle_send_save_field(field, field_args)
 
     def destroy(self):
@@ -836,10 +840,20 @@ class StateObjectManager(object):
         if not parent_object.has_child(state_object.do_id):
             return
 
-        child_zone_id = parent_object.get_zone_from_child(state_object.do_id)
-        for zone_object in itertools.ifilter(lambda x: x.owner_id > 0 and x.do_id not in excludes,
-                                             parent_object.get_all_zone_objects()):
-            state_object.handle_send_update_field(zone_object.owner_id, state_object.do_id, field, field_args)
+        owner_ids = set()
+        for zone_object in parent_object.get_all_zone_objects():
+            if zone_object.owner_id > 0 and zone_object.do_id not in excludes:
+                owner_ids.add(zone_object.owner_id)
+
+        if not owner_ids:
+            return
+
+        # address every owner with a single message, the message director will
+        # fan it out to each of them. A datagram can only hold so many channels...
+        owner_ids = list(owner_ids)
+        for index in range(0, len(owner_ids), types.MAX_MESSAGE_CHANNELS):
+            state_object.handle_send_multi_update_field(owner_ids[index:index + types.MAX_MESSAGE_CHANNELS],
+                                                        state_object.do_id, field, field_args)
 
 
 class StateServer(io.NetworkConnector):
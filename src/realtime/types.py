@@ -44,6 +44,9 @@ BAD_DO_ID = 0  # 0xffffffff # -1
 
 CHANNEL_CLIENT_BROADCAST = 4014
 
+# The maximum number of channels a single message can be addressed to
+MAX_MESSAGE_CHANNELS = 255
+
 # Control Transactions
 CONTROL_MESSAGE = 4001
 CONTROL_SET_CHANNEL = 2001
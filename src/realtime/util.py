@@ -85,7 +85,8 @@ class DatabaseInterface(object):
         self._dclasses[ctx] = dclass
 
         # Generate and send the datagram:
-        dg = io.NetworkDatagram()
+        datagram_pool = io.get_datagram_pool()
+        dg = datagram_pool.acquire()
 
         if not field_names:
             dg.add_header(database_id, channel_id, types.DBSERVER_OBJECT_GET_ALL)
@@ -107,11 +108,13 @@ class DatabaseInterface(object):
             field = dclass.get_field_by_name(field_name)
             if field is None:
                 self.notify.error('Bad field named %s in query for %s object' % (field_name, dclass.get_name()))
+                datagram_pool.release(dg)
                 return
 
             dg.add_uint16(field.get_number())
 
         self._network.handle_send_connection_datagram(dg)
+        datagram_pool.release(dg)
 
     def handle_query_object_resp(self, message_type, di):
         ctx = di.get_uint32()
@@ -209,7 +212,8 @@ class DatabaseInterface(object):
             field_count += 1
 
         # Generate and send the datagram:
-        dg = io.NetworkDatagram()
+        datagram_pool = io.get_datagram_pool()
+        dg = datagram_pool.acquire()
         if old_fields is not None:
             ctx = self.get_context()
             self._callbacks[ctx] = callback
@@ -231,6 +235,7 @@ class DatabaseInterface(object):
 
         dg.append_data(field_packer.getString())
         self._network.handle_send_connection_datagram(dg)
+        datagram_pool.release(dg)
 
         if old_fields is None and callback is not None:
             # Why oh why did they ask for a callback if there's no old_fields?
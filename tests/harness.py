@@ -0,0 +1,136 @@
+"""
+ * Copyright (C) Caleb Marshall - All Rights Reserved
+ * Written by Caleb Marshall <anythingtechpro@gmail.com>, August 17th, 2017
+ * Licensing information can found in 'LICENSE', which is part of this source code package.
+"""
+
+import builtins
+import importlib
+import os
+import sys
+import types
+
+SOURCE_DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+
+
+class Config(object):
+    """
+    Stands in for panda's config, answering with the values
+    a test set or else the default the caller passed...
+    """
+
+    def __init__(self):
+        self.values = {}
+
+    def get(self, name, default):
+        return self.values.get(name, default)
+
+    GetBool = GetInt = GetFloat = GetString = get
+
+
+class Task(object):
+    """
+    Stands in for the task panda passes each task method...
+    """
+
+    cont = 'cont'
+    again = 'again'
+    done = 'done'
+
+
+class TaskManager(object):
+    """
+    Stands in for panda's task manager, each step runs every task once...
+    """
+
+    running = False
+
+    def __init__(self):
+        self.tasks = {}
+
+    def add(self, method, name, *args, **kwargs):
+        self.tasks[name] = method
+        return name
+
+    def doMethodLater(self, delay, method, name, *args, **kwargs):
+        return self.add(method, name)
+
+    def remove(self, name):
+        self.tasks.pop(name, None)
+
+    def step(self):
+        for name, method in list(self.tasks.items()):
+            if self.tasks.get(name) is method and method(Task) == Task.done:
+                self.tasks.pop(name, None)
+
+    def stop(self):
+        self.running = False
+
+
+class PandaObject(object):
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+
+def new_module(name, **attributes):
+    module = types.ModuleType(name)
+    module.__dict__.update(attributes)
+    if '.' not in name:
+        module.__path__ = []
+
+    sys.modules.setdefault(name, module)
+    return sys.modules[name]
+
+
+def install_panda_stubs():
+    # only the names used while the modules are being imported are
+    # needed, panda is never called into by the tests themselves...
+    try:
+        import panda3d.core
+    except ImportError:
+        panda_names = ['NetDatagram', 'Datagram', 'DatagramIterator', 'QueuedConnectionManager',
+                       'QueuedConnectionReader', 'QueuedConnectionListener', 'ConnectionWriter',
+                       'NetAddress', 'PointerToConnection', 'DCFile', 'DCPacker', 'Filename',
+                       'VirtualFileSystem']
+
+        new_module('panda3d')
+        new_module('panda3d.core', **{name: type(name, (PandaObject,), {}) for name in panda_names})
+        new_module('panda3d.direct')
+        new_module('direct')
+        new_module('direct.showbase')
+        new_module('direct.showbase.VFSImporter', vfs=None)
+        new_module('direct.distributed')
+        new_module('direct.distributed.PyDatagramIterator', PyDatagramIterator=PandaObject)
+
+    try:
+        import coloredlogs
+    except ImportError:
+        new_module('coloredlogs', install=lambda **kwargs: None)
+
+
+def install_package():
+    # the source tree is installed as the otp_server package...
+    try:
+        importlib.import_module('otp_server.realtime')
+    except ImportError:
+        package = types.ModuleType('otp_server')
+        package.__path__ = [SOURCE_DIRECTORY]
+        sys.modules['otp_server'] = package
+
+
+def setup(**values):
+    """
+    Sets up a fresh import of the realtime package, with the config values given
+    """
+
+    install_panda_stubs()
+    install_package()
+
+    builtins.config = Config()
+    builtins.config.values.update(values)
+    builtins.task_mgr = TaskManager()
+
+    for name in list(sys.modules):
+        if name == 'otp_server.realtime' or name.startswith('otp_server.realtime.'):
+            del sys.modules[name]
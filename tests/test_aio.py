@@ -0,0 +1,95 @@
+"""
+ * Copyright (C) Caleb Marshall - All Rights Reserved
+ * Written by Caleb Marshall <anythingtechpro@gmail.com>, August 17th, 2017
+ * Licensing information can found in 'LICENSE', which is part of this source code package.
+"""
+
+import importlib
+import unittest
+
+from tests import harness
+
+
+class Transport(object):
+    """
+    Collects whatever a protocol writes, in place of asyncio's transport...
+    """
+
+    def __init__(self):
+        self.data = bytearray()
+
+    def get_extra_info(self, name, default=None):
+        return default
+
+    def write(self, data):
+        self.data += data
+
+    def writelines(self, lines):
+        for data in lines:
+            self.write(data)
+
+    def close(self):
+        pass
+
+
+class TestAsyncioBackend(unittest.TestCase):
+
+    def setUp(self):
+        harness.setup(**{'net-backend': 'asyncio'})
+
+    def check_backend(self, io, aio):
+        self.assertEqual(io.network_backend, io.NETWORK_BACKEND_ASYNCIO)
+        self.assertIs(io.NetworkDatagram, aio.NetworkDatagram)
+        self.assertIs(io.NetworkDatagramIterator, aio.NetworkDatagramIterator)
+        self.assertIs(io.NetworkConnector, io.AsyncNetworkConnector)
+        self.assertIs(io.NetworkListener, io.AsyncNetworkListener)
+
+    def test_import_aio_first(self):
+        aio = importlib.import_module('otp_server.realtime.aio')
+        io = importlib.import_module('otp_server.realtime.io')
+        self.check_backend(io, aio)
+
+    def test_import_io_first(self):
+        io = importlib.import_module('otp_server.realtime.io')
+        aio = importlib.import_module('otp_server.realtime.aio')
+        self.check_backend(io, aio)
+
+    def test_round_trip(self):
+        io = importlib.import_module('otp_server.realtime.io')
+        aio = importlib.import_module('otp_server.realtime.aio')
+
+        sender = aio.NetworkProtocol(None, None, None)
+        sender.connection_made(Transport())
+
+        for index in range(2):
+            datagram = io.NetworkDatagram()
+            datagram.add_header(4000 + index, 1000, 2000)
+            datagram.add_string('hello %d' % index)
+            self.assertTrue(sender.send(datagram))
+
+        received = []
+        receiver = aio.NetworkProtocol(None, lambda connection, datagram: received.append(datagram), None)
+        receiver.connection_made(Transport())
+
+        # the frames arrive a byte at a time, then both at once...
+        data = bytes(sender._transport.data)
+        for index in range(len(data)):
+            receiver.data_received(data[index:index + 1])
+
+        receiver.data_received(data)
+
+        self.assertEqual(len(received), 4)
+        for index, datagram in enumerate(received):
+            iterator = io.NetworkDatagramIterator(datagram)
+            self.assertEqual(iterator.get_uint8(), 1)
+            self.assertEqual(iterator.get_uint64(), 4000 + index % 2)
+            self.assertEqual(iterator.get_uint64(), 1000)
+            self.assertEqual(iterator.get_uint16(), 2000)
+            self.assertEqual(iterator.get_string(), 'hello %d' % (index % 2))
+            self.assertEqual(iterator.get_remaining_size(), 0)
+
+        self.assertEqual(len(receiver._buffer), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,145 @@
+"""
+ * Copyright (C) Caleb Marshall - All Rights Reserved
+ * Written by Caleb Marshall <anythingtechpro@gmail.com>, August 17th, 2017
+ * Licensing information can found in 'LICENSE', which is part of this source code package.
+"""
+
+import importlib
+import time
+import unittest
+
+from tests import harness
+
+
+class Handler(object):
+    """
+    A handler with a number of datagrams waiting, recording each one it handles...
+    """
+
+    def __init__(self, name, pending, handled):
+        self.connection = name
+        self.pending = pending
+        self.handled = handled
+
+    def handle_pending_data(self):
+        self.pending -= 1
+        self.handled.append(self.connection)
+        return self.pending > 0
+
+
+class DCClass(object):
+    """
+    Stands in for a dc class as far as the class info is concerned...
+    """
+
+    def get_field_by_index(self, index):
+        return 'field-%d' % index
+
+
+class TestDispatchHandlers(unittest.TestCase):
+
+    def setUp(self):
+        harness.setup(**{'net-read-budget': 4, 'net-read-time-budget': 0.0})
+        self.io = importlib.import_module('otp_server.realtime.io')
+
+    def create_listener(self, *handlers):
+        listener = self.io.NetworkListenerBase(None)
+        for handler in handlers:
+            listener._handlers[handler.connection] = handler
+            listener.add_ready_handler(handler)
+
+        return listener
+
+    def test_even_share(self):
+        handled = []
+        listener = self.create_listener(Handler('a', 10, handled), Handler('b', 10, handled))
+        listener.dispatch_handlers()
+        self.assertEqual(handled, ['a', 'a', 'b', 'b'])
+
+    def test_exhausted_handler_goes_last(self):
+        handled = []
+        listener = self.create_listener(*[Handler(name, 10, handled) for name in 'abcdef'])
+
+        # with more handlers ready than the budget, the next frame
+        # picks up with the handlers that didn't get a turn...
+        listener.dispatch_handlers()
+        self.assertEqual(handled, ['a', 'b', 'c', 'd'])
+
+        del handled[:]
+        listener.dispatch_handlers()
+        self.assertEqual(handled, ['e', 'f', 'a', 'b'])
+
+    def test_drained_handler_is_not_ready(self):
+        handled = []
+        listener = self.create_listener(Handler('a', 1, handled), Handler('b', 10, handled))
+        listener.dispatch_handlers()
+        self.assertEqual(handled, ['a', 'b', 'b'])
+        self.assertEqual(list(listener._ready_handlers), [listener._handlers['b']])
+
+
+class TestDCClassInfo(unittest.TestCase):
+
+    def setUp(self):
+        harness.setup()
+        self.io = importlib.import_module('otp_server.realtime.io')
+
+    def create_class_info(self):
+        io = self.io
+        return io.NetworkDCClassInfo(1, 'DistributedAvatar', [
+            io.NetworkDCFieldInfo(0, 'setName', io.DC_FIELD_REQUIRED | io.DC_FIELD_DB, b'\x00\x00'),
+            io.NetworkDCFieldInfo(2, 'setPos', io.DC_FIELD_RAM | io.DC_FIELD_BROADCAST, None),
+        ])
+
+    def test_field_sets(self):
+        class_info = self.create_class_info()
+        self.assertEqual(class_info.required_fields, (0,))
+        self.assertEqual(class_info.ram_fields, frozenset([2]))
+        self.assertEqual(class_info.db_fields, frozenset([0]))
+        self.assertEqual(class_info.broadcast_fields, frozenset([2]))
+        self.assertEqual(class_info.db_defaults, ((0, 'setName', b'\x00\x00'),))
+
+    def test_field_tables(self):
+        class_info = self.create_class_info()
+        class_info.bind_dclass(DCClass())
+        self.assertEqual(class_info.get_field(2), 'field-2')
+        self.assertIsNone(class_info.get_field(1))
+        self.assertIsNone(class_info.get_field(3))
+        self.assertEqual(class_info.get_flags(2), self.io.DC_FIELD_RAM | self.io.DC_FIELD_BROADCAST)
+        self.assertEqual(class_info.get_flags(-1), 0)
+
+
+class TestNetworkSelector(unittest.TestCase):
+
+    def setUp(self):
+        harness.setup()
+        self.io = importlib.import_module('otp_server.realtime.io')
+
+    def check_wake(self, selector):
+        self.assertFalse(selector.select(0))
+
+        selector.wake()
+        selector.wake()
+        started = time.monotonic()
+        self.assertTrue(selector.select(5.0))
+        self.assertLess(time.monotonic() - started, 1.0)
+
+        # every wakeup waiting is read at once...
+        self.assertFalse(selector.select(0))
+        selector.close()
+
+    def test_wake(self):
+        self.check_wake(self.io.NetworkSelector())
+
+    def test_threaded_wake(self):
+        self.check_wake(self.io.ThreadedNetworkSelector(5.0))
+
+    def test_threaded_wakeup_interval(self):
+        selector = self.io.ThreadedNetworkSelector(0.01)
+        started = time.monotonic()
+        self.assertFalse(selector.select(5.0))
+        self.assertLess(time.monotonic() - started, 1.0)
+        selector.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,719 @@
+"""
+ * Copyright (C) Caleb Marshall - All Rights Reserved
+ * Written by Caleb Marshall <anythingtechpro@gmail.com>, August 17th, 2017
+ * Licensing information can found in 'LICENSE', which is part of this source code package.
+"""
+
+import importlib
+import json
+import socket
+import time
+import unittest
+
+from tests import harness
+
+
+class Datagram(object):
+
+    def get_length(self):
+        return 0
+
+
+class Network(object):
+    """
+    Records the range subscriptions a participant interface tells the message director about...
+    """
+
+    def __init__(self):
+        self.ranges = []
+
+    def handle_channel_subscribed(self, channel):
+        pass
+
+    def handle_channel_unsubscribed(self, channel):
+        pass
+
+    def handle_range_subscribed(self, low, high, participant):
+        self.ranges.append(('subscribed', low, high))
+
+    def handle_range_unsubscribed(self, low, high, participant):
+        self.ranges.append(('unsubscribed', low, high))
+
+
+class Recipient(object):
+    """
+    A participant which records the datagrams routed to it...
+    """
+
+    is_peer = False
+
+    def __init__(self, io):
+        self.io = io
+        self.messages = []
+
+    def handle_send_datagram(self, datagram):
+        di = self.io.NetworkDatagramIterator(datagram)
+        channels = [di.get_uint64() for _ in range(di.get_uint8())]
+        sender = di.get_uint64()
+        message_type = di.get_uint16()
+        self.messages.append((channels, sender, message_type, di.get_remaining_bytes()))
+
+
+def create_message(io, channels, sender, message_type, payload=b''):
+    datagram = io.NetworkDatagram()
+    datagram.add_multi_header(channels, sender, message_type)
+    datagram.append_data(payload)
+    return datagram
+
+
+class MessageInterface(object):
+    """
+    Records the post removes a participant adds and has flushed...
+    """
+
+    def __init__(self):
+        self.post_removes = {}
+        self.flushed = []
+
+    def append_post_handle(self, channel, data):
+        self.post_removes.setdefault(channel, []).append(data)
+
+    def flush_post_handles(self, channel, participant):
+        if self.post_removes.pop(channel, None):
+            self.flushed.append(channel)
+
+    def flush_parked_handles(self, channel):
+        pass
+
+    def flush_parked_range(self, low, high):
+        pass
+
+    def remove_pending_participant(self, participant):
+        pass
+
+
+class PendingParticipant(object):
+    """
+    A participant waiting in the message interface to have it's send queue written...
+    """
+
+    def __init__(self, send_queue, send_queue_timestamp, send_stalled):
+        self.send_queue = send_queue
+        self.send_queue_timestamp = send_queue_timestamp
+        self.send_stalled = send_stalled
+
+
+class MessageDirector(object):
+
+    def __init__(self, messagedirector):
+        self.interface = messagedirector.ParticipantInterface(Network())
+        self.message_interface = MessageInterface()
+        self.capture = None
+
+    def handle_disconnected(self, handler):
+        pass
+
+
+class TestMessageRing(unittest.TestCase):
+
+    def setUp(self):
+        harness.setup()
+        self.messagedirector = importlib.import_module('otp_server.realtime.messagedirector')
+
+    def pop(self, ring):
+        channels, senders, message_types, datagrams, deadlines, sequences = ring.slots
+        index = ring.head
+        message = (channels[index], senders[index], message_types[index], datagrams[index], deadlines[index],
+                   sequences[index])
+
+        ring.discard_left()
+        return message
+
+    def test_wraps_and_grows(self):
+        ring = self.messagedirector.MessageRing(4)
+        for index in range(3):
+            ring.append([index], index, index, None, float(index), index)
+
+        self.assertEqual(self.pop(ring), ([0], 0, 0, None, 0.0, 0))
+
+        # wrap around the end of the ring, then grow it
+        # with the head in the middle of it...
+        for index in range(3, 8):
+            ring.append([index], index, index, None, float(index), index)
+
+        self.assertEqual(ring.capacity, 8)
+        self.assertEqual([self.pop(ring)[1] for _ in range(len(ring))], list(range(1, 8)))
+        self.assertRaises(IndexError, ring.discard_left)
+
+    def test_expired_messages_are_dead_letters(self):
+        message_interface = self.messagedirector.MessageInterface(None)
+
+        routed = []
+        message_interface.route_message = lambda channels, sender, message_type, datagram: routed.append(
+            message_type) or True
+
+        timestamp = message_interface.get_timestamp()
+        lane = message_interface.lanes[0]
+        lane.append([1], 2, 3, Datagram(), timestamp - 1.0, 1)
+        lane.append([1], 2, 4, Datagram(), timestamp + 60.0, 2)
+
+        self.assertEqual(message_interface.route_lane(lane, 10), 8)
+        self.assertEqual(routed, [4])
+
+        dead_letters = message_interface.dead_letters.get_stats()
+        self.assertEqual(dead_letters['reasons'], {self.messagedirector.DeadLetterLog.REASON_EXPIRED: 1})
+        self.assertEqual(dead_letters['message_types'], {3: 1})
+
+
+class TestLaneScheduling(unittest.TestCase):
+
+    def create_message_director(self, **config):
+        harness.setup(**dict({'net-backend': 'asyncio'}, **config))
+        self.io = importlib.import_module('otp_server.realtime.io')
+        self.types = importlib.import_module('otp_server.realtime.types')
+        messagedirector = importlib.import_module('otp_server.realtime.messagedirector')
+
+        message_director = messagedirector.MessageDirector('127.0.0.1', 0)
+        self.recipient = Recipient(self.io)
+        message_director.interface.add_participant(2000, self.recipient)
+        return message_director.message_interface
+
+    def append(self, message_interface, sender, message_type):
+        message_interface.append_handle([2000], sender, message_type,
+                                        create_message(self.io, [2000], sender, message_type))
+
+    def routed(self):
+        return [(sender, message_type) for _, sender, message_type, _ in self.recipient.messages]
+
+    def test_routed_in_arrival_order_within_budget(self):
+        message_interface = self.create_message_director()
+        types = self.types
+        for message_type in (types.STATESERVER_OBJECT_GENERATE_WITH_REQUIRED, types.STATESERVER_OBJECT_UPDATE_FIELD,
+                             types.STATESERVER_OBJECT_SET_ZONE):
+            self.append(message_interface, 100, message_type)
+
+        message_interface.run_routing_pass()
+        self.assertEqual(self.routed(), [(100, types.STATESERVER_OBJECT_GENERATE_WITH_REQUIRED),
+                                         (100, types.STATESERVER_OBJECT_UPDATE_FIELD),
+                                         (100, types.STATESERVER_OBJECT_SET_ZONE)])
+
+    def test_sender_order_kept_over_budget(self):
+        message_interface = self.create_message_director(**{'messagedirector-flush-budget': 2})
+        types = self.types
+        self.append(message_interface, 200, types.STATESERVER_OBJECT_UPDATE_FIELD)
+        self.append(message_interface, 300, types.STATESERVER_OBJECT_UPDATE_FIELD)
+        self.append(message_interface, 100, types.STATESERVER_OBJECT_UPDATE_FIELD)
+        self.append(message_interface, 100, types.STATESERVER_OBJECT_SET_ZONE)
+        self.append(message_interface, 400, types.STATESERVER_OBJECT_SET_ZONE)
+
+        # 100's set zone waits behind 100's own update, which is behind
+        # the other updates, 400's set zone is queued behind 100's...
+        message_interface.run_routing_pass()
+        self.assertEqual(self.routed(), [(200, types.STATESERVER_OBJECT_UPDATE_FIELD),
+                                         (300, types.STATESERVER_OBJECT_UPDATE_FIELD)])
+
+        # then once 100's update is routed it's set zone goes ahead of everything else...
+        message_interface.run_routing_pass()
+        self.assertEqual(self.routed()[2:], [(100, types.STATESERVER_OBJECT_UPDATE_FIELD),
+                                             (100, types.STATESERVER_OBJECT_SET_ZONE)])
+
+    def test_priority_over_budget(self):
+        message_interface = self.create_message_director(**{'messagedirector-flush-budget': 2})
+        types = self.types
+        self.append(message_interface, 200, types.STATESERVER_OBJECT_UPDATE_FIELD)
+        self.append(message_interface, 100, types.STATESERVER_OBJECT_UPDATE_FIELD)
+        self.append(message_interface, 300, types.STATESERVER_OBJECT_SET_ZONE)
+        self.append(message_interface, 100, types.STATESERVER_OBJECT_SET_ZONE)
+
+        # 300's set zone is routed ahead of the queued updates, while
+        # 100's set zone still waits behind 100's own update...
+        message_interface.run_routing_pass()
+        self.assertEqual(self.routed(), [(300, types.STATESERVER_OBJECT_SET_ZONE),
+                                         (200, types.STATESERVER_OBJECT_UPDATE_FIELD)])
+
+        message_interface.run_routing_pass()
+        self.assertEqual(self.routed()[2:], [(100, types.STATESERVER_OBJECT_UPDATE_FIELD),
+                                             (100, types.STATESERVER_OBJECT_SET_ZONE)])
+
+    def test_bulk_lane_not_starved(self):
+        message_interface = self.create_message_director(**{'messagedirector-flush-budget': 10})
+        types = self.types
+        for _ in range(20):
+            self.append(message_interface, 100, types.STATESERVER_OBJECT_SET_ZONE)
+
+        for _ in range(5):
+            self.append(message_interface, 200, types.STATESERVER_OBJECT_UPDATE_FIELD)
+
+        # while a pass is over budget, it still routes a bulk message...
+        for routed in (1, 2):
+            message_interface.run_routing_pass()
+            self.assertEqual(self.routed().count((200, types.STATESERVER_OBJECT_UPDATE_FIELD)), routed)
+
+
+class TestParticipantInterface(unittest.TestCase):
+
+    def setUp(self):
+        harness.setup()
+        self.messagedirector = importlib.import_module('otp_server.realtime.messagedirector')
+        self.network = Network()
+        self.interface = self.messagedirector.ParticipantInterface(self.network)
+
+    def test_duplicate_ranges_count_once(self):
+        participant = object()
+        self.interface.add_range(100, 200, participant)
+        self.interface.add_range(100, 200, participant)
+        self.interface.remove_range(100, 200, participant)
+        self.interface.remove_range(100, 200, participant)
+
+        self.assertEqual(self.network.ranges, [('subscribed', 100, 200), ('unsubscribed', 100, 200)])
+        self.assertEqual(self.interface.get_participants(150), ())
+
+    def test_unknown_range_is_not_unsubscribed(self):
+        participant, other = object(), object()
+        self.interface.add_range(100, 200, other)
+        self.interface.remove_range(100, 200, participant)
+        self.interface.remove_range(300, 400, participant)
+
+        self.assertEqual(self.network.ranges, [('subscribed', 100, 200)])
+        self.assertEqual(self.interface.get_participants(150), {other})
+
+
+class TestPendingWork(unittest.TestCase):
+
+    def setUp(self):
+        harness.setup(**{'messagedirector-write-flush-interval': 0.5,
+                         'messagedirector-send-retry-interval': 0.25})
+
+        self.messagedirector = importlib.import_module('otp_server.realtime.messagedirector')
+        self.message_interface = self.messagedirector.MessageInterface(None)
+        self.timestamp = self.message_interface.get_timestamp()
+
+    def test_idle(self):
+        self.assertFalse(self.message_interface.has_pending_work())
+        self.assertIsNone(self.message_interface.get_next_deadline())
+
+    def test_stalled_participant_waits_for_retry(self):
+        self.message_interface.add_pending_participant(PendingParticipant([object()], self.timestamp - 1.0, True))
+        self.assertFalse(self.message_interface.has_pending_work())
+        self.assertAlmostEqual(self.message_interface.get_next_deadline() - self.timestamp, 0.25, places=1)
+
+    def test_participant_flushed_at_interval(self):
+        participant = PendingParticipant([object()], self.timestamp, False)
+        self.message_interface.add_pending_participant(participant)
+        self.assertFalse(self.message_interface.has_pending_work())
+        self.assertEqual(self.message_interface.get_next_deadline(), self.timestamp + 0.5)
+
+        participant.send_queue_timestamp -= 1.0
+        self.assertTrue(self.message_interface.has_pending_work())
+
+    def test_timer_wheel_deadline(self):
+        timer_wheel = self.messagedirector.TimerWheel(0.5, 15.0, 100.0)
+        self.assertIsNone(timer_wheel.get_next_deadline())
+
+        timer_wheel.schedule('channel', 101.2)
+        self.assertEqual(timer_wheel.get_next_deadline(), 101.5)
+        self.assertEqual(timer_wheel.advance(101.4), set())
+        self.assertEqual(timer_wheel.advance(101.5), {'channel'})
+
+
+class TestChannelRangeIndex(unittest.TestCase):
+
+    def setUp(self):
+        harness.setup()
+        self.messagedirector = importlib.import_module('otp_server.realtime.messagedirector')
+
+    def test_overlapping_ranges(self):
+        participant = object()
+        ranges = self.messagedirector.ChannelRangeIndex()
+        ranges.add_range(100, 200, participant)
+        ranges.add_range(150, 250, participant)
+
+        # the channels the other range still covers stay subscribed...
+        ranges.remove_range(150, 250, participant)
+        self.assertEqual(set(ranges.get_participants(175)), {participant})
+        self.assertEqual(set(ranges.get_participants(225)), set())
+
+        ranges.remove_range(100, 200, participant)
+        self.assertEqual(len(ranges), 0)
+
+
+class TestParticipant(unittest.TestCase):
+
+    def setUp(self):
+        harness.setup(**{'net-backend': 'asyncio'})
+        self.io = importlib.import_module('otp_server.realtime.io')
+        self.types = importlib.import_module('otp_server.realtime.types')
+        self.messagedirector = importlib.import_module('otp_server.realtime.messagedirector')
+
+        self.network = MessageDirector(self.messagedirector)
+        self.participant = self.messagedirector.Participant(self.network, None, '127.0.0.1', None)
+
+    def send_control(self, message_type, channel, *values):
+        datagram = self.io.NetworkDatagram()
+        datagram.add_uint16(message_type)
+        datagram.add_uint64(channel)
+        for value in values:
+            datagram.add_uint64(value)
+
+        self.participant.handle_control_message(self.io.NetworkDatagramIterator(datagram))
+
+    def test_range_post_removes_fire_on_disconnect(self):
+        # the channel is covered by the participant's range,
+        # it is never set as one of it's hosts...
+        self.send_control(self.types.CONTROL_ADD_RANGE, 100, 200)
+        self.send_control(self.types.CONTROL_ADD_POST_REMOVE, 150, 0)
+        self.send_control(self.types.CONTROL_SET_CHANNEL, 300)
+        self.send_control(self.types.CONTROL_ADD_POST_REMOVE, 300, 0)
+
+        self.participant.handle_disconnected()
+        self.assertEqual(sorted(self.network.message_interface.flushed), [150, 300])
+        self.assertEqual(self.network.interface.get_participants(150), ())
+
+
+class Stats(object):
+    """
+    Hands the admin socket a fixed set of stats...
+    """
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    def get_stats(self):
+        return self.stats
+
+
+class AdminNetwork(object):
+
+    def __init__(self, stats, handlers=()):
+        self.message_interface = Stats(stats)
+        self.handlers = list(handlers)
+
+    def get_participants(self):
+        return self.handlers
+
+
+class TestMessageDirectorAdmin(unittest.TestCase):
+
+    def setUp(self):
+        harness.setup()
+        self.messagedirector = importlib.import_module('otp_server.realtime.messagedirector')
+
+    def test_slow_reader_does_not_block(self):
+        # more stats than the socket buffers will hold,
+        # the rest is written as the reader catches up...
+        stats = {'padding': 'x' * 4194304}
+        admin = self.messagedirector.MessageDirectorAdmin(AdminNetwork(stats), '127.0.0.1', 0)
+
+        connection, reader = socket.socketpair()
+        admin.handle_connection(connection)
+        self.assertIn(connection, admin._connections)
+
+        data = bytearray()
+        reader.settimeout(5.0)
+        while not data.endswith(b'\n'):
+            data += reader.recv(65536)
+            if connection in admin._connections:
+                admin.send_pending_data(connection)
+
+        self.assertEqual(json.loads(data.decode('utf-8')), stats)
+        self.assertEqual(reader.recv(1), b'')
+        self.assertEqual(admin._connections, {})
+        reader.close()
+
+    def test_send_queue_stats_keyed_by_participant(self):
+        network = AdminNetwork({})
+        message_interface = self.messagedirector.MessageInterface(network)
+        for _ in range(2):
+            participant = self.messagedirector.Participant(None, None, '127.0.0.1', None)
+            participant.connectionName = 'StateServer'
+            participant._participant_id = message_interface.allocate_participant_id()
+            network.handlers.append(participant)
+
+        stats = message_interface.get_send_queue_stats()['participants']
+        self.assertEqual(sorted(stats), [1, 2])
+        self.assertEqual([stats[key]['name'] for key in sorted(stats)], ['StateServer', 'StateServer'])
+
+
+class Connection(object):
+
+    def set_collect_tcp(self, collect_tcp):
+        pass
+
+    def set_collect_tcp_interval(self, interval):
+        pass
+
+    def flush(self):
+        return True
+
+
+class WriteNetwork(object):
+    """
+    Hands a participant a fixed write allowance, counting how often it's asked for...
+    """
+
+    capture = None
+
+    def __init__(self, messagedirector, allowance):
+        self.message_interface = messagedirector.MessageInterface(self)
+        self.allowance = allowance
+        self.checks = 0
+        self.sent = []
+
+    def get_unique_name(self, name):
+        return name
+
+    def get_write_allowance(self, connection):
+        self.checks += 1
+        return self.allowance
+
+    def handle_send_datagram(self, datagram, connection):
+        self.sent.append(datagram)
+        return True
+
+    def has_queued_writes(self):
+        return False
+
+
+class TestWriteAllowance(unittest.TestCase):
+
+    def setUp(self):
+        harness.setup(**{'net-backend': 'asyncio'})
+        self.io = importlib.import_module('otp_server.realtime.io')
+        self.messagedirector = importlib.import_module('otp_server.realtime.messagedirector')
+
+    def create_participant(self, allowance):
+        network = WriteNetwork(self.messagedirector, allowance)
+        network.message_interface.setup()
+        self.addCleanup(network.message_interface.shutdown)
+
+        participant = self.messagedirector.Participant(network, None, '127.0.0.1', Connection())
+        participant.setup()
+        for index in range(3):
+            participant.handle_send_datagram(create_message(self.io, [2000], 100, 2004 + index))
+
+        return network, participant
+
+    def test_allowance_checked_once_per_pass(self):
+        message_length = create_message(self.io, [2000], 100, 2004).get_length()
+        network, participant = self.create_participant(message_length)
+
+        # the connection is handed one datagram each pass, without being stalled...
+        for count in range(1, 4):
+            task_mgr.step()
+            self.assertEqual(len(network.sent), count)
+            self.assertEqual(network.checks, count)
+            self.assertFalse(participant.send_stalled)
+
+        self.assertFalse(network.message_interface.has_pending_work())
+        self.assertEqual(participant.get_send_queue_stats()['send_stalls'], 0)
+
+    def test_blocked_connection_stalls(self):
+        network, participant = self.create_participant(0)
+        task_mgr.step()
+
+        self.assertEqual(network.sent, [])
+        self.assertTrue(participant.send_stalled)
+        self.assertFalse(network.message_interface.has_pending_work())
+
+
+class TestMultiChannelDelivery(unittest.TestCase):
+
+    def setUp(self):
+        harness.setup(**{'net-backend': 'asyncio'})
+        self.io = importlib.import_module('otp_server.realtime.io')
+        self.messagedirector = importlib.import_module('otp_server.realtime.messagedirector')
+        self.message_director = self.messagedirector.MessageDirector('127.0.0.1', 0)
+
+    def subscribe(self, *channels):
+        recipient = Recipient(self.io)
+        for channel in channels:
+            self.message_director.interface.add_participant(channel, recipient)
+
+        return recipient
+
+    def test_each_recipient_gets_its_own_channels(self):
+        first, second, both = self.subscribe(2000), self.subscribe(3000), self.subscribe(2000, 3000)
+
+        message_interface = self.message_director.message_interface
+        message_interface.append_handle([2000, 3000], 100, 2004,
+                                        create_message(self.io, [2000, 3000], 100, 2004, b'\x01'))
+        message_interface.run_routing_pass()
+
+        self.assertEqual(first.messages, [([2000], 100, 2004, b'\x01')])
+        self.assertEqual(second.messages, [([3000], 100, 2004, b'\x01')])
+        self.assertEqual(both.messages, [([2000, 3000], 100, 2004, b'\x01')])
+
+
+class TestParkedMessages(unittest.TestCase):
+
+    def create_message_director(self, **config):
+        harness.setup(**dict({'net-backend': 'asyncio'}, **config))
+        self.io = importlib.import_module('otp_server.realtime.io')
+        messagedirector = importlib.import_module('otp_server.realtime.messagedirector')
+        return messagedirector.MessageDirector('127.0.0.1', 0)
+
+    def append(self, message_director, channels, payload):
+        message_director.message_interface.append_handle(channels, 100, 2004,
+                                                         create_message(self.io, channels, 100, 2004, payload))
+
+    def test_delivered_once_channel_registered(self):
+        message_director = self.create_message_director()
+        message_interface = message_director.message_interface
+        self.append(message_director, [2000], b'\x01')
+        self.append(message_director, [2000, 3000], b'\x02')
+        message_interface.run_routing_pass()
+
+        # nothing is subscribed yet, both messages wait on their channels
+        # rather than in the lanes...
+        self.assertEqual(sorted(message_interface.parked_messages), [2000, 3000])
+        self.assertFalse(message_interface.has_pending_work())
+
+        recipient = Recipient(self.io)
+        message_director.interface.add_participant(3000, recipient)
+        message_interface.flush_parked_handles(3000)
+        self.assertEqual(recipient.messages, [([3000], 100, 2004, b'\x02')])
+
+        # the message routed through 3000 is not routed again through 2000...
+        message_director.interface.add_participant(2000, recipient)
+        message_interface.flush_parked_handles(2000)
+        self.assertEqual([message[3] for message in recipient.messages], [b'\x02', b'\x01'])
+        self.assertEqual(message_interface.parked_messages, {})
+
+    def test_delivered_once_range_registered(self):
+        message_director = self.create_message_director()
+        message_interface = message_director.message_interface
+        self.append(message_director, [2500], b'\x01')
+        message_interface.run_routing_pass()
+
+        recipient = Recipient(self.io)
+        message_director.interface.add_range(2000, 3000, recipient)
+        message_interface.flush_parked_range(2000, 3000)
+        self.assertEqual(recipient.messages, [([2500], 100, 2004, b'\x01')])
+
+    def test_expired_while_parked(self):
+        message_director = self.create_message_director(**{'messagedirector-message-timeout': 0.01,
+                                                            'messagedirector-timer-resolution': 0.01})
+
+        message_interface = message_director.message_interface
+        self.append(message_director, [2000], b'\x01')
+        message_interface.run_routing_pass()
+        self.assertEqual(list(message_interface.parked_messages), [2000])
+
+        time.sleep(0.05)
+        message_interface.run_routing_pass()
+        self.assertEqual(message_interface.parked_messages, {})
+        self.assertEqual(message_interface.dead_letters.total, 1)
+
+
+class TestPostRemoves(unittest.TestCase):
+
+    def setUp(self):
+        harness.setup(**{'net-backend': 'asyncio', 'messagedirector-routing-mode': 'immediate'})
+        self.io = importlib.import_module('otp_server.realtime.io')
+        self.messagedirector = importlib.import_module('otp_server.realtime.messagedirector')
+
+        self.message_director = self.messagedirector.MessageDirector('127.0.0.1', 0)
+        self.recipient = Recipient(self.io)
+        self.message_director.interface.add_participant(2000, self.recipient)
+
+    def test_replayed_without_panda(self):
+        message_interface = self.message_director.message_interface
+        message_interface.append_post_handle(100, create_message(self.io, [2000], 100, 2007, b'\x01\x02').get_message())
+        message_interface.flush_post_handles(100, None)
+
+        self.assertEqual(self.recipient.messages, [([2000], 100, 2007, b'\x01\x02')])
+
+
+class TestQueuedPostRemoves(unittest.TestCase):
+
+    def setUp(self):
+        harness.setup(**{'net-backend': 'asyncio'})
+        self.io = importlib.import_module('otp_server.realtime.io')
+        self.messagedirector = importlib.import_module('otp_server.realtime.messagedirector')
+
+        self.message_director = self.messagedirector.MessageDirector('127.0.0.1', 0)
+        self.recipient = Recipient(self.io)
+        self.message_director.interface.add_participant(2000, self.recipient)
+
+    def test_routed_after_queued_messages(self):
+        message_interface = self.message_director.message_interface
+        message_interface.append_post_handle(100, create_message(self.io, [2000], 100, 2007, b'\x02').get_message())
+        message_interface.append_handle([2000], 100, 2007, create_message(self.io, [2000], 100, 2007, b'\x01'))
+        message_interface.flush_post_handles(100, None)
+
+        # nothing is routed until the next pass, the post remove included...
+        self.assertEqual(self.recipient.messages, [])
+
+        message_interface.run_routing_pass()
+        self.assertEqual([message[3] for message in self.recipient.messages], [b'\x01', b'\x02'])
+
+
+def get_free_port():
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    port = listener.getsockname()[1]
+    listener.close()
+    return port
+
+
+class TestMessageDirectorWorkers(unittest.TestCase):
+
+    def setUp(self):
+        harness.setup(**{'net-backend': 'asyncio', 'messagedirector-worker-port-base': get_free_port(),
+                         'messagedirector-link-retry-interval': 0.0})
+
+        self.io = importlib.import_module('otp_server.realtime.io')
+        self.messagedirector = importlib.import_module('otp_server.realtime.messagedirector')
+        self.workers = [self.messagedirector.MessageDirector('127.0.0.1', 0, worker_index, 2)
+                        for worker_index in range(2)]
+
+    def get_owned_channel(self, worker_index):
+        return next(channel for channel in range(4000, 5000)
+                    if self.workers[0].get_channel_owner(channel) == worker_index)
+
+    def link_workers(self):
+        # the second worker's link is retried once the first worker is listening...
+        for worker in reversed(self.workers):
+            worker.setup()
+            self.addCleanup(worker.shutdown)
+
+        self.step()
+        self.assertTrue(all(worker.get_peer(1 - index).connected for index, worker in enumerate(self.workers)))
+
+    def step(self, count=4):
+        for _ in range(count):
+            task_mgr.step()
+
+    def test_channels_partitioned(self):
+        channels = list(range(4000, 4100))
+        for worker in self.workers:
+            self.assertEqual([worker.get_channel_owner(channel) for channel in channels],
+                             [self.workers[0].get_channel_owner(channel) for channel in channels])
+
+        owned_channels = self.workers[0].get_channels_by_owner(channels)
+        self.assertEqual(sorted(owned_channels), [0, 1])
+        self.assertEqual(sorted(owned_channels[0] + owned_channels[1]), channels)
+        for worker_index, worker_channels in owned_channels.items():
+            self.assertTrue(all(self.workers[0].get_channel_owner(channel) == worker_index
+                                for channel in worker_channels))
+
+    def test_messages_forwarded_between_workers(self):
+        self.link_workers()
+
+        # subscribe on the first worker to a channel the second worker owns,
+        # then send to it from each of the workers...
+        channel = self.get_owned_channel(1)
+        recipient = Recipient(self.io)
+        self.workers[0].interface.add_participant(channel, recipient)
+        self.step()
+
+        for sender, worker in ((100, self.workers[0]), (200, self.workers[1])):
+            worker.message_interface.append_handle([channel], sender, 2004,
+                                                   create_message(self.io, [channel], sender, 2004))
+
+        self.step()
+        self.assertEqual(sorted(recipient.messages), [([channel], 100, 2004, b''), ([channel], 200, 2004, b'')])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+"""
+ * Copyright (C) Caleb Marshall - All Rights Reserved
+ * Written by Caleb Marshall <anythingtechpro@gmail.com>, August 17th, 2017
+ * Licensing information can found in 'LICENSE', which is part of this source code package.
+"""
+
+import importlib
+import os
+import shutil
+import tempfile
+import unittest
+
+from tests import harness
+
+
+class TestReplay(unittest.TestCase):
+
+    def setUp(self):
+        harness.setup(**{'net-backend': 'asyncio'})
+        self.io = importlib.import_module('otp_server.realtime.io')
+        self.types = importlib.import_module('otp_server.realtime.types')
+        self.messagedirector = importlib.import_module('otp_server.realtime.messagedirector')
+        self.replay = importlib.import_module('otp_server.realtime.replay')
+
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'messagedirector.cap')
+
+        self.message_director = self.replay.ReplayMessageDirector()
+        self.message_director.setup()
+
+    def tearDown(self):
+        self.message_director.shutdown()
+        shutil.rmtree(self.directory)
+
+    def write_capture(self, records):
+        capture = self.messagedirector.MessageCapture(self.filename)
+        capture.setup()
+        for connection_id, kind, datagram in records:
+            capture.record(connection_id, kind, datagram.get_message() if datagram is not None else b'')
+
+        capture.shutdown()
+
+    def create_control(self, channel, message_type):
+        datagram = self.io.NetworkDatagram()
+        datagram.add_control_header(channel, message_type)
+        return datagram
+
+    def create_message(self, channel, sender, message_type):
+        datagram = self.io.NetworkDatagram()
+        datagram.add_header(channel, sender, message_type)
+        datagram.add_string('hello')
+        return datagram
+
+    def test_routes_captured_messages(self):
+        messagedirector = self.messagedirector
+        self.write_capture([
+            (1, messagedirector.CAPTURE_CONNECTED, None),
+            (1, messagedirector.CAPTURE_FRAME, self.create_control(2000, self.types.CONTROL_SET_CHANNEL)),
+            (2, messagedirector.CAPTURE_CONNECTED, None),
+            (2, messagedirector.CAPTURE_FRAME, self.create_message(2000, 100, 2004)),
+            (2, messagedirector.CAPTURE_FRAME, self.create_message(3000, 100, 2004)),
+            (2, messagedirector.CAPTURE_DISCONNECTED, None),
+        ])
+
+        frames, _ = self.replay.replay(self.message_director, self.filename, 'max', 1.0)
+        self.assertEqual(frames, 3)
+
+        # the message to a channel nobody registered is parked instead...
+        self.assertEqual(self.message_director.sent_datagrams, 1)
+        self.assertEqual(self.message_director.sent_bytes, self.create_message(2000, 100, 2004).get_length())
+        self.assertEqual(list(self.message_director.message_interface.parked_messages), [3000])
+
+    def test_max_speed_skips_task_manager(self):
+        messagedirector = self.messagedirector
+        records = [
+            (1, messagedirector.CAPTURE_CONNECTED, None),
+            (1, messagedirector.CAPTURE_FRAME, self.create_control(2000, self.types.CONTROL_SET_CHANNEL)),
+            (2, messagedirector.CAPTURE_CONNECTED, None),
+        ]
+
+        records.extend((2, messagedirector.CAPTURE_FRAME, self.create_message(2000, 100, 2004)) for _ in range(100))
+        self.write_capture(records)
+
+        steps = []
+        task_mgr.step = lambda: steps.append(None)
+
+        frames, _ = self.replay.replay(self.message_director, self.filename, 'max', 1.0)
+        self.assertEqual(frames, 101)
+        self.assertEqual(self.message_director.sent_datagrams, 100)
+        self.assertEqual(steps, [])
+
+
+if __name__ == '__main__':
+    unittest.main()